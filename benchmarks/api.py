@@ -0,0 +1,165 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""Throughput and latency of the hot paths of the API.
+
+Drives the Flask app with the backends replaced by the stand-ins of
+:mod:`benchmarks.standins`, after seeding it with ``--instances`` instances,
+and reports the requests per second and the 50th and 99th percentiles of
+the latency of each endpoint::
+
+    python -m benchmarks.api --instances 1000 --requests 2000 --concurrency 8
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+from benchmarks import standins
+
+ENVIRONMENT = {
+    "REDIS_IMAGE": "redisapi/redis",
+    "DOCKER_HOSTS": json.dumps(["http://docker-{}:4243".format(i) for i in range(4)]),
+    "SENTINEL_HOSTS": json.dumps(["http://sentinel-{}:26379".format(i) for i in range(3)]),
+    "REDIS_SERVER_HOST": "localhost",
+    "HEALTH_CHECKER": "fake",
+    "PROVISIONING_WORKERS": "0",
+    "LOG_LEVEL": "WARNING",
+}
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    index = int(math.ceil(fraction * len(values))) - 1
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+class Benchmark(object):
+
+    def __init__(self, app, instances, requests, concurrency):
+        self.app = app
+        self.instances = instances
+        self.requests = requests
+        self.concurrency = concurrency
+        self.names = ["instance-{}".format(i) for i in range(instances)]
+        self.counter = itertools.count()
+
+    def seed(self):
+        from redisapi.storage import Instance, MongoStorage
+        storage = MongoStorage()
+        for index, name in enumerate(self.names):
+            host = "docker-{}".format(index % 4)
+            endpoints = [{"host": host, "port": 49153 + index, "container_id": name}]
+            if index % 2:
+                endpoints.append({"host": "docker-{}".format((index + 1) % 4),
+                                  "port": 49153 + index, "container_id": name + "-slave"})
+            storage.add_instance(Instance(name=name, plan="plus" if index % 2 else "basic",
+                                          endpoints=endpoints))
+
+    def name(self):
+        return self.names[next(self.counter) % len(self.names)]
+
+    def bind_app(self, client):
+        return client.post("/resources/{}/bind-app".format(self.name()),
+                           data={"app-host": "myapp.tsuru.io"})
+
+    def bind(self, client):
+        return client.post("/resources/{}/bind".format(self.name()),
+                           data={"unit-host": "10.10.10.{}".format(next(self.counter) % 250)})
+
+    def status(self, client):
+        return client.get("/resources/{}/status".format(self.name()))
+
+    def add_instance(self, client):
+        return client.post("/resources", data={
+            "name": "new-instance-{}".format(next(self.counter)), "plan": "basic"})
+
+    endpoints = ("bind_app", "bind", "status", "add_instance")
+
+    def measure(self, endpoint):
+        call = getattr(self, endpoint)
+        latencies = []
+        errors = []
+        remaining = itertools.count()
+        lock = threading.Lock()
+
+        def work():
+            client = self.app.test_client()
+            while next(remaining) < self.requests:
+                start = time.time()
+                response = call(client)
+                elapsed = time.time() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+
+        threads = [threading.Thread(target=work) for _ in range(self.concurrency)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        latencies.sort()
+        return {
+            "endpoint": endpoint,
+            "requests": len(latencies),
+            "errors": len(errors),
+            "rps": len(latencies) / elapsed if elapsed else None,
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+        }
+
+    def run(self, endpoints=None):
+        self.seed()
+        return [self.measure(endpoint) for endpoint in endpoints or self.endpoints]
+
+
+def report(results, out=sys.stdout):
+    out.write("{:<14}{:>10}{:>8}{:>12}{:>12}{:>12}\n".format(
+        "endpoint", "requests", "errors", "req/s", "p50 (ms)", "p99 (ms)"))
+    for result in results:
+        out.write("{:<14}{:>10}{:>8}{:>12.1f}{:>12.2f}{:>12.2f}\n".format(
+            result["endpoint"], result["requests"], result["errors"], result["rps"],
+            result["p50"] * 1000, result["p99"] * 1000))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--instances", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoint", action="append", choices=Benchmark.endpoints,
+                        help="endpoint to benchmark, may be repeated (default: all)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    for key, value in ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+    patchers = standins.patch_backends()
+    try:
+        from redisapi.api import app
+        logging.getLogger().setLevel(os.environ["LOG_LEVEL"])
+        benchmark = Benchmark(app, args.instances, args.requests, args.concurrency)
+        results = benchmark.run(args.endpoint)
+    finally:
+        for patcher in patchers:
+            patcher.stop()
+    if args.json:
+        print(json.dumps(results))
+    else:
+        report(results)
+
+
+if __name__ == "__main__":
+    main()
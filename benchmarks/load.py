@@ -0,0 +1,223 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""Provisioning throughput and tail latency against network stand-ins.
+
+Starts ``--docker-hosts`` :class:`benchmarks.servers.DockerServer` on
+loopback addresses (127.0.0.2, 127.0.0.3, ...) and ``--sentinels``
+sentinels, then provisions ``--instances`` instances through the API, from
+``--concurrency`` threads, and optionally removes them::
+
+    python -m benchmarks.load --instances 5000 --plan plus --docker-latency 0.05
+
+MongoDB is the one of ``MONGODB_URI``, using the ``redisapi_load`` database
+unless ``DATABASE_NAME`` is set, or mongomock with ``--mongomock``.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+
+from benchmarks.api import percentile
+from benchmarks.servers import DockerServer, Faults, FakeSentinel, RespHub
+
+
+def raise_file_limit():
+    """Containers and their connections need a lot of file descriptors."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class Backends(object):
+
+    def __init__(self, docker_hosts, sentinels, docker_faults, redis_faults, sentinel_faults):
+        self.hub = RespHub()
+        self.dockers = [DockerServer("127.0.0.{}".format(index + 2), 4243, self.hub,
+                                     docker_faults, redis_faults).serve()
+                        for index in range(docker_hosts)]
+        self.sentinels = [self.hub.listen("127.0.0.1", 0, FakeSentinel(sentinel_faults))
+                          for _ in range(sentinels)]
+
+    def environment(self):
+        return {
+            "DOCKER_HOSTS": json.dumps([docker.url for docker in self.dockers]),
+            "SENTINEL_HOSTS": json.dumps(["http://{}:{}".format(*address)
+                                          for address in self.sentinels]),
+        }
+
+    def stop(self):
+        for docker in self.dockers:
+            docker.shutdown()
+        self.hub.stop()
+
+
+class Phase(object):
+    """Latencies and failures of the requests of a phase of the load test."""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = collections.Counter()
+        self.succeeded = []
+        self.elapsed = None
+
+    def record(self, name, latency, error=None):
+        with self.lock:
+            self.latencies.append(latency)
+            if error:
+                self.errors[error.splitlines()[0][:120]] += 1
+            else:
+                self.succeeded.append(name)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return {
+            "phase": self.name,
+            "requests": len(latencies),
+            "failed": sum(self.errors.values()),
+            "rps": len(latencies) / self.elapsed if self.elapsed else None,
+            "p50": percentile(latencies, 0.5),
+            "p90": percentile(latencies, 0.9),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+            "errors": dict(self.errors.most_common(5)),
+        }
+
+
+class LoadTest(object):
+
+    def __init__(self, app, queue, plan, concurrency):
+        self.app = app
+        self.queue = queue
+        self.plan = plan
+        self.concurrency = concurrency
+        self.run_id = uuid.uuid4().hex[:8]
+
+    def run_phase(self, phase, names, call):
+        names = iter(names)
+        lock = threading.Lock()
+
+        def work():
+            client = self.app.test_client()
+            while True:
+                with lock:
+                    name = next(names, None)
+                if name is None:
+                    return
+                start = time.time()
+                try:
+                    error = call(client, name)
+                except Exception as e:
+                    error = "{}: {}".format(e.__class__.__name__, e)
+                phase.record(name, time.time() - start, error)
+
+        threads = [threading.Thread(target=work) for _ in range(self.concurrency)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        phase.elapsed = time.time() - start
+        return phase
+
+    def provision(self, client, name):
+        response = client.post("/resources", data={"name": name, "plan": self.plan})
+        if response.status_code != 201:
+            return response.data or str(response.status_code)
+        job = self.queue.find(name)
+        if job is not None and job["status"] != "done":
+            return job.get("error") or job["status"]
+
+    def remove(self, client, name):
+        response = client.delete("/resources/{}".format(name))
+        if response.status_code != 200:
+            return response.data or str(response.status_code)
+
+    def run(self, instances, remove=False):
+        names = ["load-{}-{}".format(self.run_id, index) for index in range(instances)]
+        phases = [self.run_phase(Phase("provision"), names, self.provision)]
+        if remove:
+            phases.append(self.run_phase(Phase("remove"), phases[0].succeeded, self.remove))
+        return [phase.summary() for phase in phases]
+
+
+def report(results, out=sys.stdout):
+    out.write("{:<10}{:>10}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}\n".format(
+        "phase", "requests", "failed", "req/s", "p50 (ms)", "p90 (ms)", "p99 (ms)", "max (ms)"))
+    for result in results:
+        if not result["requests"]:
+            continue
+        out.write("{:<10}{:>10}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}\n".format(
+            result["phase"], result["requests"], result["failed"], result["rps"],
+            result["p50"] * 1000, result["p90"] * 1000, result["p99"] * 1000,
+            result["max"] * 1000))
+        for error, count in sorted(result["errors"].items(), key=lambda e: -e[1]):
+            out.write("    {:>6} x {}\n".format(count, error))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--instances", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--plan", choices=("basic", "plus"), default="basic")
+    parser.add_argument("--remove", action="store_true", help="remove the instances afterwards")
+    parser.add_argument("--docker-hosts", type=int, default=4)
+    parser.add_argument("--sentinels", type=int, default=3)
+    for backend in ("docker", "redis", "sentinel"):
+        parser.add_argument("--{}-latency".format(backend), type=float, default=0,
+                            help="mean delay of the {} replies, in seconds".format(backend))
+        parser.add_argument("--{}-failure-rate".format(backend), type=float, default=0,
+                            help="fraction of the {} replies that fail".format(backend))
+    parser.add_argument("--mongomock", action="store_true",
+                        help="use mongomock for MongoDB, only safe with --concurrency 1")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    raise_file_limit()
+    backends = Backends(
+        args.docker_hosts, args.sentinels,
+        Faults(args.docker_latency, args.docker_failure_rate),
+        Faults(args.redis_latency, args.redis_failure_rate),
+        Faults(args.sentinel_latency, args.sentinel_failure_rate))
+    os.environ.update(backends.environment())
+    for key, value in {"REDIS_IMAGE": "redisapi/redis", "HEALTH_CHECKER": "fake",
+                       "PROVISIONING_WORKERS": "0", "LOG_LEVEL": "CRITICAL",
+                       "DATABASE_NAME": "redisapi_load"}.items():
+        os.environ.setdefault(key, value)
+    patchers = []
+    if args.mongomock:
+        import mock
+        from benchmarks.standins import mongo_client
+        client = mongo_client()
+        patchers.append(mock.patch("redisapi.mongodb_client", lambda: client))
+    for patcher in patchers:
+        patcher.start()
+    try:
+        from redisapi.api import app, provisioning
+        logging.getLogger().setLevel(os.environ["LOG_LEVEL"])
+        test = LoadTest(app, provisioning.queue, args.plan, args.concurrency)
+        results = test.run(args.instances, args.remove)
+    finally:
+        from redisapi.docker_clients import clients
+        clients.clear()
+        for patcher in patchers:
+            patcher.stop()
+        backends.stop()
+    if args.json:
+        print(json.dumps(results))
+    else:
+        report(results)
+
+
+if __name__ == "__main__":
+    main()
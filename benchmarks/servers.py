@@ -0,0 +1,411 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""Network stand-ins for Docker hosts, redis servers and sentinels.
+
+Unlike the stand-ins of :mod:`benchmarks.standins`, these are real servers,
+reached by the API through its own clients: :class:`DockerServer` speaks the
+subset of the Docker Remote API used by the managers, and :class:`RespHub`
+serves the redis protocol on any number of ports, for the redis servers of
+the containers and for the sentinels. Every reply can be delayed and can
+fail, to see how provisioning behaves against slow or flaky backends.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import errno
+import json
+import os
+import random
+import re
+import select
+import socket
+import threading
+import time
+import uuid
+
+
+class Faults(object):
+    """Latency and failures injected in the replies of a stand-in.
+
+    Delays follow an exponential distribution of mean ``latency`` seconds,
+    so there is a tail, and a reply fails with probability ``failure_rate``.
+    """
+
+    def __init__(self, latency=0, failure_rate=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def delay(self):
+        if self.latency > 0:
+            time.sleep(random.expovariate(1.0 / self.latency))
+
+    def fails(self):
+        return self.failure_rate > 0 and random.random() < self.failure_rate
+
+
+class RedisProtocolError(Exception):
+    pass
+
+
+def read_command(f):
+    line = f.readline()
+    if not line:
+        return None
+    if not line.startswith("*"):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        header = f.readline()
+        if not header.startswith("$"):
+            raise RedisProtocolError("expected a bulk string, got {!r}".format(header))
+        args.append(f.read(int(header[1:]) + 2)[:-2])
+    return args
+
+
+def encode(reply):
+    if reply is None:
+        return "$-1\r\n"
+    if isinstance(reply, bool):
+        return "+OK\r\n" if reply else "$-1\r\n"
+    if isinstance(reply, Exception):
+        return "-ERR {}\r\n".format(reply)
+    if isinstance(reply, (int, long)):
+        return ":{}\r\n".format(reply)
+    if isinstance(reply, list):
+        return "*{}\r\n{}".format(len(reply), "".join(encode(item) for item in reply))
+    reply = str(reply)
+    return "${}\r\n{}\r\n".format(len(reply), reply)
+
+
+class FakeRedisServer(object):
+    """The state of the redis server of a container."""
+
+    def __init__(self, faults):
+        self.faults = faults
+        self.lock = threading.Lock()
+        self.master = None
+        self.commands = 0
+
+    def info(self):
+        with self.lock:
+            lines = ["# Server", "redis_version:2.8.19", "# Clients", "connected_clients:1",
+                     "# Memory", "used_memory:1048576", "maxmemory:1073741824",
+                     "# Stats", "total_commands_processed:{}".format(self.commands),
+                     "instantaneous_ops_per_sec:0", "keyspace_hits:0",
+                     "keyspace_misses:0", "evicted_keys:0", "# Replication"]
+            if self.master:
+                lines += ["role:slave", "master_host:{}".format(self.master[0]),
+                          "master_port:{}".format(self.master[1]),
+                          "master_link_status:up", "slave_repl_offset:0"]
+            else:
+                lines += ["role:master", "connected_slaves:0", "master_repl_offset:0"]
+        return "\r\n".join(lines) + "\r\n"
+
+    def execute(self, args):
+        command = args[0].upper()
+        with self.lock:
+            self.commands += 1
+        if command == "PING":
+            return "PONG"
+        if command == "INFO":
+            return self.info()
+        if command == "SLAVEOF":
+            with self.lock:
+                if args[1].upper() == "NO" and args[2].upper() == "ONE":
+                    self.master = None
+                else:
+                    self.master = (args[1], args[2])
+            return True
+        if command in ("CLIENT", "SELECT", "AUTH", "CONFIG"):
+            return True
+        return Exception("unknown command '{}'".format(args[0]))
+
+
+class FakeSentinel(object):
+    """The state of a sentinel: the masters it monitors."""
+
+    def __init__(self, faults):
+        self.faults = faults
+        self.lock = threading.Lock()
+        self.masters = {}
+
+    def execute(self, args):
+        command = args[0].upper()
+        if command == "PING":
+            return "PONG"
+        if command != "SENTINEL" or len(args) < 3:
+            return Exception("unknown command '{}'".format(args[0]))
+        subcommand, name = args[1].upper(), args[2]
+        with self.lock:
+            if subcommand == "MONITOR":
+                self.masters[name] = {"host": args[3], "port": args[4]}
+                return True
+            if name not in self.masters:
+                return Exception("No such master with that name")
+            if subcommand == "SET":
+                self.masters[name][args[3]] = args[4]
+                return True
+            if subcommand == "REMOVE":
+                del self.masters[name]
+                return True
+        return Exception("Unknown sentinel subcommand '{}'".format(args[1]))
+
+
+class RespHub(object):
+    """Serves the redis protocol on many ports from a single polling thread.
+
+    Each listening socket is bound to a server object, with an ``execute``
+    method and ``faults``. Accepted connections are served by a thread each.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners = {}
+        self.pending = []
+        self.poller = select.poll()
+        self.wakeup = os.pipe()
+        self.poller.register(self.wakeup[0], select.POLLIN)
+        self.thread = None
+
+    def listen(self, host, port, server):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, int(port)))
+        except socket.error:
+            sock.close()
+            raise
+        sock.listen(128)
+        with self.lock:
+            self.pending.append(("register", sock, server))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.loop)
+                self.thread.daemon = True
+                self.thread.start()
+        os.write(self.wakeup[1], "x")
+        return sock.getsockname()
+
+    def close(self, host, port):
+        with self.lock:
+            self.pending.append(("unregister", (host, int(port)), None))
+        os.write(self.wakeup[1], "x")
+
+    def stop(self):
+        """Close every listener and wait for the polling thread to end."""
+        with self.lock:
+            self.pending.append(("stop", None, None))
+            thread = self.thread
+        os.write(self.wakeup[1], "x")
+        if thread is not None:
+            thread.join()
+
+    def apply(self):
+        """Apply the pending changes, and return whether to keep polling."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for action, target, server in pending:
+            if action == "stop":
+                for sock, _ in self.listeners.values():
+                    sock.close()
+                self.listeners.clear()
+                return False
+            if action == "register":
+                self.listeners[target.fileno()] = (target, server)
+                self.poller.register(target.fileno(), select.POLLIN)
+                continue
+            for fd, (sock, _) in self.listeners.items():
+                if sock.getsockname() == target:
+                    self.poller.unregister(fd)
+                    del self.listeners[fd]
+                    sock.close()
+        return True
+
+    def loop(self):
+        while True:
+            for fd, _ in self.poller.poll():
+                if fd == self.wakeup[0]:
+                    os.read(fd, 4096)
+                    if not self.apply():
+                        return
+                    continue
+                if fd not in self.listeners:
+                    continue
+                sock, server = self.listeners[fd]
+                try:
+                    conn, _ = sock.accept()
+                except socket.error as e:
+                    if e.errno in (errno.EAGAIN, errno.ECONNABORTED):
+                        continue
+                    raise
+                thread = threading.Thread(target=self.serve, args=(conn, server))
+                thread.daemon = True
+                thread.start()
+
+    def serve(self, conn, server):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        f = conn.makefile("rb")
+        try:
+            while True:
+                args = read_command(f)
+                if not args:
+                    break
+                server.faults.delay()
+                if server.faults.fails():
+                    reply = Exception("injected failure")
+                else:
+                    reply = server.execute(args)
+                conn.sendall(encode(reply))
+        except (socket.error, RedisProtocolError):
+            pass
+        finally:
+            f.close()
+            conn.close()
+
+
+class DockerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    routes = [
+        ("GET", r"^/_ping$", "ping"),
+        ("GET", r"^/version$", "version"),
+        ("GET", r"^/info$", "info"),
+        ("POST", r"^/containers/create$", "create"),
+        ("POST", r"^/containers/([^/]+)/start$", "start"),
+        ("POST", r"^/containers/([^/]+)/stop$", "stop"),
+        ("DELETE", r"^/containers/([^/]+)$", "remove"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=None):
+        data = json.dumps(body) if body is not None else ""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else ""
+        path = re.sub(r"^/v[\d.]+", "", self.path.split("?")[0])
+        docker = self.server.docker
+        docker.faults.delay()
+        if docker.faults.fails():
+            return self.reply(500, {"message": "injected failure"})
+        for route_method, pattern, action in self.routes:
+            match = re.match(pattern, path)
+            if route_method == method and match:
+                status, result = getattr(docker, action)(
+                    *match.groups(), body=json.loads(body) if body else None)
+                return self.reply(status, result)
+        self.reply(404, {"message": "page not found"})
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+
+class DockerHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class DockerServer(object):
+    """A Docker host whose containers run a :class:`FakeRedisServer`.
+
+    Listens on ``host``, which should be a loopback address: started
+    containers serve the redis protocol on the host port they are bound to,
+    through ``hub``, with the latency and failures of ``redis_faults``.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, hub=None, faults=None, redis_faults=None):
+        self.host = host
+        self.hub = hub or RespHub()
+        self.faults = faults or Faults()
+        self.redis_faults = redis_faults or Faults()
+        self.lock = threading.Lock()
+        self.containers = {}
+        self.httpd = DockerHTTPServer((host, port), DockerHandler)
+        self.httpd.docker = self
+        self.port = self.httpd.server_address[1]
+        self.url = "http://{}:{}".format(host, self.port)
+
+    def serve(self):
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for container_id in list(self.containers):
+            self.stop(container_id)
+
+    def ping(self, body=None):
+        return 200, "OK"
+
+    def version(self, body=None):
+        return 200, {"Version": "1.7.1", "ApiVersion": "1.19"}
+
+    def info(self, body=None):
+        with self.lock:
+            running = sum(1 for c in self.containers.values() if c["port"] is not None)
+            return 200, {"Containers": len(self.containers), "Running": running}
+
+    def create(self, body=None):
+        container_id = uuid.uuid4().hex
+        with self.lock:
+            self.containers[container_id] = {"config": body, "port": None}
+        return 201, {"Id": container_id, "Warnings": None}
+
+    def start(self, container_id, body=None):
+        with self.lock:
+            container = self.containers.get(container_id)
+            if container is None:
+                return 404, {"message": "no such id: {}".format(container_id)}
+            if container["port"] is not None:
+                return 304, None
+            host_config = (container["config"] or {}).get("HostConfig") or {}
+        bindings = (body or {}).get("PortBindings") or host_config.get("PortBindings") or {}
+        for bound in bindings.values():
+            port = int(bound[0]["HostPort"])
+            try:
+                self.hub.listen(self.host, port, FakeRedisServer(self.redis_faults))
+            except socket.error as e:
+                return 500, {"message": "port {} is already allocated: {}".format(port, e)}
+            with self.lock:
+                container["port"] = port
+        return 204, None
+
+    def stop(self, container_id, body=None):
+        with self.lock:
+            container = self.containers.get(container_id)
+            if container is None:
+                return 404, {"message": "no such id: {}".format(container_id)}
+            port, container["port"] = container["port"], None
+        if port is not None:
+            self.hub.close(self.host, port)
+        return 204, None
+
+    def remove(self, container_id, body=None):
+        with self.lock:
+            container = self.containers.get(container_id)
+            if container is None:
+                return 404, {"message": "no such id: {}".format(container_id)}
+            if container["port"] is not None:
+                return 409, {"message": "container {} is running".format(container_id)}
+            del self.containers[container_id]
+        return 204, None
@@ -0,0 +1,128 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+"""In-memory stand-ins for the backends of the API.
+
+MongoDB is replaced by mongomock, the Docker hosts by :class:`FakeDocker`
+clients, redis and the sentinels by :class:`FakeRedis`, and the ACL API by
+the dumb access manager, so the API can be driven without any of them.
+"""
+
+import itertools
+import threading
+import uuid
+
+import mock
+
+_commands = itertools.count(1)
+
+
+class FakeDocker(object):
+    """A Docker client keeping its containers in memory."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.lock = threading.Lock()
+        self.containers = {}
+
+    def create_container(self, image, command=None, ports=None, environment=None, **kwargs):
+        container_id = uuid.uuid4().hex
+        with self.lock:
+            self.containers[container_id] = {"Image": image, "Running": False,
+                                             "Env": environment or {}}
+        return {"Id": container_id, "Warnings": None}
+
+    def start(self, container_id, **kwargs):
+        with self.lock:
+            self.containers[container_id]["Running"] = True
+
+    def stop(self, container_id, **kwargs):
+        with self.lock:
+            self.containers[container_id]["Running"] = False
+
+    def remove_container(self, container_id, **kwargs):
+        with self.lock:
+            del self.containers[container_id]
+
+    def info(self):
+        with self.lock:
+            return {"Containers": len(self.containers)}
+
+
+class FakeDockerPool(object):
+    """Stands in for :data:`redisapi.docker_clients.clients`."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}
+
+    def get(self, url):
+        with self.lock:
+            if url not in self.clients:
+                self.clients[url] = FakeDocker(url)
+            return self.clients[url]
+
+    def alive(self, urls):
+        return list(urls)
+
+
+class FakePipeline(object):
+
+    def __init__(self):
+        self.commands = []
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+
+    def execute(self):
+        return [True] * len(self.commands)
+
+
+class FakeRedis(object):
+    """A redis server (or sentinel) that accepts every command."""
+
+    def __init__(self, host="localhost", port=6379, **kwargs):
+        self.host = host
+        self.port = port
+
+    def ping(self):
+        return True
+
+    def slaveof(self, host=None, port=None):
+        return True
+
+    def info(self, section=None):
+        return {"role": "master", "connected_slaves": 0, "master_repl_offset": 0,
+                "used_memory": 1024, "maxmemory": 0, "connected_clients": 1,
+                "total_commands_processed": next(_commands), "keyspace_hits": 0,
+                "keyspace_misses": 0, "instantaneous_ops_per_sec": 0,
+                "evicted_keys": 0}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline()
+
+
+def mongo_client(uri="mongodb://localhost/redisapi_benchmark"):
+    try:
+        import mongomock
+    except ImportError:
+        raise Exception("The benchmarks need mongomock, see benchmarks/requirements.txt.")
+    return mongomock.MongoClient(uri)
+
+
+def patch_backends():
+    """Start the patches of all the backends and return them, to be stopped."""
+    from redisapi.acl import DumbAccessManager
+    client = mongo_client()
+    docker = FakeDockerPool()
+    patchers = [
+        mock.patch("redisapi.mongodb_client", lambda: client),
+        mock.patch("redisapi.managers.docker_clients", docker),
+        mock.patch("redisapi.scheduler.docker_clients", docker),
+        mock.patch("redis.StrictRedis", FakeRedis),
+        mock.patch("redisapi.managers.DockerBase.access_manager", DumbAccessManager()),
+    ]
+    for patcher in patchers:
+        patcher.start()
+    return patchers
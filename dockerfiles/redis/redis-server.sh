@@ -1,2 +1,18 @@
 #!/bin/bash
-/usr/bin/redis-server --loglevel warning --maxmemory 1073741824 --port $REDIS_PORT
+args=(--loglevel warning --maxmemory "${REDIS_MAXMEMORY:-1073741824}" --port "$REDIS_PORT")
+if [ -n "$REDIS_MAXMEMORY_POLICY" ]; then
+    args+=(--maxmemory-policy "$REDIS_MAXMEMORY_POLICY")
+fi
+case "$REDIS_PERSISTENCE" in
+    none) args+=(--save "" --appendonly no) ;;
+    rdb) args+=(--appendonly no) ;;
+    aof) args+=(--save "" --appendonly yes) ;;
+esac
+if [ -n "$REDIS_CLUSTER_ANNOUNCE_IP" ]; then
+    args+=(--cluster-enabled yes --cluster-config-file nodes.conf)
+    args+=(--cluster-node-timeout 5000)
+    args+=(--cluster-announce-ip "$REDIS_CLUSTER_ANNOUNCE_IP")
+    args+=(--cluster-announce-port "$REDIS_CLUSTER_ANNOUNCE_PORT")
+    args+=(--cluster-announce-bus-port "$REDIS_CLUSTER_ANNOUNCE_BUS_PORT")
+fi
+exec /usr/bin/redis-server "${args[@]}"
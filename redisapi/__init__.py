@@ -1,17 +1,96 @@
 import os
+import re
+import threading
+import time
 
 
-def mongodb_database():
-    mongodb_uri = os.environ.get(
+_clients = {}
+_clients_lock = threading.Lock()
+_clients_pid = None
+
+_mongodb_options = (
+    ("MONGODB_MAX_POOL_SIZE", "max_pool_size"),
+    ("MONGODB_CONNECT_TIMEOUT_MS", "connectTimeoutMS"),
+    ("MONGODB_SOCKET_TIMEOUT_MS", "socketTimeoutMS"),
+)
+
+
+def mongodb_uri():
+    return os.environ.get(
         "MONGODB_URI", os.environ.get("DBAAS_MONGODB_ENDPOINT", "mongodb://localhost:27017/"))
+
+
+def mongodb_client_options():
+    options = {}
+    for env, option in _mongodb_options:
+        value = os.environ.get(env)
+        if value:
+            options[option] = int(value)
+    return options
+
+
+def mongodb_client():
+    """Return the MongoClient shared by the current process.
+
+    Clients are keyed by URI and options, so each process keeps a single
+    connection pool per configuration. The registry is discarded after a
+    fork (e.g. gunicorn pre-forking its workers), as sockets opened by the
+    parent process must not be shared with its children.
+    """
+    global _clients_pid
+    uri = mongodb_uri()
+    options = mongodb_client_options()
+    key = (uri, tuple(sorted(options.items())))
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        entry = _clients.get(key)
+        if entry is None:
+            from pymongo import MongoClient
+            entry = {
+                "client": MongoClient(uri, **options),
+                "created": time.time(),
+                "checkouts": 0,
+            }
+            _clients[key] = entry
+        entry["checkouts"] += 1
+    return entry["client"]
+
+
+def mongodb_database():
     database_name = os.environ.get("DATABASE_NAME", "redisapi")
 
-    from pymongo import MongoClient
     from pymongo.errors import ConfigurationError
-    client = MongoClient(mongodb_uri)
+    client = mongodb_client()
     try:
         database = client.get_default_database()
         database_name = database.name
     except ConfigurationError:
         pass
     return client[database_name]
+
+
+def mongodb_pool_stats():
+    stats = []
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            return stats
+        for (uri, options), entry in _clients.items():
+            stats.append({
+                "uri": re.sub(r"//[^@/]*@", "//", uri),
+                "options": dict(options),
+                "pid": _clients_pid,
+                "created": entry["created"],
+                "checkouts": entry["checkouts"],
+                "max_pool_size": getattr(entry["client"], "max_pool_size", None),
+            })
+    return stats
+
+
+def close_mongodb_clients():
+    with _clients_lock:
+        if _clients_pid == os.getpid():
+            for entry in _clients.values():
+                entry["client"].close()
+        _clients.clear()
@@ -2,12 +2,94 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 
+import collections
 import os
 import sys
+import threading
+import time
 import traceback
 
 from aclapiclient import aclapiclient, l4_options
 
+from instrumentation import instrumented
+from storage import PermitStore
+from tracing import traced
+
+ADD = "add"
+REMOVE = "remove"
+
+
+class PermitBatch(object):
+
+    def __init__(self):
+        self.permits = collections.OrderedDict()
+        self.done = threading.Event()
+        self.error = None
+
+
+class PermitBatcher(object):
+    """Coalesces the permit changes requested by concurrent binds.
+
+    The first change opens a batch that takes every change requested in the
+    next ``ACL_BATCH_WINDOW`` seconds, and is then sent with a single
+    commit. Only threads of the same process share batches, so the window
+    is 0 by default: with a single thread per process, waiting would only
+    delay the changes. Identical permits, e.g. for units in the same /24 network, are
+    sent once; when a permit is both added and removed, the last change
+    wins. Each caller waits for the commit of its batch.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batch = None
+
+    def window(self):
+        return float(os.environ.get("ACL_BATCH_WINDOW", "0"))
+
+    def submit(self, client, changes):
+        with self.lock:
+            batch = self.batch
+            leader = batch is None
+            if leader:
+                batch = self.batch = PermitBatch()
+            for operation, permit in changes:
+                batch.permits.pop(permit, None)
+                batch.permits[permit] = operation
+        if leader:
+            window = self.window()
+            if window > 0:
+                time.sleep(window)
+            with self.lock:
+                self.batch = None
+            try:
+                self.flush(client, batch)
+            except Exception as e:
+                batch.error = e
+            batch.done.set()
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+
+    @instrumented("acl", "commit")
+    def flush(self, client, batch):
+        for (desc, source, dest, port), operation in batch.permits.items():
+            l4_opts = l4_options.L4Opts(operator="eq", port=port, target="dest")
+            if operation == ADD:
+                call, action = client.add_tcp_permit_access, "add"
+            else:
+                call, action = client.remove_tcp_permit_access, "remove"
+            try:
+                call(desc=desc, source=source, dest=dest, l4_opts=l4_opts)
+            except ValueError:
+                sys.stderr.write("Failed to {} permit access:\n".format(action))
+                traceback.print_exc()
+                sys.stderr.flush()
+        client.commit()
+
+
+permit_batcher = PermitBatcher()
+
 
 class GloboACLAPIManager(object):
 
@@ -16,38 +98,59 @@ class GloboACLAPIManager(object):
         username = os.environ.get("ACL_API_USERNAME")
         password = os.environ.get("ACL_API_PASSWORD")
         self.client = aclapiclient.Client(username, password, endpoint)
+        self.store = PermitStore()
 
-    def grant_access(self, instance, unit_host):
-        source = unit_host[:unit_host.rindex(".")+1] + "0/24"
+    def source(self, unit_host):
+        return unit_host[:unit_host.rindex(".")+1] + "0/24"
+
+    def permits(self, instance, source):
         for endpoint in instance.endpoints:
             desc = 'redis-api instance "{}" access from {} to {}/32'.format(instance.name, source,
                                                                             endpoint["host"])
             dest = endpoint["host"] + "/32"
-            l4_opts = l4_options.L4Opts(operator="eq", port=str(endpoint["port"]), target="dest")
-            try:
-                self.client.add_tcp_permit_access(desc=desc, source=source,
-                                                  dest=dest, l4_opts=l4_opts)
-            except ValueError:
-                sys.stderr.write("Failed to add permit access:\n")
-                traceback.print_exc()
-                sys.stderr.flush()
-        self.client.commit()
+            yield desc, source, dest, str(endpoint["port"])
+
+    def grant_access(self, instance, unit_host):
+        self.grant_access_many(instance, [unit_host])
 
     def revoke_access(self, instance, unit_host):
-        source = unit_host[:unit_host.rindex(".")+1] + "0/24"
-        for endpoint in instance.endpoints:
-            desc = 'redis-api instance "{}" access from {} to {}/32'.format(instance.name, source,
-                                                                            endpoint["host"])
-            dest = endpoint["host"] + "/32"
-            l4_opts = l4_options.L4Opts(operator="eq", port=str(endpoint["port"]), target="dest")
-            try:
-                self.client.remove_tcp_permit_access(desc=desc, source=source,
-                                                     dest=dest, l4_opts=l4_opts)
-            except ValueError:
-                sys.stderr.write("Failed to remove permit access:\n")
-                traceback.print_exc()
-                sys.stderr.flush()
-        self.client.commit()
+        self.revoke_access_many(instance, [unit_host])
+
+    @traced("acl.grant")
+    def grant_access_many(self, instance, unit_hosts):
+        opened = collections.OrderedDict()
+        for unit_host in unit_hosts:
+            source = self.source(unit_host)
+            if source in opened:
+                # Opened by this call: waiting for it would never end.
+                self.store.join(instance.name, source, unit_host)
+                opened[source].append(unit_host)
+            elif self.store.add(instance.name, source, unit_host):
+                opened[source] = [unit_host]
+        if not opened:
+            return
+        try:
+            permit_batcher.submit(self.client, [(ADD, permit) for source in opened
+                                                for permit in self.permits(instance, source)])
+        except Exception:
+            for source, hosts in opened.items():
+                for unit_host in hosts:
+                    self.store.remove(instance.name, source, unit_host)
+            self.store.abandon(instance.name, list(opened))
+            raise
+        self.store.opened(instance.name, list(opened))
+
+    @traced("acl.revoke")
+    def revoke_access_many(self, instance, unit_hosts):
+        closed = []
+        for unit_host in unit_hosts:
+            source = self.source(unit_host)
+            if self.store.remove(instance.name, source, unit_host) and source not in closed:
+                closed.append(source)
+        if not closed:
+            return
+        permit_batcher.submit(self.client, [(REMOVE, permit) for source in closed
+                                            for permit in self.permits(instance, source)])
 
 
 class DumbAccessManager(object):
@@ -68,5 +171,13 @@ class DumbAccessManager(object):
             permits.remove(unit_host)
             self.permits[instance.name] = permits
 
+    def grant_access_many(self, instance, unit_hosts):
+        for unit_host in unit_hosts:
+            self.grant_access(instance, unit_host)
+
+    def revoke_access_many(self, instance, unit_hosts):
+        for unit_host in unit_hosts:
+            self.revoke_access(instance, unit_host)
+
 access_managers = {"globo-acl-api": GloboACLAPIManager,
                    "default": DumbAccessManager}
@@ -8,43 +8,78 @@ import os
 import flask
 
 from flask import request
-from managers import SharedManager, DockerManager, DockerHaManager, FakeManager
-from plans import active as active_plans
-from storage import MongoStorage
+from redisapi import mongodb_pool_stats
+from instrumentation import instrument_app, registry
+from jobs import (JobQueue, JobFailed, JobInProgress, InstanceExists, Workers, PENDING, RUNNING,
+                  FAILED)
+from managers import (SharedManager, DockerManager, DockerHaManager, DenseManager, ClusterManager,
+                      FakeManager, bind_payloads)
+from plans import InvalidPlan, active as active_plans, get as get_plan
+from storage import MongoStorage, ensure_indexes, instance_cache
+from warmpool import warm_pool
 
 
 app = flask.Flask(__name__)
 app.debug = os.environ.get('DEBUG', '0') in ('true', 'True', '1')
+instrument_app(app)
 
 import logging
 import sys
-logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+logging.basicConfig(stream=sys.stdout, level=os.environ.get("LOG_LEVEL", "DEBUG"))
 logger = logging.getLogger()
 
+
+@app.before_first_request
+def bootstrap_storage():
+    ensure_indexes()
+
+
+@app.before_first_request
+def start_warm_pool():
+    warm_pool.start()
+
+
+manager_classes = {
+    'development': SharedManager,
+    'basic': DockerManager,
+    'plus': DockerHaManager,
+    'dense': DenseManager,
+    'cluster': ClusterManager,
+}
+
+
 def manager_by_instance(instance):
-    plans = {
-        'development': SharedManager,
-        'basic': DockerManager,
-        'plus': DockerHaManager,
-    }
-    return plans[instance.plan]()
+    """Return the manager of the instance, with the settings recorded at its creation.
+
+    Instances with no recorded settings use the current ones of their plan.
+    """
+    if instance.settings is None:
+        return manager_by_plan_name(instance.plan)
+    return manager_classes[instance.settings["manager"]](instance.plan, instance.settings)
 
 
 def manager_by_plan_name(plan_name):
-    plans = {
-        'development': SharedManager,
-        'basic': DockerManager,
-        'plus': DockerHaManager,
-    }
-    return plans[plan_name]()
+    return manager_classes[get_plan(plan_name)["manager"]](plan_name)
+
+
+def provision(job, progress):
+    manager = manager_by_plan_name(job["plan"])
+    progress("creating")
+    instance = manager.add_instance(job["name"])
+    progress("saving")
+    MongoStorage().add_instance(instance)
+
+
+provisioning = Workers(JobQueue(), provision)
 
 
 @app.route("/resources/<name>/bind-app", methods=["POST"])
 def bind_app(name):
     storage = MongoStorage()
     instance = storage.find_instance_by_name(name)
-    result = manager_by_instance(instance).bind(instance)
-    return json.dumps(result), 201
+    payload = bind_payloads.get(
+        instance, lambda instance: manager_by_instance(instance).bind(instance))
+    return payload, 201
 
 
 @app.route("/resources/<name>/bind-app", methods=["DELETE"])
@@ -83,16 +118,54 @@ def unbind_unit(name):
     return "", 200
 
 
+@app.route("/resources/<name>/binds", methods=["POST"])
+def bind_units(name):
+    unit_hosts = request.form.getlist('unit-host')
+    if not unit_hosts:
+        return "unit-host is required", 400
+    storage = MongoStorage()
+    instance = storage.find_instance_by_name(name)
+    manager = manager_by_instance(instance)
+    try:
+        manager.grant_many(instance, unit_hosts)
+    except AttributeError:
+        pass
+    return "", 201
+
+
+@app.route("/resources/<name>/binds", methods=["DELETE"])
+def unbind_units(name):
+    unit_hosts = request.form.getlist('unit-host')
+    if not unit_hosts:
+        return "unit-host is required", 400
+    storage = MongoStorage()
+    instance = storage.find_instance_by_name(name)
+    manager = manager_by_instance(instance)
+    try:
+        manager.revoke_many(instance, unit_hosts)
+    except AttributeError:
+        pass
+    return "", 200
+
+
 @app.route("/resources", methods=["POST"])
 def add_instance():
     plan = request.form.get('plan')
     if not plan:
         return "plan is required", 400
-    instance = manager_by_plan_name(plan).add_instance(
-        request.form['name'])
-    from storage import MongoStorage
-    storage = MongoStorage()
-    storage.add_instance(instance)
+    try:
+        manager_by_plan_name(plan)
+    except InvalidPlan as e:
+        return str(e), 400
+    name = request.form['name']
+    if MongoStorage().has_instance(name):
+        return u"The instance {} already exists.".format(name), 409
+    try:
+        provisioning.submit(name, plan)
+    except (JobInProgress, InstanceExists) as e:
+        return str(e), 409
+    except JobFailed as e:
+        return str(e), 500
     return "", 201
 
 
@@ -103,20 +176,55 @@ def remove_instance(name):
     instance = storage.find_instance_by_name(name)
     manager_by_instance(instance).remove_instance(instance)
     storage.remove_instance(instance)
+    bind_payloads.invalidate(name)
+    provisioning.queue.remove(name)
     return "", 200
 
 
 @app.route("/resources/<name>/status", methods=["GET"])
 def status(name):
+    job = provisioning.queue.find(name)
+    if job and job["status"] in (PENDING, RUNNING):
+        provisioning.start()
+        return job["step"], 202
+    if job and job["status"] == FAILED:
+        return job["error"], 500
     from storage import MongoStorage
     storage = MongoStorage()
     instance = storage.find_instance_by_name(name)
-    ok, msg = manager_by_instance(instance).is_ok()
+    ok, msg = manager_by_instance(instance).is_ok(instance)
     if ok:
         return msg, 204
     return msg, 500
 
 
+@app.route("/resources/<name>/metrics", methods=["GET"])
+def metrics(name):
+    storage = MongoStorage()
+    instance = storage.find_instance_by_name(name)
+    if instance is None:
+        return u"Instance {} not found.".format(name), 404
+    collect = getattr(manager_by_instance(instance), "metrics", None)
+    if collect is None:
+        return "metrics are not available for this plan", 404
+    return json.dumps(collect(instance)), 200
+
+
 @app.route("/resources/plans", methods=["GET"])
 def plans():
     return json.dumps(active_plans()), 200
+
+
+@app.route("/stats/mongodb", methods=["GET"])
+def mongodb_stats():
+    return json.dumps(mongodb_pool_stats()), 200
+
+
+@app.route("/stats/instances", methods=["GET"])
+def instances_stats():
+    return json.dumps(instance_cache.stats()), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
@@ -0,0 +1,113 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+import re
+import threading
+import time
+
+import docker
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from instrumentation import observe
+
+
+def operation(method, url):
+    """Name a Docker API call after its method and path, without ids."""
+    path = re.sub(r"^\w+://[^/]+(/v[\d.]+)?", "", url).split("?")[0]
+    path = re.sub(r"/(containers|images)/(?!create$|json$)[^/]+", r"/\1/<id>", path)
+    return "{} {}".format(method, path)
+
+
+class PooledClient(docker.Client):
+    """A docker.Client that reports the health of its host to the pool."""
+
+    def __init__(self, pool, url, timeout, maxsize):
+        super(PooledClient, self).__init__(base_url=url, timeout=timeout)
+        self.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=maxsize))
+        self.pool = pool
+        self.url = url
+
+    def request(self, method, url, *args, **kwargs):
+        try:
+            with observe("docker", operation(method, url)):
+                response = super(PooledClient, self).request(method, url, *args, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            self.pool.mark_failed(self.url)
+            raise
+        self.pool.mark_alive(self.url)
+        return response
+
+
+class DockerClientPool(object):
+    """Keeps one long-lived Docker client per host URL.
+
+    Clients keep their HTTP connections alive between requests and are
+    shared by all the threads of the process. A host that fails to answer is
+    evicted from the pool and considered down for ``DOCKER_HOST_COOLDOWN``
+    seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.down = {}
+        self.pid = None
+
+    def settings(self):
+        return {
+            "timeout": int(os.environ.get("DOCKER_TIMEOUT", "60")),
+            "maxsize": int(os.environ.get("DOCKER_POOL_MAXSIZE", "10")),
+        }
+
+    def reset(self):
+        if self.pid != os.getpid():
+            self.clients.clear()
+            self.down.clear()
+            self.pid = os.getpid()
+
+    def get(self, url):
+        with self.lock:
+            self.reset()
+            client = self.clients.get(url)
+            if client is None:
+                client = PooledClient(self, url, **self.settings())
+                self.clients[url] = client
+            return client
+
+    def mark_failed(self, url):
+        cooldown = float(os.environ.get("DOCKER_HOST_COOLDOWN", "30"))
+        with self.lock:
+            self.reset()
+            client = self.clients.pop(url, None)
+            if client is not None:
+                client.close()
+            self.down[url] = time.time() + cooldown
+
+    def mark_alive(self, url):
+        with self.lock:
+            self.reset()
+            self.down.pop(url, None)
+
+    def is_alive(self, url):
+        with self.lock:
+            self.reset()
+            return self.down.get(url, 0) <= time.time()
+
+    def alive(self, urls):
+        """Filter out the hosts that are down, unless all of them are."""
+        alive = [url for url in urls if self.is_alive(url)]
+        return alive or list(urls)
+
+    def clear(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
+            self.down.clear()
+
+
+clients = DockerClientPool()
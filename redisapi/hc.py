@@ -3,10 +3,49 @@
 # license that can be found in the LICENSE file.
 
 import os
+import threading
+import time
 
+from instrumentation import instrumented
+from tracing import traced
 from utils import get_value
 from redisapi import mongodb_database
 
+import logging
+logger = logging.getLogger()
+
+PENDING = "pending"
+REGISTERING = "registering"
+REGISTERED = "registered"
+REMOVING = "removing"
+DELETING = "deleting"
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_sessions_pid = None
+
+
+def zabbix_session(url, user, password):
+    """Return the logged in ZabbixAPI shared by the current process."""
+    global _sessions_pid
+    key = (url, user, password)
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        zapi = _sessions.get(key)
+        if zapi is None:
+            from pyzabbix import ZabbixAPI
+            zapi = ZabbixAPI(url)
+            zapi.login(user, password)
+            _sessions[key] = zapi
+    return zapi
+
+
+def close_zabbix_sessions():
+    with _sessions_lock:
+        _sessions.clear()
+
 
 class FakeHealthCheck(object):
     added = False
@@ -19,55 +58,221 @@ class FakeHealthCheck(object):
         self.removed = True
 
 
+class NativeHealthCheck(object):
+    """Endpoints checked by the redisapi prober, see :mod:`redisapi.prober`."""
+
+    def __init__(self):
+        self.checks = self.mongo()['healthchecks']
+
+    def mongo(self):
+        return mongodb_database()
+
+    @traced("hc.add")
+    def add(self, host, port):
+        self.checks.update(
+            {"_id": "{}:{}".format(host, port)},
+            {"$set": {"host": host, "port": port},
+             "$setOnInsert": {"status": "unknown", "failures": 0, "next": 0}},
+            upsert=True,
+        )
+
+    @traced("hc.remove")
+    def remove(self, host, port):
+        self.checks.remove({"_id": "{}:{}".format(host, port)})
+
+    def status(self, host, port):
+        return self.checks.find_one({"_id": "{}:{}".format(host, port)})
+
+
 class ZabbixHealthCheck(object):
+    """Zabbix items and triggers checking the redis endpoints.
+
+    Endpoints are recorded in the ``zabbix`` collection by :meth:`add` and
+    :meth:`remove`, and registered in or deleted from Zabbix later, by
+    :meth:`flush`, with one API call per kind of object for up to
+    ``ZABBIX_BATCH_SIZE`` endpoints.
+    """
+
     def __init__(self):
         url = get_value("ZABBIX_URL")
-        user = get_value("ZABBIX_USER")
-        password = get_value("ZABBIX_PASSWORD")
+        self.user = get_value("ZABBIX_USER")
+        self.password = get_value("ZABBIX_PASSWORD")
         self.host_id = get_value("ZABBIX_HOST")
         self.host_name = os.environ.get("ZABBIX_HOST_NAME", "Zabbix Server")
         self.interface_id = get_value("ZABBIX_INTERFACE")
-        from pyzabbix import ZabbixAPI
-        self.zapi = ZabbixAPI(url)
-        self.zapi.login(user, password)
+        self.zapi = zabbix_session(url, self.user, self.password)
 
         self.items = self.mongo()['zabbix']
 
     def mongo(self):
         return mongodb_database()
 
+    def batch_size(self):
+        return int(os.environ.get("ZABBIX_BATCH_SIZE", "100"))
+
+    def timeout(self):
+        return float(os.environ.get("ZABBIX_CLAIM_TIMEOUT", "300"))
+
+    def call(self, method, *args):
+        from pyzabbix import ZabbixAPIException
+        try:
+            return method(*args)
+        except ZabbixAPIException as e:
+            if "re-login" not in str(e) and "Not authorised" not in str(e):
+                raise
+            self.zapi.login(self.user, self.password)
+            return method(*args)
+
+    def item_key(self, host, port):
+        return "net.tcp.service[tcp,{},{}]".format(host, port)
+
+    @traced("hc.add")
     def add(self, host, port):
-        item_key = "net.tcp.service[tcp,{},{}]".format(host, port)
-        item_result = self.zapi.item.create(
-            name="redis healthcheck for {}:{}".format(host, port),
-            key_=item_key,
-            delay=60,
-            hostid=self.host_id,
-            interfaceid=self.interface_id,
-            type=3,
-            value_type=3,
-        )
-        trigger_result = self.zapi.trigger.create(
-            description="trigger hc for redis {}:{}".format(host, port),
-            expression="{{{}:{}.last()}}=0".format(self.host_name, item_key),
-            priority=5,
-        )
-        item = {
-            'host': host,
-            'port': port,
-            'item': item_result['itemids'][0],
-            'trigger': trigger_result['triggerids'][0],
-        }
-        self.items.insert(item)
+        self.items.insert({"host": host, "port": port, "status": PENDING,
+                           "updated": time.time()})
+        registrations.notify(self)
 
+    @traced("hc.remove")
     def remove(self, host, port):
-        item = self.items.find_one({"host": host, "port": port})
-        self.zapi.trigger.delete(item["trigger"])
-        self.zapi.item.delete(item["item"])
-        self.items.remove({"host": host, "port": port})
+        self.items.update({"host": host, "port": port},
+                          {"$set": {"status": REMOVING, "updated": time.time()}},
+                          multi=True)
+        registrations.notify(self)
+
+    def claim(self, status, claimed_status):
+        now = time.time()
+        query = {"$or": [
+            {"status": status},
+            {"status": claimed_status, "updated": {"$lt": now - self.timeout()}},
+        ]}
+        claimed = []
+        while len(claimed) < self.batch_size():
+            item = self.items.find_and_modify(
+                query, {"$set": {"status": claimed_status, "updated": now}}, new=True)
+            if item is None:
+                break
+            claimed.append(item)
+        return claimed
+
+    def release(self, items, status):
+        self.items.update({"_id": {"$in": [item["_id"] for item in items]}},
+                          {"$set": {"status": status}}, multi=True)
+
+    def flush(self):
+        """Register the pending endpoints and delete the removed ones.
+
+        Returns the number of endpoints handled, which is only lower than the
+        batch size when nothing is left to do.
+        """
+        pending = self.claim(PENDING, REGISTERING)
+        if pending:
+            try:
+                self.register(pending)
+            except Exception:
+                self.release(pending, PENDING)
+                raise
+        removed = self.claim(REMOVING, DELETING)
+        if removed:
+            try:
+                self.unregister(removed)
+            except Exception:
+                self.release(removed, REMOVING)
+                raise
+        return max(len(pending), len(removed))
+
+    @instrumented("zabbix")
+    def register(self, items):
+        item_result = self.call(self.zapi.item.create, *[{
+            "name": "redis healthcheck for {}:{}".format(item["host"], item["port"]),
+            "key_": self.item_key(item["host"], item["port"]),
+            "delay": 60,
+            "hostid": self.host_id,
+            "interfaceid": self.interface_id,
+            "type": 3,
+            "value_type": 3,
+        } for item in items])
+        trigger_result = self.call(self.zapi.trigger.create, *[{
+            "description": "trigger hc for redis {}:{}".format(item["host"], item["port"]),
+            "expression": "{{{}:{}.last()}}=0".format(
+                self.host_name, self.item_key(item["host"], item["port"])),
+            "priority": 5,
+        } for item in items])
+        orphans = []
+        for item, item_id, trigger_id in zip(items, item_result["itemids"],
+                                             trigger_result["triggerids"]):
+            ids = {"item": item_id, "trigger": trigger_id}
+            result = self.items.update({"_id": item["_id"], "status": REGISTERING},
+                                       {"$set": dict(ids, status=REGISTERED)})
+            if not result["n"]:
+                # Removed while it was being registered.
+                result = self.items.update({"_id": item["_id"]}, {"$set": ids})
+            if not result["n"]:
+                orphans.append(ids)
+        if orphans:
+            self.delete(orphans)
+
+    @instrumented("zabbix")
+    def unregister(self, items):
+        self.delete(items)
+        self.items.remove({"_id": {"$in": [item["_id"] for item in items]}})
+
+    def delete(self, items):
+        trigger_ids = [item["trigger"] for item in items if item.get("trigger")]
+        item_ids = [item["item"] for item in items if item.get("item")]
+        if trigger_ids:
+            self.call(self.zapi.trigger.delete, *trigger_ids)
+        if item_ids:
+            self.call(self.zapi.item.delete, *item_ids)
+
+
+class Registrations(object):
+    """Flushes the Zabbix health checks from a thread of each process.
+
+    The thread wakes up ``ZABBIX_BATCH_WINDOW`` seconds after an endpoint is
+    added or removed, so the changes of that window are sent together, and
+    every ``ZABBIX_POLL_INTERVAL`` seconds to pick up changes left by other
+    processes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.checker = None
+        self.pid = None
+
+    def window(self):
+        return float(os.environ.get("ZABBIX_BATCH_WINDOW", "1"))
+
+    def interval(self):
+        return float(os.environ.get("ZABBIX_POLL_INTERVAL", "30"))
+
+    def notify(self, checker):
+        with self.lock:
+            self.checker = checker
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                thread = threading.Thread(target=self.work)
+                thread.daemon = True
+                thread.start()
+        self.wakeup.set()
+
+    def work(self):
+        while True:
+            self.wakeup.wait(self.interval())
+            time.sleep(self.window())
+            self.wakeup.clear()
+            try:
+                while self.checker.flush() >= self.checker.batch_size():
+                    pass
+            except Exception:
+                logger.exception("could not flush the zabbix health checks")
+
+
+registrations = Registrations()
 
 
 health_checkers = {
     'fake': FakeHealthCheck,
     'zabbix': ZabbixHealthCheck,
+    'native': NativeHealthCheck,
 }
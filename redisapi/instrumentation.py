@@ -0,0 +1,206 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import contextlib
+import functools
+import threading
+import time
+
+import flask
+
+import tracing
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(
+        name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs) + "}"
+
+
+class Metric(object):
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help),
+                 "# TYPE {} {}".format(self.name, self.kind)]
+        with self.lock:
+            for values, value in sorted(self.values.items()):
+                lines.extend(self.samples(values, value))
+        return lines
+
+    def samples(self, values, value):
+        return ["{}{} {}".format(self.name, format_labels(self.labels, values), value)]
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, values=(), amount=1):
+        with self.lock:
+            self.values[values] = self.values.get(values, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, values=(), amount=1):
+        with self.lock:
+            self.values[values] = self.values.get(values, 0) + amount
+
+    def dec(self, values=(), amount=1):
+        self.inc(values, -amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, values, amount):
+        with self.lock:
+            value = self.values.get(values)
+            if value is None:
+                value = self.values[values] = {
+                    "buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            for index, bound in enumerate(self.buckets):
+                if amount <= bound:
+                    value["buckets"][index] += 1
+            value["count"] += 1
+            value["sum"] += amount
+
+    def samples(self, values, value):
+        lines = []
+        for bound, count in zip(self.buckets, value["buckets"]):
+            lines.append("{}_bucket{} {}".format(
+                self.name, format_labels(self.labels, values, [("le", bound)]), count))
+        lines.append("{}_bucket{} {}".format(
+            self.name, format_labels(self.labels, values, [("le", "+Inf")]), value["count"]))
+        labels = format_labels(self.labels, values)
+        lines.append("{}_count{} {}".format(self.name, labels, value["count"]))
+        lines.append("{}_sum{} {}".format(self.name, labels, value["sum"]))
+        return lines
+
+
+class Registry(object):
+    """The metrics of the current process, in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+http_duration = registry.register(Histogram(
+    "redisapi_http_request_duration_seconds", "Time spent serving API requests.",
+    ("method", "route", "status")))
+http_in_flight = registry.register(Gauge(
+    "redisapi_http_requests_in_flight", "API requests being served."))
+http_errors = registry.register(Counter(
+    "redisapi_http_request_errors_total", "API requests that failed with a server error.",
+    ("method", "route")))
+backend_duration = registry.register(Histogram(
+    "redisapi_backend_duration_seconds", "Time spent in calls to the backends.",
+    ("backend", "operation")))
+backend_in_flight = registry.register(Gauge(
+    "redisapi_backend_calls_in_flight", "Backend calls in progress.", ("backend",)))
+backend_errors = registry.register(Counter(
+    "redisapi_backend_errors_total", "Backend calls that raised an error.",
+    ("backend", "operation")))
+
+
+@contextlib.contextmanager
+def observe(backend, operation):
+    """Record the duration and failure of a call to a backend.
+
+    The call is also traced, as a span named ``backend.operation``.
+    """
+    backend_in_flight.inc((backend,))
+    start = time.time()
+    try:
+        with tracing.span("{}.{}".format(backend, operation), backend=backend):
+            yield
+    except Exception:
+        backend_errors.inc((backend, operation))
+        raise
+    finally:
+        backend_duration.observe((backend, operation), time.time() - start)
+        backend_in_flight.dec((backend,))
+
+
+def instrumented(backend, operation=None):
+    """Decorate a function so its calls are observed as ``operation``."""
+    def decorator(func):
+        name = operation or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with observe(backend, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_app(app):
+    """Record the duration, status and failures of the requests of app."""
+
+    @app.before_request
+    def start_request():
+        flask.g.request_start = time.time()
+        flask.g.request_span = tracing.start_span(
+            "{} {}".format(flask.request.method, flask.request.path))
+        http_in_flight.inc()
+
+    @app.after_request
+    def record_status(response):
+        flask.g.request_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request(exc):
+        start = getattr(flask.g, "request_start", None)
+        if start is None:
+            return
+        request = flask.request
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        status = getattr(flask.g, "request_status", 500) if exc is None else 500
+        http_duration.observe((request.method, route, status), time.time() - start)
+        span = flask.g.request_span
+        span.set("route", route)
+        span.set("status", status)
+        tracing.finish_span(span, exc)
+        http_in_flight.dec()
+        if status >= 500:
+            http_errors.inc((request.method, route))
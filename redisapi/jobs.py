@@ -0,0 +1,177 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+import threading
+import time
+
+import tracing
+
+from redisapi import mongodb_database
+
+import logging
+logger = logging.getLogger()
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobInProgress(Exception):
+    pass
+
+
+class InstanceExists(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    pass
+
+
+class JobQueue(object):
+    """Provisioning jobs, stored in the ``jobs`` collection.
+
+    There is one job per instance name, which is only replaced once it
+    failed: the job of a provisioned instance is kept until the instance is
+    removed. Jobs are claimed with an atomic
+    find-and-modify, so the queue can be shared by all the API processes.
+    A job left running for more than ``PROVISIONING_JOB_TIMEOUT`` seconds,
+    e.g. by a worker that was killed, is handed out again.
+    """
+
+    def db(self):
+        return mongodb_database()
+
+    def timeout(self):
+        return float(os.environ.get("PROVISIONING_JOB_TIMEOUT", "600"))
+
+    def enqueue(self, name, plan):
+        from pymongo.errors import DuplicateKeyError
+        now = time.time()
+        job = {
+            "_id": name,
+            "name": name,
+            "plan": plan,
+            "status": PENDING,
+            "step": "queued",
+            "error": None,
+            "created": now,
+            "updated": now,
+        }
+        try:
+            self.db().jobs.update({"_id": name, "status": FAILED}, job, upsert=True)
+        except DuplicateKeyError:
+            current = self.find(name)
+            if current is not None and current["status"] == DONE:
+                raise InstanceExists(u"The instance {} already exists.".format(name))
+            msg = u"The instance {} is already being provisioned.".format(name)
+            raise JobInProgress(msg)
+        return job
+
+    def claim(self):
+        now = time.time()
+        return self.db().jobs.find_and_modify(
+            {"$or": [
+                {"status": PENDING},
+                {"status": RUNNING, "updated": {"$lt": now - self.timeout()}},
+            ]},
+            {"$set": {"status": RUNNING, "step": "started", "updated": now}},
+            sort=[("created", 1)],
+            new=True,
+        )
+
+    def update(self, name, **fields):
+        fields["updated"] = time.time()
+        self.db().jobs.update({"_id": name}, {"$set": fields})
+
+    def progress(self, name, step):
+        self.update(name, step=step)
+
+    def finish(self, name):
+        self.update(name, status=DONE, step="done")
+
+    def fail(self, name, error):
+        self.update(name, status=FAILED, error=error)
+
+    def find(self, name):
+        return self.db().jobs.find_one({"_id": name})
+
+    def remove(self, name):
+        self.db().jobs.remove({"_id": name})
+
+
+class Workers(object):
+    """Threads running the jobs of a queue in the current process.
+
+    ``PROVISIONING_WORKERS`` threads are started by each process, the first
+    time :meth:`start` is called after it is forked. Idle workers look for
+    jobs enqueued by other processes every ``PROVISIONING_POLL_INTERVAL``
+    seconds, and right away for jobs enqueued by their own process. With no
+    workers, jobs are run as soon as they are enqueued, and
+    :meth:`submit` raises JobFailed when they fail.
+    """
+
+    def __init__(self, queue, handler):
+        self.queue = queue
+        self.handler = handler
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.threads = []
+        self.pid = None
+
+    def size(self):
+        return int(os.environ.get("PROVISIONING_WORKERS", "4"))
+
+    def interval(self):
+        return float(os.environ.get("PROVISIONING_POLL_INTERVAL", "5"))
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.threads = []
+            for _ in range(self.size()):
+                thread = threading.Thread(target=self.work)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, name, plan):
+        job = self.queue.enqueue(name, plan)
+        if self.size() > 0:
+            self.start()
+            self.wakeup.set()
+        else:
+            error = self.run(job)
+            if error is not None:
+                raise JobFailed(error)
+        return job
+
+    def work(self):
+        while True:
+            try:
+                job = self.queue.claim()
+            except Exception:
+                logger.exception("could not claim a provisioning job")
+                job = None
+            if job is None:
+                self.wakeup.wait(self.interval())
+                self.wakeup.clear()
+                continue
+            self.run(job)
+
+    def run(self, job):
+        """Run the job and return its error, if it failed."""
+        name = job["name"]
+        try:
+            with tracing.span("provision", instance=name, plan=job.get("plan")):
+                self.handler(job, lambda step: self.queue.progress(name, step))
+        except Exception as e:
+            logger.exception("provisioning of {} failed".format(name))
+            self.queue.fail(name, str(e))
+            return str(e)
+        self.queue.finish(name)
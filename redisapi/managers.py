@@ -2,62 +2,69 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 
+import binascii
+import collections
+import itertools
 import os
 import json
 import redis
-import docker
-import random
+import socket
+import threading
 import time
 
+from docker.utils import create_host_config
 from urlparse import urlparse
 
-# from acl import access_managers
+from acl import access_managers
+from docker_clients import clients as docker_clients
 from hc import health_checkers
-from utils import get_value
-from storage import Instance, MongoStorage
+from plans import get as get_plan
+from ports import PortAllocator
+from scheduler import CONTAINER_MEMORY, Scheduler, host_load
+from sentinels import Sentinels
+from status import metrics_collector, status_checker
+from utils import get_json_value, get_value, parallel
+from warmpool import warm_pool
+from storage import Instance
+from tenants import TenantSlots
+from tracing import span, traced
 
 import logging
 logger = logging.getLogger()
 
 class DockerBase(object):
 
-    def __init__(self):
+    plan_name = 'basic'
+
+    def __init__(self, plan=None, settings=None):
+        self.plan = settings or get_plan(plan or self.plan_name)
         self.image_name = get_value("REDIS_IMAGE")
-        docker_hosts = get_value("DOCKER_HOSTS")
-        sentinel_hosts = get_value("SENTINEL_HOSTS")
-        self.sentinel_hosts = json.loads(sentinel_hosts)
-        self.docker_hosts = json.loads(docker_hosts)
+        self.sentinel_hosts = get_json_value("SENTINEL_HOSTS")
+        self.docker_hosts = get_json_value("DOCKER_HOSTS")
         self.port_range_start = 49153
+        self.port_allocator = PortAllocator(default_range=(self.port_range_start, 65535))
 
     def get_port_by_host(self, host):
-        storage = MongoStorage()
-        instances = storage.find_instances_by_host(host)
-        if instances:
-            ports = []
-            for instance in instances:
-                for endpoint in instance.endpoints:
-                    ports.append(int(endpoint["port"]))
-            return max(ports) + 1
-        return self.port_range_start
+        return self.port_allocator.reserve(host)
 
-    def config_sentinels(self, master_name, master):
-        for sentinel in self.sentinel_hosts:
-            host, port = sentinel.replace("http://", "").split(":")
-            r = redis.StrictRedis(host=str(host), port=str(port))
-            commands = [
-                ["monitor", master_name, master["host"], master["port"], '1'],
-                ["set", master_name, "down-after-milliseconds", "5000"],
-                ["set", master_name, "failover-timeout", "60000"],
-                ["set", master_name, "parallel-syncs", "1"],
-            ]
-            for command in commands:
-                r.sentinel(*command)
+    def release_port(self, host, port):
+        self.port_allocator.release(host, port)
 
+    def sentinels(self):
+        return Sentinels(self.sentinel_hosts)
+
+    @traced("manager.config_sentinels")
+    def config_sentinels(self, master_name, master):
+        return self.sentinels().execute([
+            ["monitor", master_name, master["host"], master["port"], '1'],
+            ["set", master_name, "down-after-milliseconds", "5000"],
+            ["set", master_name, "failover-timeout", "60000"],
+            ["set", master_name, "parallel-syncs", "1"],
+        ])
+
+    @traced("manager.remove_from_sentinel")
     def remove_from_sentinel(self, master_name):
-        for sentinel in self.sentinel_hosts:
-            host, port = sentinel.replace("http://", "").split(":")
-            r = redis.StrictRedis(host=str(host), port=str(port))
-            r.sentinel('remove', master_name)
+        return self.sentinels().execute([["remove", master_name]])
 
     def health_checker(self):
         hc_name = os.environ.get("HEALTH_CHECKER", "fake")
@@ -70,7 +77,10 @@ class DockerBase(object):
         return "http://{}:4243".format(hostname)
 
     def client(self, host):
-        return docker.Client(base_url=host)
+        return docker_clients.get(host)
+
+    def scheduler(self):
+        return Scheduler(self.docker_hosts)
 
     def bind(self, instance):
         redis_hosts = []
@@ -94,6 +104,12 @@ class DockerBase(object):
     def revoke(self, instance, host):
         self.access_manager.revoke_access(instance, host)
 
+    def grant_many(self, instance, hosts):
+        self.access_manager.grant_access_many(instance, hosts)
+
+    def revoke_many(self, instance, hosts):
+        self.access_manager.revoke_access_many(instance, hosts)
+
     @property
     def access_manager(self):
         if not hasattr(self, "_manager"):
@@ -103,62 +119,116 @@ class DockerBase(object):
             self._manager = access_managers.get(manager_name)()
         return self._manager
 
-    def is_ok(self):
-        pass
-
+    def memory(self):
+        """Memory reserved on the Docker host for each container of the plan."""
+        return self.plan.get("memory") or CONTAINER_MEMORY
+
+    def memory_limit(self):
+        """Memory limit of the containers, leaving room above the maxmemory of
+        redis for its own overhead and for the fork of its background saves.
+        """
+        if not self.plan.get("memory"):
+            return None
+        overhead = float(os.environ.get("CONTAINER_MEMORY_OVERHEAD", "0.5"))
+        return int(self.plan["memory"] * (1 + overhead))
+
+    def redis_environment(self, port):
+        environment = {"REDIS_PORT": port}
+        settings = (("memory", "REDIS_MAXMEMORY"),
+                    ("maxmemory_policy", "REDIS_MAXMEMORY_POLICY"),
+                    ("persistence", "REDIS_PERSISTENCE"))
+        for key, name in settings:
+            if self.plan.get(key) is not None:
+                environment[name] = self.plan[key]
+        return environment
+
+    def create_redis_container(self, client, environment, port_bindings):
+        output = client.create_container(
+            self.image_name,
+            command="",
+            ports=sorted(port_bindings),
+            environment=environment,
+            cpu_shares=self.plan.get("cpu_shares"),
+            host_config=create_host_config(port_bindings=port_bindings,
+                                           mem_limit=self.memory_limit()),
+        )
+        client.start(output["Id"])
+        return output["Id"]
 
-class DockerHaManager(DockerBase):
+    def run_redis_container(self, client, port):
+        return self.create_redis_container(
+            client, self.redis_environment(port), {port: ('0.0.0.0', port)})
 
-    def start_redis_container(self, name, host, slave_of=None):
+    @traced("manager.start_redis_container")
+    def start_redis_container(self, host):
         client = self.client(host)
         host = self.extract_hostname(client.base_url)
         port = self.get_port_by_host(host)
-        output = client.create_container(
-            self.image_name,
-            command="",
-            ports=[port],
-            environment={"REDIS_PORT": port},
+        container_id = self.run_redis_container(client, port)
+        host_load.add(host, self.memory())
+        return {"host": host, "port": port, "container_id": container_id,
+                "memory": self.memory()}
+
+    def is_ok(self, instance):
+        return status_checker.check_instance(instance)
+
+    def metrics(self, instance):
+        return metrics_collector.collect(instance)
+
+
+class DockerHaManager(DockerBase):
+
+    plan_name = 'plus'
+
+    @traced("manager.start_master")
+    def start_master(self, name, host):
+        endpoint = self.start_redis_container(host)
+        parallel(
+            lambda: self.health_checker().add(endpoint["host"], endpoint["port"]),
+            lambda: self.config_sentinels(name, endpoint),
         )
-        client.start(output["Id"], port_bindings={port: ('0.0.0.0', port)})
-        self.health_checker().add(host, port)
-        endpoint = {"host": host, "port": port, "container_id": output["Id"]}
-        if slave_of:
-            self.slave_of(slave_of, endpoint)
-        else:
-            self.config_sentinels(name, endpoint)
+        return endpoint
+
+    @traced("manager.start_slave")
+    def start_slave(self, host):
+        endpoint = self.start_redis_container(host)
+        self.health_checker().add(endpoint["host"], endpoint["port"])
         return endpoint
 
     def slave_of(self, master, slave):
         r = redis.StrictRedis(host=str(slave["host"]), port=str(slave["port"]))
         max_try = 3
-        while max_try > 0:
-            try:
-                r.slaveof(master["host"], master["port"])
-                break
-            except redis.ConnectionError:
-                time.sleep(1)
-                max_try -= 1
-
+        with span("manager.slave_of") as s:
+            while max_try > 0:
+                s.set("attempts", 4 - max_try)
+                try:
+                    r.slaveof(master["host"], master["port"])
+                    break
+                except redis.ConnectionError:
+                    time.sleep(1)
+                    max_try -= 1
+
+    @traced("manager.add_instance")
     def add_instance(self, instance_name):
-        hosts = self.docker_hosts[:]
-        random.shuffle(hosts)
-        endpoints = []
+        hosts = self.scheduler().choose(1 + self.plan.get("replicas", 1), self.memory())
 
-        host = hosts.pop()
-        endpoint = self.start_redis_container(instance_name, host)
-        endpoints.append(endpoint)
-
-        host = hosts.pop()
-        endpoint = self.start_redis_container(
-            instance_name, host, slave_of=endpoint)
-        endpoints.append(endpoint)
+        # The master and the slaves are started on their hosts at the same
+        # time; only SLAVEOF needs to wait for them.
+        endpoints = parallel(
+            lambda: self.start_master(instance_name, hosts[0]),
+            *[lambda host=host: self.start_slave(host) for host in hosts[1:]]
+        )
+        for slave in endpoints[1:]:
+            self.slave_of(endpoints[0], slave)
 
         return Instance(
             name=instance_name,
-            plan='plus',
+            plan=self.plan["name"],
+            settings=self.plan,
             endpoints=endpoints,
         )
 
+    @traced("manager.remove_instance")
     def remove_instance(self, instance):
         for endpoint in instance.endpoints:
             self.health_checker().remove(endpoint["host"], endpoint["port"])
@@ -166,6 +236,8 @@ class DockerHaManager(DockerBase):
             client = self.client(url)
             client.stop(endpoint["container_id"])
             client.remove_container(endpoint["container_id"])
+            self.release_port(endpoint["host"], endpoint["port"])
+            host_load.remove(endpoint["host"], endpoint.get("memory", CONTAINER_MEMORY))
 
         self.remove_from_sentinel(instance.name)
 
@@ -174,31 +246,28 @@ class DockerManager(DockerBase):
 
     def client(self, host=None):
         if not host:
-            host = random.choice(self.docker_hosts)
+            host = self.scheduler().choose()[0]
         return super(DockerManager, self).client(host)
 
+    @traced("manager.add_instance")
     def add_instance(self, instance_name):
-        client = self.client()
-        host = self.extract_hostname(client.base_url)
-        port = self.get_port_by_host(host)
+        hosts = self.scheduler().rank(self.memory())
+        # Pooled containers are already counted in the load of their host.
+        endpoint = warm_pool.take(hosts, self.plan["name"])
+        if endpoint is None:
+            endpoint = self.start_redis_container(hosts[0])
+        else:
+            endpoint["memory"] = self.memory()
         logger.info("host={0} port={1}".format(
-            host, port)
-        )
-        output = client.create_container(
-            self.image_name,
-            command="",
-            ports=[port],
-            environment={"REDIS_PORT": port},
+            endpoint["host"], endpoint["port"])
         )
-
-        client.start(output["Id"], port_bindings={port: ('0.0.0.0', port)})
-        endpoint = {"host": host, "port": port, "container_id": output["Id"]}
         instance = Instance(
             name=instance_name,
-            plan='basic',
+            plan=self.plan["name"],
+            settings=self.plan,
             endpoints=[endpoint],
         )
-        self.health_checker().add(host, port)
+        self.health_checker().add(endpoint["host"], endpoint["port"])
         self.config_sentinels(instance_name, endpoint)
         return instance
 
@@ -210,6 +279,7 @@ class DockerManager(DockerBase):
         })
         return envs
 
+    @traced("manager.remove_instance")
     def remove_instance(self, instance):
         endpoint = instance.endpoints[0]
         self.health_checker().remove(endpoint["host"], endpoint["port"])
@@ -217,9 +287,186 @@ class DockerManager(DockerBase):
         client = self.client(url)
         client.stop(endpoint["container_id"])
         client.remove_container(endpoint["container_id"])
+        self.release_port(endpoint["host"], endpoint["port"])
+        host_load.remove(endpoint["host"], endpoint.get("memory", CONTAINER_MEMORY))
         self.remove_from_sentinel(instance.name)
 
 
+class ClusterNotReady(Exception):
+    pass
+
+
+class ClusterManager(DockerBase):
+    """Shards each instance across the masters of a redis cluster.
+
+    An instance has ``CLUSTER_MASTERS`` masters, each one followed by
+    ``CLUSTER_REPLICAS`` replicas on other Docker hosts, and the 16384 hash
+    slots are split evenly among the masters. Redis listens on 6379 and
+    16379, its cluster bus, inside the containers, and announces the ports
+    reserved on the Docker host, which needs redis 4 or later in the image.
+    """
+
+    plan_name = 'cluster'
+    hash_slots = 16384
+
+    def __init__(self, plan=None, settings=None):
+        super(ClusterManager, self).__init__(plan, settings)
+        self.masters = int(self.plan.get("masters", os.environ.get("CLUSTER_MASTERS", "3")))
+        self.replicas = int(self.plan.get("replicas", os.environ.get("CLUSTER_REPLICAS", "1")))
+
+    def timeout(self):
+        return float(os.environ.get("CLUSTER_TIMEOUT", "60"))
+
+    def address(self, host):
+        return socket.gethostbyname(host)
+
+    def node(self, endpoint):
+        return redis.StrictRedis(host=str(endpoint["host"]), port=int(endpoint["port"]))
+
+    def run_cluster_container(self, client, host, port, bus_port):
+        environment = self.redis_environment(6379)
+        environment.update({
+            "REDIS_CLUSTER_ANNOUNCE_IP": self.address(host),
+            "REDIS_CLUSTER_ANNOUNCE_PORT": port,
+            "REDIS_CLUSTER_ANNOUNCE_BUS_PORT": bus_port,
+        })
+        return self.create_redis_container(
+            client, environment, {6379: ('0.0.0.0', port), 16379: ('0.0.0.0', bus_port)})
+
+    @traced("manager.start_node")
+    def start_node(self, url):
+        client = self.client(url)
+        host = self.extract_hostname(client.base_url)
+        port = self.get_port_by_host(host)
+        bus_port = self.get_port_by_host(host)
+        try:
+            container_id = self.run_cluster_container(client, host, port, bus_port)
+        except Exception:
+            self.release_port(host, port)
+            self.release_port(host, bus_port)
+            raise
+        host_load.add(host, self.memory())
+        self.health_checker().add(host, port)
+        return {"host": host, "port": port, "bus_port": bus_port, "container_id": container_id,
+                "memory": self.memory()}
+
+    def remove_node(self, endpoint):
+        self.health_checker().remove(endpoint["host"], endpoint["port"])
+        client = self.client(self.docker_url_from_hostname(endpoint["host"]))
+        client.stop(endpoint["container_id"])
+        client.remove_container(endpoint["container_id"])
+        self.release_port(endpoint["host"], endpoint["port"])
+        self.release_port(endpoint["host"], endpoint["bus_port"])
+        host_load.remove(endpoint["host"], endpoint.get("memory", CONTAINER_MEMORY))
+
+    def wait(self, call, errors=(redis.ConnectionError, redis.BusyLoadingError)):
+        """Call ``call`` until it does not raise one of ``errors``, for
+        ``CLUSTER_TIMEOUT`` seconds at most."""
+        deadline = time.time() + self.timeout()
+        while True:
+            try:
+                return call()
+            except errors:
+                if time.time() >= deadline:
+                    raise
+                time.sleep(0.5)
+
+    def cluster_info(self, client):
+        info = client.execute_command("CLUSTER", "INFO")
+        return dict(line.split(":", 1) for line in info.splitlines() if ":" in line)
+
+    def check_state(self, client):
+        state = self.cluster_info(client).get("cluster_state")
+        if state != "ok":
+            raise ClusterNotReady(u"cluster state is {}".format(state))
+
+    @traced("manager.create_cluster")
+    def create_cluster(self, endpoints):
+        """Join the nodes, assign the hash slots and attach the replicas.
+
+        ``endpoints`` are the masters, each one followed by its replicas.
+        """
+        nodes = [self.node(endpoint) for endpoint in endpoints]
+        ids = parallel(*[lambda node=node: self.wait(
+            lambda: node.execute_command("CLUSTER", "MYID")) for node in nodes])
+        for endpoint in endpoints[1:]:
+            nodes[0].execute_command("CLUSTER", "MEET", self.address(endpoint["host"]),
+                                     endpoint["port"], endpoint["bus_port"])
+        size = self.replicas + 1
+        for index, node in enumerate(nodes[::size]):
+            first = index * self.hash_slots // self.masters
+            last = (index + 1) * self.hash_slots // self.masters
+            node.execute_command("CLUSTER", "ADDSLOTS", *range(first, last))
+        # A replica only accepts its master once the master is known to it
+        # through the cluster bus.
+        parallel(*[lambda node=node, master=ids[index - index % size]: self.wait(
+            lambda: node.execute_command("CLUSTER", "REPLICATE", master),
+            (redis.ConnectionError, redis.ResponseError))
+            for index, node in enumerate(nodes) if index % size])
+        parallel(*[lambda node=node: self.wait(
+            lambda: self.check_state(node), (redis.ConnectionError, ClusterNotReady))
+            for node in nodes])
+
+    @traced("manager.add_instance")
+    def add_instance(self, instance_name):
+        placement = self.scheduler().spread(self.masters, self.replicas + 1, self.memory())
+
+        def start(url):
+            try:
+                return self.start_node(url)
+            except Exception as e:
+                return e
+
+        started = parallel(*[lambda url=url: start(url)
+                             for url in itertools.chain(*placement)])
+        endpoints = [endpoint for endpoint in started if isinstance(endpoint, dict)]
+        try:
+            errors = [error for error in started if isinstance(error, Exception)]
+            if errors:
+                raise errors[0]
+            self.create_cluster(endpoints)
+        except Exception:
+            parallel(*[lambda endpoint=endpoint: self.remove_node(endpoint)
+                       for endpoint in endpoints])
+            raise
+        return Instance(
+            name=instance_name,
+            plan=self.plan["name"],
+            settings=self.plan,
+            endpoints=endpoints,
+        )
+
+    def bind(self, instance):
+        nodes = ["{}:{}".format(endpoint["host"], endpoint["port"])
+                 for endpoint in instance.endpoints]
+        return {
+            "REDIS_CLUSTER_NODES": json.dumps(nodes),
+            "REDIS_HOST": instance.endpoints[0]["host"],
+            "REDIS_PORT": str(instance.endpoints[0]["port"]),
+        }
+
+    @traced("manager.remove_instance")
+    def remove_instance(self, instance):
+        parallel(*[lambda endpoint=endpoint: self.remove_node(endpoint)
+                   for endpoint in instance.endpoints])
+
+    def is_ok(self, instance):
+        ok, msg = status_checker.check_instance(instance)
+        if not ok:
+            return ok, msg
+
+        def check():
+            try:
+                endpoint = instance.endpoints[0]
+                client = status_checker.client(endpoint["host"], endpoint["port"])
+                state = self.cluster_info(client).get("cluster_state")
+            except redis.RedisError as e:
+                return False, str(e)
+            return state == "ok", "cluster is {}".format(state)
+        cluster_ok, cluster_msg = status_checker.cached(("cluster", instance.name), check)
+        return cluster_ok, "{}; {}".format(cluster_msg, msg)
+
+
 class FakeManager(object):
     instance_added = False
     binded = False
@@ -241,12 +488,14 @@ class FakeManager(object):
     def remove_instance(self, instance):
         self.removed = True
 
-    def is_ok(self):
+    def is_ok(self, instance=None):
         return self.ok, self.msg
 
 
 class SharedManager(object):
-    def __init__(self):
+    def __init__(self, plan='development', settings=None):
+        self.plan = plan
+        self.settings = settings or get_plan(plan)
         self.server = get_value("REDIS_SERVER_HOST")
 
     def add_instance(self, instance_name):
@@ -254,7 +503,8 @@ class SharedManager(object):
         port = os.environ.get("REDIS_SERVER_PORT", "6379")
         return Instance(
             name=instance_name,
-            plan='development',
+            plan=self.plan,
+            settings=self.settings,
             endpoints=[{"host": host, "port": port}],
         )
 
@@ -271,21 +521,232 @@ class SharedManager(object):
     def remove_instance(self, instance):
         pass
 
-    def is_ok(self):
+    def is_ok(self, instance=None):
         passwd = os.environ.get("REDIS_SERVER_PASSWORD")
-        kw = {"host": self.server}
-        if passwd:
-            kw["password"] = passwd
+        port = os.environ.get("REDIS_SERVER_PORT", "6379")
+        return status_checker.ping(self.server, port, passwd)
+
+    def metrics(self, instance):
+        passwd = os.environ.get("REDIS_SERVER_PASSWORD")
+        return metrics_collector.collect(instance, passwd)
+
+
+class TenantUserExists(Exception):
+    pass
+
+
+class SharedPassword(Exception):
+    pass
+
+
+class DenseManager(object):
+    """Packs many small instances into a pool of shared redis servers.
+
+    The servers are listed by ``DENSE_REDIS_SERVERS`` (``host:port``) and
+    administered with ``DENSE_REDIS_PASSWORD``. With the ``db`` isolation,
+    the default, every instance gets a database number of its own, out of
+    the ``DENSE_DATABASES`` of each server (database 0 is never handed
+    out). Databases keep apart the keys of well-behaved tenants only, so
+    the ``db`` isolation refuses servers with a password rather than handing
+    it out. With the ``acl`` isolation, which needs redis 6, every instance
+    gets a user of its own, named ``tenant:<name>`` so it never clashes
+    with the users of the server, restricted to the keys starting with the
+    name of the instance and to database 0, and each server takes up to
+    ``DENSE_TENANTS_PER_SERVER`` instances.
+    """
+
+    user_prefix = "tenant:"
+
+    def __init__(self, plan='dense', settings=None):
+        self.plan = plan
+        self.settings = settings or get_plan(plan)
+        self.servers = get_json_value("DENSE_REDIS_SERVERS")
+        self.password = os.environ.get("DENSE_REDIS_PASSWORD")
+        self.isolation = os.environ.get("DENSE_ISOLATION", "db")
+
+    def slots(self):
+        if self.isolation == "acl":
+            return TenantSlots(
+                self.servers, 0, int(os.environ.get("DENSE_TENANTS_PER_SERVER", "1000")) - 1)
+        return TenantSlots(self.servers, 1, int(os.environ.get("DENSE_DATABASES", "16")) - 1)
+
+    def client(self, endpoint, db=0):
+        timeout = float(os.environ.get("STATUS_TIMEOUT", "2"))
+        return redis.StrictRedis(host=endpoint["host"], port=int(endpoint["port"]), db=db,
+                                 password=self.password, socket_timeout=timeout,
+                                 socket_connect_timeout=timeout)
+
+    @traced("manager.add_instance")
+    def add_instance(self, instance_name):
+        if self.isolation != "acl" and self.password:
+            raise SharedPassword(
+                u"The db isolation would hand out DENSE_REDIS_PASSWORD, use the acl one.")
+        slots = self.slots()
+        server, slot = slots.reserve()
+        host, port = server.rsplit(":", 1)
+        endpoint = {"host": host, "port": port, "slot": slot}
         try:
-            conn = redis.Connection(**kw)
-            conn.connect()
-        except Exception as e:
-            return False, str(e)
-        return True, ""
+            if self.isolation == "acl":
+                password = binascii.hexlify(os.urandom(16))
+                user = self.user_prefix + instance_name
+                prefix = instance_name + ":"
+                client = self.client(endpoint)
+                if client.execute_command("ACL", "GETUSER", user) is not None:
+                    raise TenantUserExists(
+                        u"User {} already exists on {}.".format(user, server))
+                client.execute_command(
+                    "ACL", "SETUSER", user, "reset", "on", ">" + password,
+                    "~" + prefix + "*", "+@all", "-@admin", "-@dangerous", "-select")
+                endpoint.update({"user": user, "password": password, "prefix": prefix})
+            else:
+                endpoint["db"] = slot
+        except Exception:
+            slots.release(server, slot)
+            raise
+        return Instance(
+            name=instance_name,
+            plan=self.plan,
+            settings=self.settings,
+            endpoints=[endpoint],
+        )
+
+    def bind(self, instance):
+        endpoint = instance.endpoints[0]
+        envs = {
+            "REDIS_HOST": endpoint["host"],
+            "REDIS_PORT": str(endpoint["port"]),
+        }
+        if "user" in endpoint:
+            envs.update({
+                "REDIS_USER": endpoint["user"],
+                "REDIS_PASSWORD": endpoint["password"],
+                "REDIS_KEY_PREFIX": endpoint["prefix"],
+            })
+        else:
+            envs["REDIS_DB"] = str(endpoint["db"])
+        return envs
+
+    def unbind(self):
+        pass
+
+    def tenant_keys(self, client, endpoint):
+        """Iterate over the keys of the instance."""
+        if "user" not in endpoint:
+            return client.scan_iter(count=1000)
+        return client.scan_iter(match=endpoint["prefix"] + "*", count=1000)
+
+    @traced("manager.remove_instance")
+    def remove_instance(self, instance):
+        endpoint = instance.endpoints[0]
+        if "user" in endpoint:
+            client = self.client(endpoint)
+            client.execute_command("ACL", "DELUSER", endpoint["user"])
+            keys = []
+            for key in self.tenant_keys(client, endpoint):
+                keys.append(key)
+                if len(keys) == 1000:
+                    client.delete(*keys)
+                    keys = []
+            if keys:
+                client.delete(*keys)
+        else:
+            self.client(endpoint, endpoint["db"]).flushdb()
+        self.slots().release("{}:{}".format(endpoint["host"], endpoint["port"]),
+                             endpoint["slot"])
+
+    def is_ok(self, instance):
+        endpoint = instance.endpoints[0]
+        return status_checker.ping(endpoint["host"], endpoint["port"], self.password)
+
+    def metrics(self, instance):
+        """Usage of the instance, with its memory estimated from a sample of its keys.
+
+        Samples have up to ``DENSE_METRICS_SAMPLE`` keys, and at most ten times
+        as many keys are counted for an ACL user.
+        """
+        endpoint = instance.endpoints[0]
+        sample_size = int(os.environ.get("DENSE_METRICS_SAMPLE", "100"))
+        admin = status_checker.client(endpoint["host"], endpoint["port"], self.password)
+        info = admin.info()
+        clients = admin.client_list()
+        if "user" in endpoint:
+            client = admin
+            keys, sample = 0, []
+            for key in self.tenant_keys(client, endpoint):
+                keys += 1
+                if len(sample) < sample_size:
+                    sample.append(key)
+                if keys >= sample_size * 10:
+                    break
+            connected = [c for c in clients if c.get("user") == endpoint["user"]]
+        else:
+            client = self.client(endpoint, endpoint["db"])
+            keys = info.get("db{}".format(endpoint["db"]), {}).get("keys", 0)
+            sample = list(itertools.islice(self.tenant_keys(client, endpoint), sample_size))
+            connected = [c for c in clients if c.get("db") == str(endpoint["db"])]
+        used = [client.execute_command("MEMORY", "USAGE", key) or 0 for key in sample]
+        return {
+            "name": instance.name,
+            "plan": instance.plan,
+            "endpoints": [{
+                "host": endpoint["host"],
+                "port": endpoint["port"],
+                "keys": keys,
+                "used_memory": sum(used) * keys // len(used) if used else 0,
+                "connected_clients": len(connected),
+                "server_ops_per_sec": info.get("instantaneous_ops_per_sec"),
+                "server_used_memory": info.get("used_memory"),
+            }],
+        }
+
+
+class BindPayloads(object):
+    """Serialized bind responses of the instances bound lately.
+
+    A payload is kept along with the endpoints it was built from, and built
+    again once any of their fields change, e.g. after a failover or when a
+    dense instance is created again in another database. At most
+    ``INSTANCE_CACHE_SIZE`` payloads are kept by each process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = collections.OrderedDict()
+
+    def size(self):
+        return int(os.environ.get("INSTANCE_CACHE_SIZE", "1000"))
+
+    def key(self, instance):
+        return (instance.plan, json.dumps(instance.endpoints, sort_keys=True))
+
+    def get(self, instance, bind):
+        key = self.key(instance)
+        with self.lock:
+            entry = self.items.pop(instance.name, None)
+            if entry is not None and entry[0] == key:
+                self.items[instance.name] = entry
+                return entry[1]
+        payload = json.dumps(bind(instance))
+        size = self.size()
+        if size > 0:
+            with self.lock:
+                self.items[instance.name] = (key, payload)
+                while len(self.items) > size:
+                    self.items.popitem(last=False)
+        return payload
+
+    def invalidate(self, name):
+        with self.lock:
+            self.items.pop(name, None)
+
+
+bind_payloads = BindPayloads()
 
 
 managers = {
     'shared': SharedManager,
     'fake': FakeManager,
     'docker': DockerManager,
+    'dense': DenseManager,
+    'cluster': ClusterManager,
 }
@@ -5,22 +5,83 @@
 import json
 import os
 
+GB = 1024 ** 3
 
+# Besides its name and description, a plan may define:
+#
+# * manager: the plan whose manager provisions its instances, defaults to
+#   the name of the plan;
+# * memory: the maxmemory of each redis, in bytes, also reserved on the
+#   Docker hosts and used to size the memory limit of the containers;
+# * cpu_shares: the relative CPU weight of the containers;
+# * maxmemory_policy: what redis evicts once it reaches maxmemory;
+# * persistence: ``none``, ``rdb`` or ``aof``;
+# * replicas: the replicas of each master;
+# * masters: the masters of a ``cluster`` instance.
+#
+# Settings left out fall back to the defaults of Docker and redis.
 plans = [
     {"name": "development", "description": "Is a shared instance."},
     {"name": "basic",
-     "description": "1 dedicated instance. With 1GB of memory."},
+     "description": "1 dedicated instance. With 1GB of memory.",
+     "memory": GB},
     {"name": "plus",
      "description": ("2 dedicated instances. With 1GB of memory, "
-                     "HA and failover support via redis-sentinel.")},
+                     "HA and failover support via redis-sentinel."),
+     "memory": GB, "replicas": 1},
+    {"name": "dense",
+     "description": ("A database or user of its own on a shared instance, "
+                     "for small workloads.")},
+    {"name": "cluster",
+     "description": ("Redis cluster, sharded across dedicated masters with "
+                     "replicas on other hosts. With 1GB of memory per node."),
+     "memory": GB},
 ]
 
+persistence_modes = ("none", "rdb", "aof")
+
+
+class InvalidPlan(Exception):
+    pass
+
+
+def validate(plan):
+    if "name" not in plan or "description" not in plan:
+        raise InvalidPlan(u"Plans must have a name and a description: {}".format(plan))
+    manager = plan.get("manager", plan["name"])
+    if manager not in [builtin["name"] for builtin in plans]:
+        raise InvalidPlan(u"Unknown manager {} of the plan {}.".format(manager, plan["name"]))
+    persistence = plan.get("persistence")
+    if persistence is not None and persistence not in persistence_modes:
+        raise InvalidPlan(u"Unknown persistence {} of the plan {}.".format(
+            persistence, plan["name"]))
+    return plan
+
+
+def available():
+    """Return the built-in plans followed by the ones of ``REDIS_API_CUSTOM_PLANS``.
+
+    Custom plans named after a built-in plan take its place.
+    """
+    custom = [validate(plan) for plan in json.loads(
+        os.environ.get("REDIS_API_CUSTOM_PLANS", "[]"))]
+    replaced = dict((plan["name"], plan) for plan in custom)
+    result = [replaced.pop(plan["name"], plan) for plan in plans]
+    return result + [plan for plan in custom if plan["name"] in replaced]
+
+
+def get(name):
+    for plan in available():
+        if plan["name"] == name:
+            return dict(plan, manager=plan.get("manager", name))
+    raise InvalidPlan(u"Unknown plan {}.".format(name))
+
 
 def active():
     plans_environ = os.environ.get("REDIS_API_PLANS", "[]")
     active_plans_name = json.loads(plans_environ)
     active_plans = []
-    for plan in plans:
+    for plan in available():
         if plan["name"] in active_plans_name:
-            active_plans.append(plan)
+            active_plans.append({"name": plan["name"], "description": plan["description"]})
     return active_plans
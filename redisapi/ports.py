@@ -0,0 +1,73 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import json
+import os
+
+from instrumentation import instrumented
+from redisapi import mongodb_database
+from storage import MongoStorage
+
+
+class NoPortAvailable(Exception):
+    pass
+
+
+class PortAllocator(object):
+    """Reserves host ports for redis containers.
+
+    Every Docker host has a document in the ``ports`` collection holding the
+    next never used port and the ports released by removed instances, so a
+    reservation is an atomic find-and-modify no matter how many instances
+    the host runs. Released ports are handed out again before new ones.
+    """
+
+    def __init__(self, default_range=(49153, 65535)):
+        self.default_range = tuple(default_range)
+        ranges = os.environ.get("DOCKER_PORT_RANGES", "{}")
+        self.ranges = dict((host, tuple(r)) for host, r in json.loads(ranges).items())
+
+    def db(self):
+        return mongodb_database()
+
+    def port_range(self, host):
+        return self.ranges.get(host, self.default_range)
+
+    @instrumented("mongo", "reserve_port")
+    def reserve(self, host):
+        ports = self.db().ports
+        start, end = self.port_range(host)
+        result = ports.find_and_modify(
+            {"_id": host, "free.0": {"$exists": True}},
+            {"$pop": {"free": -1}},
+        )
+        if result:
+            return result["free"][0]
+        result = ports.find_and_modify(
+            {"_id": host, "next": {"$lte": end}},
+            {"$inc": {"next": 1}},
+        )
+        if result:
+            return result["next"]
+        if ports.find_one({"_id": host}) is None:
+            self.seed(host)
+            return self.reserve(host)
+        msg = u"No port available on {} in the range {}-{}.".format(host, start, end)
+        raise NoPortAvailable(msg)
+
+    def seed(self, host):
+        from pymongo.errors import DuplicateKeyError
+        start, end = self.port_range(host)
+        used = [int(endpoint["port"])
+                for instance in MongoStorage().find_instances_by_host(host)
+                for endpoint in instance.endpoints if endpoint["host"] == host]
+        next_port = max(used + [start - 1]) + 1
+        try:
+            self.db().ports.insert({"_id": host, "next": next_port, "free": []})
+        except DuplicateKeyError:
+            pass
+
+    @instrumented("mongo", "release_port")
+    def release(self, host, port):
+        self.db().ports.update({"_id": host}, {"$addToSet": {"free": int(port)}})
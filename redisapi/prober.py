@@ -0,0 +1,138 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import logging
+import os
+import random
+import time
+
+from multiprocessing.pool import ThreadPool
+
+import redis
+
+from redisapi import mongodb_database
+
+logger = logging.getLogger()
+
+OK = "ok"
+FAILING = "failing"
+
+
+class Prober(object):
+    """Checks the redis endpoints of the ``healthchecks`` collection.
+
+    Meant to run in its own process (``python -m redisapi.prober``). Due
+    endpoints are sent a PING by ``PROBER_WORKERS`` threads, reusing one
+    connection pool per endpoint, each check bounded by ``PROBER_TIMEOUT``
+    seconds. Healthy endpoints are checked every ``PROBER_INTERVAL`` seconds
+    and failing ones every ``PROBER_FAILING_INTERVAL`` seconds; once an
+    endpoint recovers its interval doubles back to the healthy one. Every
+    interval is jittered by 10% so checks do not happen in bursts. The
+    pools of endpoints no longer checked are dropped every
+    ``PROBER_INTERVAL`` seconds.
+    """
+
+    def __init__(self):
+        self.workers = int(os.environ.get("PROBER_WORKERS", "32"))
+        self.interval = float(os.environ.get("PROBER_INTERVAL", "10"))
+        self.failing_interval = float(os.environ.get("PROBER_FAILING_INTERVAL", "2"))
+        self.timeout = float(os.environ.get("PROBER_TIMEOUT", "1"))
+        self.batch_size = int(os.environ.get("PROBER_BATCH_SIZE", "1000"))
+        self.pools = {}
+        self.pool = None
+        self.pruned = None
+
+    def db(self):
+        return mongodb_database()
+
+    def connection_pool(self, host, port):
+        key = (host, int(port))
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = redis.ConnectionPool(host=host, port=int(port),
+                                        socket_timeout=self.timeout,
+                                        socket_connect_timeout=self.timeout,
+                                        max_connections=2)
+            self.pools[key] = pool
+        return pool
+
+    def prune(self):
+        """Disconnect and drop the pools of endpoints no longer in ``healthchecks``."""
+        checked = set((item["host"], int(item["port"])) for item in
+                      self.db().healthchecks.find({}, {"host": True, "port": True}))
+        for key in list(self.pools):
+            if key not in checked:
+                self.pools.pop(key).disconnect()
+
+    def check(self, endpoint):
+        pool = self.connection_pool(endpoint["host"], endpoint["port"])
+        try:
+            redis.StrictRedis(connection_pool=pool).ping()
+        except redis.RedisError as e:
+            pool.disconnect()
+            return str(e)
+        return None
+
+    def next_interval(self, endpoint, error):
+        if error is not None:
+            return self.failing_interval
+        previous = endpoint.get("interval") or self.interval
+        return min(previous * 2, self.interval)
+
+    def record(self, endpoint, error, now):
+        interval = self.next_interval(endpoint, error)
+        status = OK if error is None else FAILING
+        fields = {
+            "status": status,
+            "error": error,
+            "checked": now,
+            "interval": interval,
+            "next": now + interval * random.uniform(0.9, 1.1),
+            "failures": endpoint.get("failures", 0) + 1 if error else 0,
+        }
+        if status != endpoint.get("status"):
+            fields["since"] = now
+            if error:
+                logger.warning("{}:{} is failing: {}".format(
+                    endpoint["host"], endpoint["port"], error))
+        self.db().healthchecks.update({"_id": endpoint["_id"]}, {"$set": fields})
+
+    def due(self, now):
+        return list(self.db().healthchecks.find(
+            {"next": {"$lte": now}}).sort("next", 1).limit(self.batch_size))
+
+    def run_once(self):
+        """Check the due endpoints and return how many of them were checked."""
+        now = time.time()
+        if self.pruned is None or now - self.pruned >= self.interval:
+            self.prune()
+            self.pruned = now
+        endpoints = self.due(now)
+        if not endpoints:
+            return 0
+        if self.pool is None:
+            self.pool = ThreadPool(self.workers)
+        errors = self.pool.map(self.check, endpoints)
+        for endpoint, error in zip(endpoints, errors):
+            self.record(endpoint, error, now)
+        return len(endpoints)
+
+    def run(self):
+        while True:
+            try:
+                checked = self.run_once()
+            except Exception:
+                logger.exception("could not check the redis endpoints")
+                checked = 0
+            if checked < self.batch_size:
+                time.sleep(min(self.failing_interval, 1))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    Prober().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import itertools
+import os
+import random
+import threading
+import time
+
+from urlparse import urlparse
+
+from docker_clients import clients as docker_clients
+from storage import MongoStorage
+
+# Memory of the containers of plans that do not define one. Matches the
+# default --maxmemory of dockerfiles/redis/redis-server.sh.
+CONTAINER_MEMORY = 1073741824
+
+
+class NoHostAvailable(Exception):
+    pass
+
+
+class HostLoad(object):
+    """Number of containers and memory reserved on each Docker host.
+
+    The load is read from the instances collection at most once every
+    ``SCHEDULER_CACHE_TTL`` seconds and kept up to date in between by the
+    managers, as they add and remove containers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.loaded_at = None
+        self.pid = None
+
+    def refresh(self):
+        self.hosts = MongoStorage().load_by_host(CONTAINER_MEMORY)
+        self.loaded_at = time.time()
+        self.pid = os.getpid()
+
+    def get(self):
+        ttl = float(os.environ.get("SCHEDULER_CACHE_TTL", "30"))
+        with self.lock:
+            if (self.pid != os.getpid() or self.loaded_at is None or
+                    time.time() - self.loaded_at > ttl):
+                self.refresh()
+            return dict((hostname, dict(load)) for hostname, load in self.hosts.items())
+
+    def add(self, hostname, memory=CONTAINER_MEMORY):
+        self.update(hostname, 1, memory)
+
+    def remove(self, hostname, memory=CONTAINER_MEMORY):
+        self.update(hostname, -1, -memory)
+
+    def update(self, hostname, containers, memory):
+        with self.lock:
+            load = self.hosts.setdefault(hostname, {"containers": 0, "memory": 0})
+            load["containers"] = max(load["containers"] + containers, 0)
+            load["memory"] = max(load["memory"] + memory, 0)
+
+    def clear(self):
+        with self.lock:
+            self.hosts = {}
+            self.loaded_at = None
+
+
+host_load = HostLoad()
+
+
+def random_strategy(hosts, loads):
+    hosts = hosts[:]
+    random.shuffle(hosts)
+    return hosts
+
+
+def least_loaded_strategy(hosts, loads):
+    return sorted(random_strategy(hosts, loads), key=lambda host: loads[host]["memory"])
+
+
+def bin_packing_strategy(hosts, loads):
+    return sorted(random_strategy(hosts, loads), key=lambda host: -loads[host]["memory"])
+
+
+strategies = {
+    "random": random_strategy,
+    "least-loaded": least_loaded_strategy,
+    "bin-packing": bin_packing_strategy,
+}
+
+
+class Scheduler(object):
+    """Picks the Docker hosts where new redis containers are started.
+
+    The strategy is chosen with ``DOCKER_SCHEDULER``. Hosts that would go
+    over ``DOCKER_HOST_MEMORY`` bytes of reserved memory, when defined, and
+    hosts known to be down are left out. Each container of an instance goes
+    to a different host.
+    """
+
+    def __init__(self, docker_hosts):
+        self.docker_hosts = docker_hosts
+        name = os.environ.get("DOCKER_SCHEDULER", "random")
+        self.strategy = strategies.get(name, random_strategy)
+        capacity = os.environ.get("DOCKER_HOST_MEMORY")
+        self.capacity = int(capacity) if capacity else None
+
+    def hostname(self, url):
+        return urlparse(url).hostname
+
+    def candidates(self, memory=CONTAINER_MEMORY):
+        """Return the hosts alive that can take a container, and their loads."""
+        hosts = docker_clients.alive(self.docker_hosts)
+        loads = {}
+        if self.strategy is not random_strategy or self.capacity:
+            current = host_load.get()
+            empty = {"containers": 0, "memory": 0}
+            for host in hosts:
+                loads[host] = current.get(self.hostname(host), empty)
+        if self.capacity:
+            hosts = [host for host in hosts
+                     if loads[host]["memory"] + memory <= self.capacity]
+        return hosts, loads
+
+    def choose(self, count=1, memory=CONTAINER_MEMORY):
+        hosts, loads = self.candidates(memory)
+        if len(hosts) < count:
+            msg = u"{} Docker hosts are required, only {} can take {} bytes.".format(
+                count, len(hosts), memory)
+            raise NoHostAvailable(msg)
+        return self.strategy(hosts, loads)[:count]
+
+    def rank(self, memory=CONTAINER_MEMORY):
+        """Return every host that can take a container, best first."""
+        hosts, loads = self.candidates(memory)
+        if not hosts:
+            msg = u"No Docker host can take {} bytes.".format(memory)
+            raise NoHostAvailable(msg)
+        return self.strategy(hosts, loads)
+
+    def spread(self, groups, size, memory=CONTAINER_MEMORY):
+        """Pick the hosts of ``groups`` groups of ``size`` containers each.
+
+        The containers of a group go to different hosts. The groups are laid
+        out one after the other around the hosts, in the order of the
+        strategy, so a host takes more than one container only when there
+        are fewer hosts than containers.
+        """
+        hosts, loads = self.candidates(memory)
+        if len(hosts) < size:
+            msg = u"{} Docker hosts are required, only {} can take {} bytes.".format(
+                size, len(hosts), memory)
+            raise NoHostAvailable(msg)
+        hosts = self.strategy(hosts, loads)
+        placement = [[hosts[(group * size + member) % len(hosts)] for member in range(size)]
+                     for group in range(groups)]
+        if self.capacity:
+            containers = {}
+            for host in itertools.chain(*placement):
+                containers[host] = containers.get(host, 0) + 1
+            for host, count in containers.items():
+                if loads[host]["memory"] + count * memory > self.capacity:
+                    msg = u"{} can not take {} containers of {} bytes.".format(
+                        host, count, memory)
+                    raise NoHostAvailable(msg)
+        return placement
@@ -0,0 +1,74 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import logging
+import os
+
+import redis
+
+from instrumentation import observe
+from utils import parallel
+
+logger = logging.getLogger()
+
+
+class SentinelQuorumError(Exception):
+    pass
+
+
+class Sentinels(object):
+    """Sends SENTINEL commands to every sentinel at once.
+
+    The commands for a sentinel go in a single pipeline and all sentinels
+    are contacted in parallel, each one bounded by ``SENTINEL_TIMEOUT``
+    seconds. A call succeeds when at least ``SENTINEL_QUORUM`` sentinels
+    (by default, the majority of them) accepted the commands.
+    """
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.timeout = float(os.environ.get("SENTINEL_TIMEOUT", "5"))
+        quorum = os.environ.get("SENTINEL_QUORUM")
+        if quorum:
+            self.quorum = int(quorum)
+        elif hosts:
+            self.quorum = len(hosts) // 2 + 1
+        else:
+            self.quorum = 0
+
+    def client(self, sentinel):
+        host, port = sentinel.replace("http://", "").split(":")
+        return redis.StrictRedis(host=str(host), port=str(port),
+                                 socket_timeout=self.timeout,
+                                 socket_connect_timeout=self.timeout)
+
+    def send(self, sentinel, commands):
+        try:
+            with observe("sentinel", commands[0][0]):
+                pipeline = self.client(sentinel).pipeline(transaction=False)
+                for command in commands:
+                    # StrictRedis.sentinel only warns that it is deprecated.
+                    pipeline.execute_command("SENTINEL", *command)
+                pipeline.execute()
+        except redis.RedisError as e:
+            logger.error("sentinel {0} failed: {1}".format(sentinel, e))
+            return e
+
+    def execute(self, commands):
+        """Run ``commands`` on all sentinels and return the failures by host.
+
+        Raises SentinelQuorumError when fewer than ``quorum`` sentinels
+        succeeded.
+        """
+        errors = parallel(*[lambda sentinel=sentinel: self.send(sentinel, commands)
+                            for sentinel in self.hosts])
+        failures = dict((sentinel, error) for sentinel, error in zip(self.hosts, errors)
+                        if error is not None)
+        succeeded = len(self.hosts) - len(failures)
+        if succeeded < self.quorum:
+            msg = u"Only {} of {} sentinels succeeded, {} required: {}".format(
+                succeeded, len(self.hosts), self.quorum,
+                ", ".join("{} ({})".format(s, e) for s, e in sorted(failures.items())))
+            raise SentinelQuorumError(msg)
+        return failures
@@ -0,0 +1,201 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+import threading
+import time
+
+import redis
+
+from scheduler import CONTAINER_MEMORY
+from utils import parallel
+
+
+class StatusChecker(object):
+    """Checks redis endpoints for the status of the instances.
+
+    Each process keeps a small connection pool per endpoint, whose commands
+    time out after ``STATUS_TIMEOUT`` seconds. The endpoints of an instance
+    are checked in parallel, and the result is reused for
+    ``STATUS_CACHE_TTL`` seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+        self.results = {}
+        self.pid = None
+
+    def timeout(self):
+        return float(os.environ.get("STATUS_TIMEOUT", "2"))
+
+    def ttl(self):
+        return float(os.environ.get("STATUS_CACHE_TTL", "5"))
+
+    def check_pid(self):
+        if self.pid != os.getpid():
+            self.pools.clear()
+            self.results.clear()
+            self.pid = os.getpid()
+
+    def client(self, host, port, password=None):
+        key = (host, int(port), password)
+        with self.lock:
+            self.check_pid()
+            pool = self.pools.get(key)
+            if pool is None:
+                kw = {
+                    "host": host,
+                    "port": int(port),
+                    "socket_timeout": self.timeout(),
+                    "socket_connect_timeout": self.timeout(),
+                    "max_connections": 4,
+                }
+                if password:
+                    kw["password"] = password
+                pool = self.pools[key] = redis.ConnectionPool(**kw)
+        return redis.StrictRedis(connection_pool=pool)
+
+    def cached(self, key, check):
+        now = time.time()
+        with self.lock:
+            self.check_pid()
+            entry = self.results.get(key)
+            if entry is not None and now - entry[0] <= self.ttl():
+                return entry[1]
+        result = check()
+        with self.lock:
+            self.results[key] = (now, result)
+        return result
+
+    def ping(self, host, port, password=None):
+        def check():
+            try:
+                self.client(host, port, password).ping()
+            except redis.RedisError as e:
+                return False, str(e)
+            return True, ""
+        return self.cached((host, str(port)), check)
+
+    def replication(self, endpoint):
+        try:
+            return self.client(endpoint["host"], endpoint["port"]).info("replication")
+        except redis.RedisError as e:
+            return {"error": str(e)}
+
+    def describe(self, endpoint, info, master_offset):
+        name = "{}:{}".format(endpoint["host"], endpoint["port"])
+        if "error" in info:
+            return False, "{} is down: {}".format(name, info["error"])
+        role = info.get("role")
+        if role != "slave":
+            return True, "{} is {}".format(name, role)
+        link = info.get("master_link_status")
+        msg = "{} is slave, link {}".format(name, link)
+        if master_offset is not None and "slave_repl_offset" in info:
+            msg += ", {} bytes behind".format(max(master_offset - info["slave_repl_offset"], 0))
+        return link == "up", msg
+
+    def check_instance(self, instance):
+        """Return whether all endpoints of the instance are fine, and why."""
+        key = (instance.name, tuple((endpoint["host"], str(endpoint["port"]))
+                                    for endpoint in instance.endpoints))
+
+        def check():
+            infos = parallel(*[lambda endpoint=endpoint: self.replication(endpoint)
+                               for endpoint in instance.endpoints])
+            masters = [info for info in infos if info.get("role") == "master"]
+            master_offset = masters[0].get("master_repl_offset") if masters else None
+            results = [self.describe(endpoint, info, master_offset)
+                       for endpoint, info in zip(instance.endpoints, infos)]
+            ok = all(result[0] for result in results)
+            if ok and not masters:
+                return False, "no master found"
+            return ok, "; ".join(result[1] for result in results)
+        return self.cached(key, check)
+
+
+status_checker = StatusChecker()
+
+
+class MetricsCollector(object):
+    """Usage figures of the redis endpoints of an instance, read from INFO.
+
+    Snapshots of an endpoint are reused for ``METRICS_CACHE_TTL`` seconds.
+    Rates are computed against the previous snapshot of the endpoint, so
+    they are only reported from the second collection on. Memory usage is
+    relative to ``maxmemory``, or to the memory given to each container when
+    redis has no limit.
+    """
+
+    def __init__(self, checker):
+        self.checker = checker
+        self.lock = threading.Lock()
+        self.snapshots = {}
+
+    def ttl(self):
+        return float(os.environ.get("METRICS_CACHE_TTL", "10"))
+
+    def snapshot(self, endpoint, password=None):
+        key = (endpoint["host"], str(endpoint["port"]))
+        now = time.time()
+        with self.lock:
+            current = self.snapshots.get(key)
+        if current is not None and now - current["time"] <= self.ttl():
+            return current
+        try:
+            info = self.checker.client(endpoint["host"], endpoint["port"], password).info()
+        except redis.RedisError as e:
+            return {"time": now, "error": str(e)}
+        snapshot = {"time": now, "info": info, "previous": None}
+        if current is not None and "info" in current:
+            snapshot["previous"] = {"time": current["time"], "info": current["info"]}
+        with self.lock:
+            self.snapshots[key] = snapshot
+        return snapshot
+
+    def rate(self, snapshot, field):
+        previous = snapshot["previous"]
+        if previous is None or snapshot["time"] <= previous["time"]:
+            return None
+        delta = snapshot["info"].get(field, 0) - previous["info"].get(field, 0)
+        return max(delta, 0) / float(snapshot["time"] - previous["time"])
+
+    def metrics(self, endpoint, snapshot):
+        result = {"host": endpoint["host"], "port": endpoint["port"]}
+        if "error" in snapshot:
+            result["error"] = snapshot["error"]
+            return result
+        info = snapshot["info"]
+        maxmemory = info.get("maxmemory") or CONTAINER_MEMORY
+        hits = info.get("keyspace_hits", 0)
+        misses = info.get("keyspace_misses", 0)
+        result.update({
+            "role": info.get("role"),
+            "connected_clients": info.get("connected_clients"),
+            "used_memory": info.get("used_memory"),
+            "maxmemory": maxmemory,
+            "memory_usage": float(info.get("used_memory", 0)) / maxmemory,
+            "keys": sum(value.get("keys", 0) for name, value in info.items()
+                        if name.startswith("db") and isinstance(value, dict)),
+            "ops_per_sec": info.get("instantaneous_ops_per_sec"),
+            "hit_ratio": float(hits) / (hits + misses) if hits + misses else None,
+            "evicted_keys": info.get("evicted_keys"),
+            "commands_per_sec": self.rate(snapshot, "total_commands_processed"),
+            "evictions_per_sec": self.rate(snapshot, "evicted_keys"),
+        })
+        return result
+
+    def collect(self, instance, password=None):
+        snapshots = parallel(*[lambda endpoint=endpoint: self.snapshot(endpoint, password)
+                               for endpoint in instance.endpoints])
+        return {
+            "name": instance.name,
+            "plan": instance.plan,
+            "endpoints": [self.metrics(endpoint, snapshot)
+                          for endpoint, snapshot in zip(instance.endpoints, snapshots)],
+        }
+
+
+metrics_collector = MetricsCollector(status_checker)
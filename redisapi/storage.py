@@ -2,22 +2,182 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 
+import collections
+import itertools
+import os
+import threading
+import time
+
+from instrumentation import instrumented, observe
 from redisapi import mongodb_database
 
+import logging
+logger = logging.getLogger()
+
+# Indexes backing the queries done while serving requests, by collection.
+indexes = {
+    "instances": [
+        ([("name", 1)], {"unique": True}),
+        ([("endpoints.host", 1), ("endpoints.port", 1)], {}),
+    ],
+    "zabbix": [
+        ([("host", 1), ("port", 1)], {}),
+        ([("status", 1), ("updated", 1)], {}),
+    ],
+    "jobs": [
+        ([("status", 1), ("created", 1)], {}),
+    ],
+    "healthchecks": [
+        ([("next", 1)], {}),
+    ],
+    "permits": [
+        ([("instance", 1), ("source", 1)], {"unique": True}),
+    ],
+    "warm_pool": [
+        ([("url", 1), ("created", 1)], {}),
+    ],
+}
+
+
+def ensure_indexes():
+    """Create the missing indexes of every collection.
+
+    Failures are logged and left for the next process to retry, so an API
+    process still starts when one of the indexes cannot be built, e.g. a
+    unique index over duplicated values.
+    """
+    from pymongo.errors import PyMongoError
+    try:
+        db = mongodb_database()
+        for collection, specs in indexes.items():
+            for keys, options in specs:
+                db[collection].create_index(keys, **options)
+    except PyMongoError:
+        logger.exception("could not create the MongoDB indexes")
+
 
 class Instance(object):
+    """A provisioned instance.
 
-    def __init__(self, name, plan, endpoints):
+    ``settings`` is the plan as it was resolved when the instance was
+    created, manager included, so the instance can still be managed once
+    its plan is changed or removed. Instances created before the settings
+    were recorded have none.
+    """
+
+    def __init__(self, name, plan, endpoints, settings=None):
         self.name = name
         self.plan = plan
         self.endpoints = endpoints
+        self.settings = settings
 
     def to_json(self):
-        return {
+        result = {
             'endpoints': self.endpoints,
             'name': self.name,
             'plan': self.plan,
         }
+        if self.settings is not None:
+            result['settings'] = self.settings
+        return result
+
+
+class InstanceCache(object):
+    """Least recently used instances, kept for ``INSTANCE_CACHE_TTL`` seconds.
+
+    At most ``INSTANCE_CACHE_SIZE`` instances are kept by each process, none
+    when it is ``0``. Removing an instance bumps a version stored in the
+    ``changes`` collection, and every process drops its cache when it sees a
+    new version, checking at most once every ``INSTANCE_CACHE_SYNC_INTERVAL``
+    seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self.checked_at = None
+        self.pid = None
+
+    def size(self):
+        return int(os.environ.get("INSTANCE_CACHE_SIZE", "1000"))
+
+    def ttl(self):
+        return float(os.environ.get("INSTANCE_CACHE_TTL", "60"))
+
+    def interval(self):
+        return float(os.environ.get("INSTANCE_CACHE_SYNC_INTERVAL", "5"))
+
+    def check_pid(self):
+        if self.pid != os.getpid():
+            self.items.clear()
+            self.version = None
+            self.checked_at = None
+            self.pid = os.getpid()
+
+    def sync(self, load_version):
+        if self.size() <= 0:
+            return
+        now = time.time()
+        with self.lock:
+            self.check_pid()
+            if self.checked_at is not None and now - self.checked_at < self.interval():
+                return
+        version = load_version()
+        with self.lock:
+            if self.version is not None and version != self.version:
+                self.items.clear()
+            self.version = version
+            self.checked_at = now
+
+    def get(self, name):
+        with self.lock:
+            self.check_pid()
+            entry = self.items.pop(name, None)
+            if entry is None or time.time() - entry[1] > self.ttl():
+                self.misses += 1
+                return None
+            self.items[name] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, instance):
+        size = self.size()
+        if size <= 0:
+            return
+        with self.lock:
+            self.check_pid()
+            self.items.pop(instance.name, None)
+            self.items[instance.name] = (instance, time.time())
+            while len(self.items) > size:
+                self.items.popitem(last=False)
+
+    def invalidate(self, name):
+        with self.lock:
+            self.items.pop(name, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.version = None
+            self.checked_at = None
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.items),
+                "max_size": self.size(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "version": self.version,
+            }
+
+
+instance_cache = InstanceCache()
 
 
 class MongoStorage(object):
@@ -25,26 +185,171 @@ class MongoStorage(object):
     def db(self):
         return mongodb_database()
 
+    @instrumented("mongo")
     def add_instance(self, instance):
         self.db().instances.insert(instance.to_json())
+        instance_cache.set(instance)
+
+    @instrumented("mongo")
+    def instances_version(self):
+        result = self.db().changes.find_one({"_id": "instances"})
+        if result is None:
+            return 0
+        return result["version"]
 
     def find_instance_by_name(self, name):
-        result = self.db().instances.find_one({"name": name})
-        return Instance(
+        instance_cache.sync(self.instances_version)
+        instance = instance_cache.get(name)
+        if instance is not None:
+            return instance
+        with observe("mongo", "find_instance_by_name"):
+            result = self.db().instances.find_one({"name": name})
+        if result is None:
+            return None
+        instance = Instance(
             name=result['name'],
             plan=result['plan'],
             endpoints=result['endpoints'],
+            settings=result.get('settings'),
         )
+        instance_cache.set(instance)
+        return instance
 
+    @instrumented("mongo")
+    def has_instance(self, name):
+        return self.db().instances.find_one({"name": name}, {"_id": True}) is not None
+
+    @instrumented("mongo")
     def find_instances_by_host(self, host):
         result = self.db().instances.find({"endpoints.host": host})
         instances = []
         for item in result:
             instance = Instance(name=item['name'],
                                 plan=item['plan'],
-                                endpoints=item['endpoints'])
+                                endpoints=item['endpoints'],
+                                settings=item.get('settings'))
             instances.append(instance)
         return instances
 
+    @instrumented("mongo")
+    def load_by_host(self, memory):
+        """Return the containers of each host and the memory reserved for them.
+
+        Both the containers of the instances and those of the warm pool are
+        counted. Containers that did not record their memory count as
+        ``memory``.
+        """
+        instances = self.db().instances.aggregate([
+            {"$unwind": "$endpoints"},
+            {"$match": {"endpoints.container_id": {"$exists": True}}},
+            {"$group": {"_id": "$endpoints.host", "containers": {"$sum": 1},
+                        "memory": {"$sum": {"$ifNull": ["$endpoints.memory", memory]}}}},
+        ], cursor={})
+        pooled = self.db().warm_pool.aggregate([
+            {"$group": {"_id": "$host", "containers": {"$sum": 1},
+                        "memory": {"$sum": {"$ifNull": ["$memory", memory]}}}},
+        ], cursor={})
+        loads = {}
+        for item in itertools.chain(instances, pooled):
+            load = loads.setdefault(item["_id"], {"containers": 0, "memory": 0})
+            load["containers"] += item["containers"]
+            load["memory"] += item["memory"]
+        return loads
+
+    @instrumented("mongo")
     def remove_instance(self, instance):
-        return self.db().instances.remove({"name": instance.name})
+        result = self.db().instances.remove({"name": instance.name})
+        self.db().permits.remove({"instance": instance.name})
+        self.db().changes.update(
+            {"_id": "instances"}, {"$inc": {"version": 1}}, upsert=True)
+        instance_cache.invalidate(instance.name)
+        return result
+
+
+class PermitStore(object):
+    """Unit hosts allowed to reach each instance, by source network.
+
+    The permits of a network are only needed while at least one of its
+    units is bound, so :meth:`add` and :meth:`remove` tell whether the
+    network was just opened or closed. Networks with no record at all, bound
+    before the store existed, are always reported as closed on removal.
+
+    The caller that opens a network reports it with :meth:`opened` once its
+    permits are committed, or with :meth:`abandon` when they could not be,
+    and records its other units of the network with :meth:`join`.
+    Other units of the network wait in :meth:`add` until then, and take
+    over the opening when it was abandoned or took more than
+    ``ACL_PERMIT_TIMEOUT`` seconds.
+    """
+
+    def db(self):
+        return mongodb_database()
+
+    def timeout(self):
+        return float(os.environ.get("ACL_PERMIT_TIMEOUT", "30"))
+
+    @instrumented("mongo", "permits.add")
+    def add(self, instance_name, source, unit_host):
+        from pymongo.errors import DuplicateKeyError
+        permits = self.db().permits
+        query = {"instance": instance_name, "source": source}
+        update = {"$addToSet": {"units": unit_host}}
+        try:
+            previous = permits.find_and_modify(
+                query, dict(update, **{"$setOnInsert": {"open": False, "opening": time.time()}}),
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Another unit of the network inserted it first.
+            previous = permits.find_and_modify(query, update)
+        if previous is None:
+            return True
+        if not previous.get("units"):
+            permits.update(query, {"$set": {"open": False, "opening": time.time()}})
+            return True
+        while True:
+            current = permits.find_one(query)
+            if current is None:
+                return True
+            if current.get("open", True):
+                return False
+            claimed = permits.find_and_modify(
+                dict(query, open=False, opening={"$lt": time.time() - self.timeout()}),
+                {"$set": {"opening": time.time()}},
+            )
+            if claimed is not None:
+                return True
+            time.sleep(0.05)
+
+    @instrumented("mongo", "permits.join")
+    def join(self, instance_name, source, unit_host):
+        """Record a unit of a network being opened by the caller, without waiting."""
+        self.db().permits.update({"instance": instance_name, "source": source},
+                                 {"$addToSet": {"units": unit_host}})
+
+    @instrumented("mongo", "permits.opened")
+    def opened(self, instance_name, sources):
+        self.db().permits.update({"instance": instance_name, "source": {"$in": sources}},
+                                 {"$set": {"open": True}}, multi=True)
+
+    @instrumented("mongo", "permits.abandon")
+    def abandon(self, instance_name, sources):
+        self.db().permits.update({"instance": instance_name, "source": {"$in": sources},
+                                  "open": False},
+                                 {"$set": {"opening": 0}}, multi=True)
+
+    @instrumented("mongo", "permits.remove")
+    def remove(self, instance_name, source, unit_host):
+        permits = self.db().permits
+        query = {"instance": instance_name, "source": source}
+        result = permits.find_and_modify(
+            dict(query, units=unit_host),
+            {"$pull": {"units": unit_host}},
+            new=True,
+        )
+        if result is None:
+            return permits.find_one(query) is None
+        if not result["units"]:
+            permits.remove(dict(query, units={"$size": 0}))
+            return True
+        return False
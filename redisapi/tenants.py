@@ -0,0 +1,74 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+from instrumentation import instrumented
+from redisapi import mongodb_database
+
+
+class NoSlotAvailable(Exception):
+    pass
+
+
+class TenantSlots(object):
+    """Reserves the slots of the shared redis servers of the dense plan.
+
+    A slot is a database number or an ACL user of a server, given to a
+    single tenant. Every server has a document in the ``tenant_slots``
+    collection holding its next never used slot, the slots released by
+    removed instances and how many slots are in use, like the ports of
+    :class:`redisapi.ports.PortAllocator`. New tenants go to the least used
+    server that has a slot left.
+    """
+
+    def __init__(self, servers, first, last):
+        self.servers = list(servers)
+        self.first = first
+        self.last = last
+
+    def db(self):
+        return mongodb_database()
+
+    def usage(self):
+        """Return the servers, least used first."""
+        used = dict((item["_id"], item["used"]) for item in self.db().tenant_slots.find(
+            {"_id": {"$in": self.servers}}, {"used": True}))
+        return sorted(self.servers, key=lambda server: used.get(server, 0))
+
+    @instrumented("mongo", "reserve_slot")
+    def reserve(self):
+        slots = self.db().tenant_slots
+        for server in self.usage():
+            result = slots.find_and_modify(
+                {"_id": server, "free.0": {"$exists": True}},
+                {"$pop": {"free": -1}, "$inc": {"used": 1}},
+            )
+            if result:
+                return server, result["free"][0]
+            self.seed(server)
+            result = slots.find_and_modify(
+                {"_id": server, "next": {"$lte": self.last}},
+                {"$inc": {"next": 1, "used": 1}},
+            )
+            if result:
+                return server, result["next"]
+        msg = u"No slot available on the dense servers {}.".format(", ".join(self.servers))
+        raise NoSlotAvailable(msg)
+
+    def seed(self, server):
+        from pymongo.errors import DuplicateKeyError
+        try:
+            self.db().tenant_slots.update(
+                {"_id": server},
+                {"$setOnInsert": {"next": self.first, "free": [], "used": 0}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            pass
+
+    @instrumented("mongo", "release_slot")
+    def release(self, server, slot):
+        self.db().tenant_slots.update(
+            {"_id": server, "free": {"$ne": int(slot)}},
+            {"$push": {"free": int(slot)}, "$inc": {"used": -1}},
+        )
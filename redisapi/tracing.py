@@ -0,0 +1,205 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import binascii
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import urllib2
+
+logger = logging.getLogger()
+
+_context = threading.local()
+
+
+def new_id(size):
+    return binascii.hexlify(os.urandom(size)).decode("ascii")
+
+
+class Span(object):
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else new_id(16)
+        self.span_id = new_id(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def to_json(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(self.start * 1e9)),
+            "endTimeUnixNano": str(int(self.end * 1e9)),
+            "attributes": [{"key": key, "value": {"stringValue": str(value)}}
+                           for key, value in sorted(self.attributes.items())],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class FileExporter(object):
+    """Appends finished spans to ``TRACING_FILE``, one JSON document per line."""
+
+    def __init__(self):
+        self.path = os.environ.get("TRACING_FILE", "traces.jsonl")
+        self.lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_json())
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+class OTLPExporter(object):
+    """Sends finished spans to an OTLP/HTTP collector at ``TRACING_OTLP_ENDPOINT``.
+
+    Spans are buffered and posted in the JSON encoding by a thread of each
+    process, every ``TRACING_FLUSH_INTERVAL`` seconds.
+    """
+
+    def __init__(self):
+        self.endpoint = os.environ.get("TRACING_OTLP_ENDPOINT",
+                                       "http://localhost:4318/v1/traces")
+        self.interval = float(os.environ.get("TRACING_FLUSH_INTERVAL", "5"))
+        self.lock = threading.Lock()
+        self.spans = []
+        self.pid = None
+
+    def export(self, span):
+        with self.lock:
+            self.spans.append(span)
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                thread = threading.Thread(target=self.work)
+                thread.daemon = True
+                thread.start()
+
+    def payload(self, spans):
+        return {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": "redisapi"}},
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "redisapi"},
+                "spans": [span.to_otlp() for span in spans],
+            }],
+        }]}
+
+    def flush(self):
+        with self.lock:
+            spans, self.spans = self.spans, []
+        if not spans:
+            return
+        request = urllib2.Request(self.endpoint, json.dumps(self.payload(spans)),
+                                  {"Content-Type": "application/json"})
+        urllib2.urlopen(request, timeout=5).close()
+
+    def work(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("could not export the traces")
+
+
+exporters = {
+    "file": FileExporter,
+    "otlp": OTLPExporter,
+}
+
+_exporter = {}
+_exporter_lock = threading.Lock()
+
+
+def exporter():
+    """Return the exporter set by ``TRACING_EXPORTER``, if any."""
+    name = os.environ.get("TRACING_EXPORTER", "")
+    with _exporter_lock:
+        if _exporter.get("name") != name:
+            _exporter["name"] = name
+            _exporter["exporter"] = exporters[name]() if name in exporters else None
+        return _exporter["exporter"]
+
+
+def current():
+    return getattr(_context, "span", None)
+
+
+def activate(span):
+    """Make span the parent of the spans started by the current thread."""
+    _context.span = span
+
+
+def start_span(name, **attributes):
+    span = Span(name, current(), attributes)
+    span.previous = current()
+    activate(span)
+    return span
+
+
+def finish_span(span, error=None):
+    span.end = time.time()
+    if error is not None:
+        span.error = str(error) or error.__class__.__name__
+    activate(span.previous)
+    export = exporter()
+    if export is not None:
+        try:
+            export.export(span)
+        except Exception:
+            logger.exception("could not export span {}".format(span.name))
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a child of the current span."""
+    s = start_span(name, **attributes)
+    try:
+        yield s
+    except Exception as e:
+        finish_span(s, e)
+        raise
+    finish_span(s)
+
+
+def traced(name=None):
+    """Decorate a function so each call is a span named after it."""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -2,7 +2,13 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 
+import json
 import os
+import threading
+
+import tracing
+
+_json_values = {}
 
 
 def get_value(key):
@@ -13,3 +19,45 @@ def get_value(key):
               "environment variable.".format(key)
         raise Exception(msg)
     return value
+
+
+def get_json_value(key):
+    """Like :func:`get_value`, for variables holding JSON documents.
+
+    Each document is parsed once per process; the parsed value is shared and
+    must not be modified.
+    """
+    value = get_value(key)
+    if value not in _json_values:
+        _json_values[value] = json.loads(value)
+    return _json_values[value]
+
+
+def parallel(*calls):
+    """Run each callable in its own thread and return their results in order.
+
+    All the calls are waited for. If any of them fails, the first error is
+    raised once they are done. Spans started by the calls are children of
+    the current span.
+    """
+    results = [None] * len(calls)
+    errors = []
+    parent = tracing.current()
+
+    def run(index, call):
+        tracing.activate(parent)
+        try:
+            results[index] = call()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(index, call))
+               for index, call in enumerate(calls)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
@@ -0,0 +1,168 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+import socket
+import threading
+import time
+
+from instrumentation import instrumented
+from redisapi import mongodb_database
+from scheduler import CONTAINER_MEMORY, host_load
+from utils import get_json_value
+
+import logging
+logger = logging.getLogger()
+
+
+class WarmPool(object):
+    """Redis containers started ahead of time for the instances of the basic plan.
+
+    Each Docker host keeps ``WARM_POOL_SIZE`` running containers, with their
+    ports already reserved, in the ``warm_pool`` collection. A container is
+    handed out by removing its document, so it goes to a single instance no
+    matter how many processes serve the API. The pools are refilled by a
+    thread of each process, right after a container is taken and every
+    ``WARM_POOL_INTERVAL`` seconds; a process fills the pool of a host only
+    while it holds its lease, which expires after ``WARM_POOL_LEASE``
+    seconds. With no size, which is the default, there is no pool at all.
+    """
+
+    plan = "basic"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pid = None
+
+    def db(self):
+        return mongodb_database()
+
+    def size(self):
+        return int(os.environ.get("WARM_POOL_SIZE", "0"))
+
+    def interval(self):
+        return float(os.environ.get("WARM_POOL_INTERVAL", "30"))
+
+    def lease(self):
+        return float(os.environ.get("WARM_POOL_LEASE", "300"))
+
+    def owner(self):
+        return "{}:{}".format(socket.gethostname(), os.getpid())
+
+    def manager(self):
+        from managers import DockerBase
+        return DockerBase(self.plan)
+
+    def start(self):
+        if self.size() <= 0:
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+
+    def notify(self):
+        self.start()
+        self.wakeup.set()
+
+    @instrumented("mongo", "warm_pool.take")
+    def take(self, urls, plan):
+        """Return the endpoint of a pooled container, preferably on the first of urls.
+
+        Containers of the other urls, the hosts the scheduler accepts, are
+        taken when the pool of the first one is empty. Returns None when
+        their pools are empty, or when the containers are not started for
+        the plan.
+        """
+        if self.size() <= 0 or plan != self.plan:
+            return None
+        for query in [{"url": urls[0]}, {"url": {"$in": urls[1:]}}]:
+            item = self.db().warm_pool.find_and_modify(
+                query, remove=True, sort=[("created", 1)])
+            if item is not None:
+                self.notify()
+                return {"host": item["host"], "port": item["port"],
+                        "container_id": item["_id"]}
+        self.notify()
+        return None
+
+    def acquire(self, url):
+        from pymongo.errors import DuplicateKeyError
+        now = time.time()
+        try:
+            self.db().warm_pool_leases.update(
+                {"_id": url, "expires": {"$lt": now}},
+                {"$set": {"expires": now + self.lease(), "owner": self.owner()}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def release(self, url):
+        self.db().warm_pool_leases.remove({"_id": url, "owner": self.owner()})
+
+    def fill(self, url):
+        """Start or stop containers of the host until its pool has the right size.
+
+        Containers are only started while the scheduler would place one
+        more container on the host.
+        """
+        if not self.acquire(url):
+            return 0
+        try:
+            manager = self.manager()
+            missing = self.size() - self.db().warm_pool.find({"url": url}).count()
+            for added in range(missing):
+                hosts, _ = manager.scheduler().candidates(manager.memory())
+                if url not in hosts:
+                    return added
+                self.add(manager, url)
+            for _ in range(-missing):
+                self.discard(manager, url)
+            return missing
+        finally:
+            self.release(url)
+
+    def add(self, manager, url):
+        client = manager.client(url)
+        host = manager.extract_hostname(client.base_url)
+        port = manager.get_port_by_host(host)
+        try:
+            container_id = manager.run_redis_container(client, port)
+        except Exception:
+            manager.release_port(host, port)
+            raise
+        self.db().warm_pool.insert({"_id": container_id, "url": url, "host": host,
+                                    "port": port, "memory": manager.memory(),
+                                    "created": time.time()})
+        host_load.add(host, manager.memory())
+
+    def discard(self, manager, url):
+        item = self.db().warm_pool.find_and_modify(
+            {"url": url}, remove=True, sort=[("created", -1)])
+        if item is None:
+            return
+        client = manager.client(url)
+        client.stop(item["_id"])
+        client.remove_container(item["_id"])
+        manager.release_port(item["host"], item["port"])
+        host_load.remove(item["host"], item.get("memory", CONTAINER_MEMORY))
+
+    def work(self):
+        while True:
+            for url in get_json_value("DOCKER_HOSTS"):
+                try:
+                    self.fill(url)
+                except Exception:
+                    logger.exception("could not fill the warm pool of {}".format(url))
+            self.wakeup.wait(self.interval())
+            self.wakeup.clear()
+
+
+warm_pool = WarmPool()
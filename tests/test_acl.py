@@ -3,6 +3,8 @@
 # license that can be found in the LICENSE file.
 
 import os
+import threading
+import time
 import unittest
 
 import mock
@@ -18,10 +20,20 @@ class GloboACLManagerTest(unittest.TestCase):
         os.environ["ACL_API_ENDPOINT"] = self.endpoint = "http://localhost"
         os.environ["ACL_API_USERNAME"] = self.username = "redis"
         os.environ["ACL_API_PASSWORD"] = self.password = "passw"
+        os.environ["ACL_BATCH_WINDOW"] = "0"
 
     def tearDown(self):
-        for env in ("ACL_API_ENDPOINT", "ACL_API_USERNAME", "ACL_API_PASSWORD"):
-            del os.environ[env]
+        for env in ("ACL_API_ENDPOINT", "ACL_API_USERNAME", "ACL_API_PASSWORD",
+                    "ACL_BATCH_WINDOW"):
+            os.environ.pop(env, None)
+
+    def manager(self):
+        manager = acl.GloboACLAPIManager()
+        manager.client = mock.Mock()
+        manager.store = mock.Mock()
+        manager.store.add.return_value = True
+        manager.store.remove.return_value = True
+        return manager
 
     @mock.patch("aclapiclient.aclapiclient.Client")
     def test_new_manager(self, Client):
@@ -31,8 +43,8 @@ class GloboACLManagerTest(unittest.TestCase):
         self.assertEqual(client, manager.client)
 
     def test_grant_access(self):
-        manager = acl.GloboACLAPIManager()
-        manager.client = client = mock.Mock()
+        manager = self.manager()
+        client = manager.client
         endpoints = [{"host": "10.0.0.1", "port": 4532},
                      {"host": "10.0.0.2", "port": 4536},
                      {"host": "10.0.0.3", "port": 3645}]
@@ -57,8 +69,8 @@ class GloboACLManagerTest(unittest.TestCase):
         client.commit.assert_called_once()
 
     def test_revoke_access(self):
-        manager = acl.GloboACLAPIManager()
-        manager.client = client = mock.Mock()
+        manager = self.manager()
+        client = manager.client
         endpoints = [{"host": "10.0.0.1", "port": 4532},
                      {"host": "10.0.0.2", "port": 4536},
                      {"host": "10.0.0.3", "port": 3645}]
@@ -82,6 +94,134 @@ class GloboACLManagerTest(unittest.TestCase):
                                                           target="dest"))
         client.commit.assert_called_once()
 
+    def test_grant_access_network_already_allowed(self):
+        manager = self.manager()
+        manager.store.add.return_value = False
+        instance = storage.Instance(name="myredis", plan="basic",
+                                    endpoints=[{"host": "10.0.0.1", "port": 4532}])
+        manager.grant_access(instance, "192.168.1.14")
+        manager.store.add.assert_called_with("myredis", "192.168.1.0/24", "192.168.1.14")
+        self.assertFalse(manager.client.add_tcp_permit_access.called)
+        self.assertFalse(manager.client.commit.called)
+
+    def test_grant_access_failure_is_forgotten(self):
+        manager = self.manager()
+        manager.client.commit.side_effect = RuntimeError("commit failed")
+        instance = storage.Instance(name="myredis", plan="basic",
+                                    endpoints=[{"host": "10.0.0.1", "port": 4532}])
+        with self.assertRaises(RuntimeError):
+            manager.grant_access(instance, "192.168.1.14")
+        manager.store.remove.assert_called_with("myredis", "192.168.1.0/24", "192.168.1.14")
+
+    def test_revoke_access_network_still_used(self):
+        manager = self.manager()
+        manager.store.remove.return_value = False
+        instance = storage.Instance(name="myredis", plan="basic",
+                                    endpoints=[{"host": "10.0.0.1", "port": 4532}])
+        manager.revoke_access(instance, "192.168.1.14")
+        manager.store.remove.assert_called_with("myredis", "192.168.1.0/24", "192.168.1.14")
+        self.assertFalse(manager.client.remove_tcp_permit_access.called)
+        self.assertFalse(manager.client.commit.called)
+
+    def test_grant_access_many(self):
+        manager = self.manager()
+        manager.store.add.side_effect = [True, False, True]
+        instance = storage.Instance(name="myredis", plan="basic",
+                                    endpoints=[{"host": "10.0.0.1", "port": 4532}])
+        manager.grant_access_many(instance, ["192.168.1.13", "192.168.1.14",
+                                             "192.168.3.10", "192.168.2.10"])
+        calls = manager.client.add_tcp_permit_access.call_args_list
+        self.assertEqual(["192.168.1.0/24", "192.168.2.0/24"],
+                         [call[1]["source"] for call in calls])
+        manager.client.commit.assert_called_once_with()
+        manager.store.join.assert_called_once_with("myredis", "192.168.1.0/24",
+                                                   "192.168.1.14")
+
+    def test_grant_access_many_in_one_network(self):
+        os.environ["ACL_PERMIT_TIMEOUT"] = "3"
+        self.addCleanup(os.environ.pop, "ACL_PERMIT_TIMEOUT")
+        manager = self.manager()
+        manager.store = storage.PermitStore()
+        self.addCleanup(manager.store.db().permits.remove)
+        instance = storage.Instance(name="myredis", plan="basic",
+                                    endpoints=[{"host": "10.0.0.1", "port": 4532}])
+        start = time.time()
+        manager.grant_access_many(instance, ["192.168.1.13", "192.168.1.14"])
+        self.assertLess(time.time() - start, 1)
+        manager.client.add_tcp_permit_access.assert_called_once_with(
+            desc='redis-api instance "myredis" access from 192.168.1.0/24 to 10.0.0.1/32',
+            source="192.168.1.0/24", dest="10.0.0.1/32", l4_opts=mock.ANY)
+        permit = manager.store.db().permits.find_one({"instance": "myredis"})
+        self.assertEqual((["192.168.1.13", "192.168.1.14"], True),
+                         (permit["units"], permit["open"]))
+
+    def test_grant_access_many_failure_is_forgotten(self):
+        manager = self.manager()
+        manager.store.add.side_effect = [True]
+        manager.client.commit.side_effect = RuntimeError("commit failed")
+        instance = storage.Instance(name="myredis", plan="basic",
+                                    endpoints=[{"host": "10.0.0.1", "port": 4532}])
+        with self.assertRaises(RuntimeError):
+            manager.grant_access_many(instance, ["192.168.1.13", "192.168.1.14"])
+        self.assertEqual([mock.call("myredis", "192.168.1.0/24", "192.168.1.13"),
+                          mock.call("myredis", "192.168.1.0/24", "192.168.1.14")],
+                         manager.store.remove.call_args_list)
+
+    def test_revoke_access_many(self):
+        manager = self.manager()
+        manager.store.remove.side_effect = [False, True, True]
+        instance = storage.Instance(name="myredis", plan="basic",
+                                    endpoints=[{"host": "10.0.0.1", "port": 4532}])
+        manager.revoke_access_many(instance, ["192.168.1.13", "192.168.1.14",
+                                              "192.168.2.10"])
+        calls = manager.client.remove_tcp_permit_access.call_args_list
+        self.assertEqual(["192.168.1.0/24", "192.168.2.0/24"],
+                         [call[1]["source"] for call in calls])
+        manager.client.commit.assert_called_once_with()
+
+    def test_concurrent_grants_are_batched(self):
+        os.environ["ACL_BATCH_WINDOW"] = "0.5"
+        manager = self.manager()
+        client = manager.client
+        endpoints = [{"host": "10.0.0.1", "port": 4532}]
+        instance = storage.Instance(name="myredis", endpoints=endpoints,
+                                    plan="basic")
+        threads = [threading.Thread(target=manager.grant_access, args=(instance, host))
+                   for host in ("192.168.1.13", "192.168.1.14", "192.168.2.10")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        calls = client.add_tcp_permit_access.call_args_list
+        self.assertEqual(["192.168.1.0/24", "192.168.2.0/24"],
+                         sorted(call[1]["source"] for call in calls))
+        client.commit.assert_called_once_with()
+
+    @mock.patch("time.sleep")
+    def test_no_window_by_default(self, sleep):
+        del os.environ["ACL_BATCH_WINDOW"]
+        client = mock.Mock()
+        permit = ("desc", "192.168.1.0/24", "10.0.0.1/32", "4532")
+        acl.PermitBatcher().submit(client, [(acl.ADD, permit)])
+        self.assertFalse(sleep.called)
+        client.commit.assert_called_once_with()
+
+    def test_last_change_of_a_permit_wins(self):
+        client = mock.Mock()
+        permit = ("desc", "192.168.1.0/24", "10.0.0.1/32", "4532")
+        acl.PermitBatcher().submit(client, [(acl.ADD, permit), (acl.REMOVE, permit)])
+        self.assertFalse(client.add_tcp_permit_access.called)
+        self.assertEqual(1, client.remove_tcp_permit_access.call_count)
+
+    def test_commit_error_is_raised(self):
+        manager = self.manager()
+        client = manager.client
+        client.commit.side_effect = RuntimeError("commit failed")
+        instance = storage.Instance(name="myredis", plan="basic",
+                                    endpoints=[{"host": "10.0.0.1", "port": 4532}])
+        with self.assertRaises(RuntimeError):
+            manager.grant_access(instance, "192.168.1.13")
+
     def assert_permit_call(self, call, desc, source, dest, l4_opts):
         kw = call[1]
         self.assertEqual(desc, kw["desc"])
@@ -111,3 +251,10 @@ class DumbManagerTest(unittest.TestCase):
         self.assertEqual(["10.0.0.2"], manager.permits["myredis"])
         manager.revoke_access(instance, "10.0.0.2")
         self.assertEqual([], manager.permits["myredis"])
+
+    def test_grant_and_revoke_access_many(self):
+        instance = storage.Instance(name="myredis", endpoints=None, plan="plus")
+        manager = acl.DumbAccessManager()
+        manager.grant_access_many(instance, ["10.0.0.1", "10.0.0.2", "10.0.0.3"])
+        manager.revoke_access_many(instance, ["10.0.0.1", "10.0.0.3"])
+        self.assertEqual(["10.0.0.2"], manager.permits["myredis"])
@@ -8,7 +8,8 @@ import os
 import mock
 
 from redisapi import plans
-from redisapi.api import manager_by_plan_name, manager_by_instance
+from redisapi.api import manager_by_plan_name, manager_by_instance, provision
+from redisapi.jobs import InstanceExists, JobFailed, JobInProgress
 from redisapi.storage import Instance, MongoStorage
 from redisapi.managers import SharedManager, DockerManager, DockerHaManager
 
@@ -53,22 +54,79 @@ class RedisAPITestCase(unittest.TestCase):
         manager = manager_by_instance(instance)
         self.assertIsInstance(manager, DockerHaManager)
 
-    @mock.patch("redisapi.api.manager_by_plan_name")
-    @mock.patch("redisapi.storage.MongoStorage")
-    def test_add_instance(self, mongo_mock, manager):
-        storage_mock = mongo_mock.return_value
-        fake_mock = mock.Mock()
-        fake_instance = mock.Mock()
-        fake_mock.add_instance.return_value = fake_instance
-        manager.return_value = fake_mock
+    def test_manager_by_instance_of_a_removed_plan(self):
+        os.environ["REDIS_IMAGE"] = "redisapi"
+        os.environ["DOCKER_HOSTS"] = "[]"
+        os.environ["SENTINEL_HOSTS"] = "[]"
+        settings = {"name": "basic-4g", "description": "4GB", "manager": "basic",
+                    "memory": 4294967296}
+        instance = Instance("name", "basic-4g",
+                            [{"host": "host", "port": "port", "container_id": "id"}], settings)
+        manager = manager_by_instance(instance)
+        self.assertIsInstance(manager, DockerManager)
+        self.assertEqual(settings, manager.plan)
 
+    @mock.patch("redisapi.api.provisioning")
+    @mock.patch("redisapi.api.manager_by_plan_name")
+    def test_add_instance(self, manager, provisioning_mock):
         response = self.app.post("/resources",
                                  data={"name": "name", "plan": "basic"})
 
         self.assertEqual(201, response.status_code)
         self.assertEqual("", response.data)
         manager.assert_called_with('basic')
-        storage_mock.add_instance.assert_called_with(fake_instance)
+        provisioning_mock.submit.assert_called_with("name", "basic")
+
+    @mock.patch("redisapi.api.provisioning")
+    @mock.patch("redisapi.api.manager_by_plan_name")
+    def test_add_instance_being_provisioned(self, manager, provisioning_mock):
+        provisioning_mock.submit.side_effect = JobInProgress("in progress")
+
+        response = self.app.post("/resources",
+                                 data={"name": "name", "plan": "basic"})
+
+        self.assertEqual(409, response.status_code)
+        self.assertEqual("in progress", response.data)
+
+    @mock.patch("redisapi.api.provisioning")
+    @mock.patch("redisapi.api.manager_by_plan_name")
+    def test_add_instance_already_provisioned(self, manager, provisioning_mock):
+        provisioning_mock.submit.side_effect = InstanceExists("exists")
+        response = self.app.post("/resources", data={"name": "name", "plan": "basic"})
+        self.assertEqual(409, response.status_code)
+        self.assertEqual("exists", response.data)
+
+    @mock.patch("redisapi.api.provisioning")
+    @mock.patch("redisapi.api.manager_by_plan_name")
+    def test_add_existing_instance(self, manager, provisioning_mock):
+        storage = MongoStorage()
+        storage.add_instance(Instance("existing", "basic", [{"host": "host", "port": "port"}]))
+        self.addCleanup(storage.remove_instance, Instance("existing", "basic", []))
+        response = self.app.post("/resources", data={"name": "existing", "plan": "basic"})
+        self.assertEqual(409, response.status_code)
+        self.assertFalse(provisioning_mock.submit.called)
+
+    @mock.patch("redisapi.api.provisioning")
+    @mock.patch("redisapi.api.manager_by_plan_name")
+    def test_add_instance_provisioning_failed(self, manager, provisioning_mock):
+        provisioning_mock.submit.side_effect = JobFailed("no Docker host")
+        response = self.app.post("/resources", data={"name": "name", "plan": "basic"})
+        self.assertEqual(500, response.status_code)
+        self.assertEqual("no Docker host", response.data)
+
+    @mock.patch("redisapi.api.MongoStorage")
+    @mock.patch("redisapi.api.manager_by_plan_name")
+    def test_provision(self, manager, mongo_mock):
+        fake_instance = mock.Mock()
+        manager.return_value.add_instance.return_value = fake_instance
+        progress = mock.Mock()
+
+        provision({"name": "name", "plan": "basic"}, progress)
+
+        manager.assert_called_with("basic")
+        manager.return_value.add_instance.assert_called_with("name")
+        mongo_mock.return_value.add_instance.assert_called_with(fake_instance)
+        progress.assert_has_calls([mock.call("creating"), mock.call("saving")])
 
     def test_add_instance_with_no_plan(self):
         response = self.app.post("/resources",
@@ -76,15 +134,22 @@ class RedisAPITestCase(unittest.TestCase):
         self.assertEqual(400, response.status_code)
         self.assertEqual("plan is required", response.data)
 
+    def test_add_instance_with_unknown_plan(self):
+        response = self.app.post("/resources",
+                                 data={"name": "name", "plan": "huge"})
+        self.assertEqual(400, response.status_code)
+        self.assertEqual("Unknown plan huge.", response.data)
+
     def test_add_instance_with_empty_plan(self):
         response = self.app.post("/resources",
                                  data={"name": "name", "plan": ""})
         self.assertEqual(400, response.status_code)
         self.assertEqual("plan is required", response.data)
 
+    @mock.patch("redisapi.api.provisioning")
     @mock.patch("redisapi.api.manager_by_instance")
     @mock.patch("redisapi.storage.MongoStorage")
-    def test_remove_instance(self, mongo_mock, manager_mock):
+    def test_remove_instance(self, mongo_mock, manager_mock, provisioning_mock):
         storage_mock = mongo_mock.return_value
         instance_mock = mock.Mock()
         storage_mock.find_instance_by_name.return_value = instance_mock
@@ -94,6 +159,7 @@ class RedisAPITestCase(unittest.TestCase):
         self.assertEqual(200, response.status_code)
         self.assertEqual("", response.data)
         storage_mock.remove_instance.assert_called_with(instance_mock)
+        provisioning_mock.queue.remove.assert_called_with("myinstance")
 
     def test_bind_app(self):
         storage = MongoStorage()
@@ -137,13 +203,85 @@ class RedisAPITestCase(unittest.TestCase):
         self.assertEqual(200, response.status_code)
         self.assertEqual("", response.data)
 
+    @mock.patch("redisapi.api.manager_by_instance")
+    @mock.patch("redisapi.api.MongoStorage")
+    def test_bind_units(self, mongo_mock, manager_mock):
+        instance = mongo_mock.return_value.find_instance_by_name.return_value
+        response = self.app.post("/resources/myinstance/binds",
+                                 data={"unit-host": ["10.0.0.1", "10.0.0.2"]})
+        self.assertEqual(201, response.status_code)
+        mongo_mock.return_value.find_instance_by_name.assert_called_once_with("myinstance")
+        manager_mock.return_value.grant_many.assert_called_with(
+            instance, ["10.0.0.1", "10.0.0.2"])
+
+    def test_bind_and_unbind_units_of_a_docker_instance(self):
+        os.environ["REDIS_IMAGE"] = "redisapi"
+        os.environ["DOCKER_HOSTS"] = "[]"
+        os.environ["SENTINEL_HOSTS"] = "[]"
+        storage = MongoStorage()
+        instance = Instance("dockerinstance", "basic",
+                            [{"host": "host", "port": 49153, "container_id": "id"}])
+        storage.add_instance(instance)
+        self.addCleanup(storage.remove_instance, instance)
+        response = self.app.post("/resources/dockerinstance/binds",
+                                 data={"unit-host": ["10.0.0.1", "10.0.0.2"]})
+        self.assertEqual(201, response.status_code)
+        response = self.app.delete("/resources/dockerinstance/binds",
+                                   data={"unit-host": ["10.0.0.1"]},
+                                   headers={"Content-Type": "application/x-www-form-urlencoded"})
+        self.assertEqual(200, response.status_code)
+
+    def test_bind_units_no_unit_host(self):
+        response = self.app.post("/resources/myinstance/binds")
+        self.assertEqual(400, response.status_code)
+        self.assertEqual("unit-host is required", response.data)
+
+    @mock.patch("redisapi.api.manager_by_instance")
+    @mock.patch("redisapi.api.MongoStorage")
+    def test_unbind_units(self, mongo_mock, manager_mock):
+        instance = mongo_mock.return_value.find_instance_by_name.return_value
+        response = self.app.delete("/resources/myinstance/binds",
+                                   data={"unit-host": ["10.0.0.1", "10.0.0.2"]},
+                                   headers={"Content-Type": "application/x-www-form-urlencoded"})
+        self.assertEqual(200, response.status_code)
+        manager_mock.return_value.revoke_many.assert_called_with(
+            instance, ["10.0.0.1", "10.0.0.2"])
+
+    @mock.patch("redisapi.api.manager_by_instance")
+    @mock.patch("redisapi.api.MongoStorage")
+    def test_unbind_units_shared_plan(self, mongo_mock, manager_mock):
+        manager_mock.return_value = SharedManager()
+        response = self.app.delete("/resources/myinstance/binds",
+                                   data={"unit-host": ["10.0.0.1"]},
+                                   headers={"Content-Type": "application/x-www-form-urlencoded"})
+        self.assertEqual(200, response.status_code)
+
     def test_unbind_unit_no_unit_host(self):
         response = self.app.delete("/resources/myinstance/bind")
         self.assertEqual(400, response.status_code)
         self.assertEqual("unit-host is required", response.data)
 
+    @mock.patch("redisapi.api.provisioning")
+    def test_status_being_provisioned(self, provisioning_mock):
+        provisioning_mock.queue.find.return_value = {"status": "running", "step": "creating"}
+        from redisapi import api
+        content, code = api.status("myinstance")
+        self.assertEqual(202, code)
+        self.assertEqual("creating", content)
+        provisioning_mock.start.assert_called_with()
+
+    @mock.patch("redisapi.api.provisioning")
+    def test_status_provisioning_failed(self, provisioning_mock):
+        provisioning_mock.queue.find.return_value = {"status": "failed", "error": "boom"}
+        from redisapi import api
+        content, code = api.status("myinstance")
+        self.assertEqual(500, code)
+        self.assertEqual("boom", content)
+
+    @mock.patch("redisapi.api.provisioning")
     @mock.patch("redisapi.api.manager_by_instance")
-    def test_status(self, manager_mock):
+    def test_status(self, manager_mock, provisioning_mock):
+        provisioning_mock.queue.find.return_value = None
         fake_manager = mock.Mock()
         fake_manager.is_ok.return_value = False, "error"
         manager_mock.return_value = fake_manager
@@ -152,10 +290,57 @@ class RedisAPITestCase(unittest.TestCase):
         self.assertEqual(500, code)
         self.assertEqual("error", content)
 
+    @mock.patch("redisapi.api.manager_by_instance")
+    @mock.patch("redisapi.api.MongoStorage")
+    def test_metrics(self, mongo_mock, manager_mock):
+        instance = mongo_mock.return_value.find_instance_by_name.return_value
+        manager_mock.return_value.metrics.return_value = {"name": "myinstance"}
+        response = self.app.get("/resources/myinstance/metrics")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"name": "myinstance"}, json.loads(response.data))
+        manager_mock.return_value.metrics.assert_called_with(instance)
+
+    @mock.patch("redisapi.api.manager_by_instance")
+    @mock.patch("redisapi.api.MongoStorage")
+    def test_metrics_not_available(self, mongo_mock, manager_mock):
+        manager_mock.return_value = object()
+        response = self.app.get("/resources/myinstance/metrics")
+        self.assertEqual(404, response.status_code)
+
+    @mock.patch("redisapi.api.manager_by_instance")
+    @mock.patch("redisapi.api.MongoStorage")
+    def test_metrics_errors_are_not_hidden(self, mongo_mock, manager_mock):
+        manager_mock.return_value.metrics.side_effect = AttributeError("no info")
+        response = self.app.get("/resources/myinstance/metrics")
+        self.assertEqual(500, response.status_code)
+
+    @mock.patch("redisapi.api.manager_by_instance")
+    @mock.patch("redisapi.api.MongoStorage")
+    def test_metrics_of_unknown_instance(self, mongo_mock, manager_mock):
+        mongo_mock.return_value.find_instance_by_name.return_value = None
+        response = self.app.get("/resources/myinstance/metrics")
+        self.assertEqual(404, response.status_code)
+        self.assertFalse(manager_mock.called)
+
     def test_plans(self):
-        os.environ["REDIS_API_PLANS"] = '["development", "basic", "plus"]'
+        os.environ["REDIS_API_PLANS"] = '["development", "basic", "plus", "dense", "cluster"]'
         response = self.app.get("/resources/plans")
         self.assertEqual(200, response.status_code)
         data = json.loads(response.data)
-        expected = plans.plans
+        expected = [{"name": plan["name"], "description": plan["description"]}
+                    for plan in plans.plans]
         self.assertListEqual(expected, data)
+
+    def test_instances_stats(self):
+        response = self.app.get("/stats/instances")
+        self.assertEqual(200, response.status_code)
+        data = json.loads(response.data)
+        self.assertIn("hits", data)
+        self.assertIn("misses", data)
+
+    def test_prometheus_metrics(self):
+        self.app.get("/resources/plans")
+        response = self.app.get("/metrics")
+        self.assertEqual(200, response.status_code)
+        self.assertIn('route="/resources/plans"', response.data)
+        self.assertIn("redisapi_backend_duration_seconds", response.data)
@@ -0,0 +1,122 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import socket
+import time
+import unittest
+
+import docker
+import redis
+
+from benchmarks.api import percentile
+from benchmarks.servers import DockerServer, FakeRedisServer, FakeSentinel, Faults, RespHub
+from benchmarks.standins import FakeDocker, FakeDockerPool
+from redisapi.sentinels import Sentinels, SentinelQuorumError
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(50, percentile(values, 0.5))
+        self.assertEqual(99, percentile(values, 0.99))
+        self.assertEqual(100, percentile(values, 1))
+
+    def test_percentile_of_nothing(self):
+        self.assertIsNone(percentile([], 0.5))
+
+
+class FakeDockerTest(unittest.TestCase):
+
+    def test_containers(self):
+        client = FakeDocker("http://docker-0:4243")
+        output = client.create_container("redisapi/redis", ports=[49153])
+        client.start(output["Id"])
+        self.assertTrue(client.containers[output["Id"]]["Running"])
+        self.assertEqual({"Containers": 1}, client.info())
+        client.stop(output["Id"])
+        client.remove_container(output["Id"])
+        self.assertEqual({}, client.containers)
+
+    def test_pool_keeps_a_client_per_host(self):
+        pool = FakeDockerPool()
+        self.assertIs(pool.get("http://docker-0:4243"), pool.get("http://docker-0:4243"))
+        self.assertEqual("http://docker-0:4243", pool.get("http://docker-0:4243").base_url)
+
+
+class DockerServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = DockerServer(port=0).serve()
+        self.addCleanup(self.server.shutdown)
+        self.client = docker.Client(base_url=self.server.url)
+
+    def test_containers(self):
+        port = self.free_port()
+        output = self.client.create_container("redisapi/redis", ports=[port])
+        self.client.start(output["Id"], port_bindings={port: ("0.0.0.0", port)})
+        self.assertEqual({"Containers": 1, "Running": 1}, self.client.info())
+        self.assertTrue(redis.StrictRedis("127.0.0.1", port).ping())
+        self.client.stop(output["Id"])
+        self.client.remove_container(output["Id"])
+        self.assertEqual({"Containers": 0, "Running": 0}, self.client.info())
+
+    def test_unknown_container(self):
+        with self.assertRaises(docker.errors.APIError):
+            self.client.start("abc123")
+
+    def test_failures(self):
+        self.server.faults.failure_rate = 1
+        with self.assertRaises(docker.errors.APIError):
+            self.client.create_container("redisapi/redis")
+
+    def free_port(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+
+class RespHubTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hub = RespHub()
+
+    def test_sentinel(self):
+        host, port = self.hub.listen("127.0.0.1", 0, FakeSentinel(Faults()))
+        sentinels = Sentinels(["http://{}:{}".format(host, port)])
+        self.assertEqual({}, sentinels.execute([["monitor", "master", "10.0.0.1", "49153", "1"],
+                                                ["set", "master", "parallel-syncs", "1"]]))
+        self.assertEqual({}, sentinels.execute([["remove", "master"]]))
+        with self.assertRaises(SentinelQuorumError):
+            sentinels.execute([["remove", "master"]])
+
+    def test_redis(self):
+        host, port = self.hub.listen("127.0.0.1", 0, FakeRedisServer(Faults()))
+        client = redis.StrictRedis(host, port)
+        self.assertEqual("master", client.info("replication")["role"])
+        client.slaveof("127.0.0.1", 49153)
+        info = client.info("replication")
+        self.assertEqual(("slave", "up"), (info["role"], info["master_link_status"]))
+
+    def test_failures(self):
+        host, port = self.hub.listen("127.0.0.1", 0, FakeRedisServer(Faults(failure_rate=1)))
+        with self.assertRaises(redis.ResponseError):
+            redis.StrictRedis(host, port).ping()
+
+    def test_close(self):
+        host, port = self.hub.listen("127.0.0.1", 0, FakeRedisServer(Faults()))
+        self.assertTrue(redis.StrictRedis(host, port).ping())
+        self.hub.close(host, port)
+        time.sleep(0.1)
+        with self.assertRaises(redis.ConnectionError):
+            redis.StrictRedis(host, port).ping()
+
+    def test_stop(self):
+        host, port = self.hub.listen("127.0.0.1", 0, FakeRedisServer(Faults()))
+        self.hub.stop()
+        self.assertFalse(self.hub.thread.is_alive())
+        with self.assertRaises(redis.ConnectionError):
+            redis.StrictRedis(host, port).ping()
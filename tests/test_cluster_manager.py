@@ -0,0 +1,175 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import json
+import os
+import unittest
+
+import mock
+import redis
+
+from docker.utils import create_host_config
+
+from redisapi.storage import Instance
+
+
+class ClusterManagerTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        os.environ["REDIS_IMAGE"] = "redisapi"
+        self.addCleanup(self.remove_env, "REDIS_IMAGE")
+        os.environ["DOCKER_HOSTS"] = '["http://host1.com:4243", "http://host2.com:4243"]'
+        self.addCleanup(self.remove_env, "DOCKER_HOSTS")
+        os.environ["SENTINEL_HOSTS"] = "[]"
+        self.addCleanup(self.remove_env, "SENTINEL_HOSTS")
+        os.environ["CLUSTER_MASTERS"] = "2"
+        self.addCleanup(self.remove_env, "CLUSTER_MASTERS")
+        from redisapi.managers import ClusterManager
+        self.manager = ClusterManager()
+        self.manager.address = lambda host: "10.0.0.{}".format(host[4])
+        self.manager.health_checker = mock.Mock()
+        self.manager.scheduler = mock.Mock()
+        self.manager.scheduler.return_value.spread.return_value = [
+            ["http://host1.com:4243", "http://host2.com:4243"],
+            ["http://host2.com:4243", "http://host1.com:4243"],
+        ]
+        self.clients = {}
+        self.manager.client = self.client
+        self.ports = iter(range(49153, 49200))
+        self.manager.get_port_by_host = lambda host: next(self.ports)
+        self.manager.release_port = mock.Mock()
+
+    def client(self, url):
+        if url not in self.clients:
+            client = self.clients[url] = mock.Mock(base_url=url)
+            client.create_container.return_value = {"Id": "id"}
+        return self.clients[url]
+
+    def test_run_cluster_container(self):
+        client = self.client("http://host1.com:4243")
+        self.manager.run_cluster_container(client, "host1.com", 49153, 49154)
+        client.create_container.assert_called_with(
+            "redisapi", command="", ports=[6379, 16379], cpu_shares=None,
+            environment={"REDIS_PORT": 6379, "REDIS_MAXMEMORY": 1073741824,
+                         "REDIS_CLUSTER_ANNOUNCE_IP": "10.0.0.1",
+                         "REDIS_CLUSTER_ANNOUNCE_PORT": 49153,
+                         "REDIS_CLUSTER_ANNOUNCE_BUS_PORT": 49154},
+            host_config=create_host_config(port_bindings={6379: ('0.0.0.0', 49153),
+                                                          16379: ('0.0.0.0', 49154)},
+                                           mem_limit=1610612736))
+        client.start.assert_called_with("id")
+
+    def test_add_instance(self):
+        self.manager.create_cluster = mock.Mock()
+        instance = self.manager.add_instance("myinstance")
+        self.assertEqual("cluster", instance.plan)
+        self.assertEqual(4, len(instance.endpoints))
+        self.assertEqual(["host1.com", "host2.com", "host2.com", "host1.com"],
+                         [endpoint["host"] for endpoint in instance.endpoints])
+        for endpoint in instance.endpoints:
+            self.assertEqual(endpoint["port"] + 1, endpoint["bus_port"])
+        self.manager.scheduler.return_value.spread.assert_called_with(2, 2, 1073741824)
+        self.manager.create_cluster.assert_called_with(instance.endpoints)
+        self.assertEqual(4, self.manager.health_checker.return_value.add.call_count)
+
+    @mock.patch("redis.StrictRedis")
+    def test_create_cluster(self, redis_mock):
+        nodes = [mock.Mock(name="node{}".format(i)) for i in range(4)]
+        redis_mock.side_effect = nodes
+        for i, node in enumerate(nodes):
+            replies = {"MYID": "id{}".format(i), "INFO": "cluster_state:ok\r\n"}
+            node.execute_command.side_effect = (
+                lambda replies: lambda *args: replies.get(args[1], "OK"))(replies)
+        endpoints = [{"host": "host{}.com".format(1 + i % 2), "port": 49153 + 2 * i,
+                      "bus_port": 49154 + 2 * i} for i in range(4)]
+        self.manager.create_cluster(endpoints)
+        nodes[0].execute_command.assert_any_call("CLUSTER", "MEET", "10.0.0.2", 49155, 49156)
+        nodes[0].execute_command.assert_any_call("CLUSTER", "MEET", "10.0.0.1", 49157, 49158)
+        nodes[0].execute_command.assert_any_call("CLUSTER", "ADDSLOTS", *range(0, 8192))
+        nodes[2].execute_command.assert_any_call("CLUSTER", "ADDSLOTS", *range(8192, 16384))
+        nodes[1].execute_command.assert_any_call("CLUSTER", "REPLICATE", "id0")
+        nodes[3].execute_command.assert_any_call("CLUSTER", "REPLICATE", "id2")
+        for node in nodes:
+            node.execute_command.assert_any_call("CLUSTER", "INFO")
+
+    @mock.patch("time.sleep")
+    @mock.patch("redis.StrictRedis")
+    def test_create_cluster_waits_for_the_master(self, redis_mock, sleep):
+        os.environ["CLUSTER_MASTERS"] = "1"
+        from redisapi.managers import ClusterManager
+        manager = ClusterManager()
+        manager.address = self.manager.address
+        master, replica = mock.Mock(), mock.Mock()
+        redis_mock.side_effect = [master, replica]
+        master.execute_command.side_effect = lambda *args: {
+            "MYID": "id0", "INFO": "cluster_state:ok"}.get(args[1], "OK")
+        replies = iter([redis.ResponseError("Unknown node id0"), "OK"])
+
+        def replica_command(*args):
+            if args[1] == "REPLICATE":
+                reply = next(replies)
+                if isinstance(reply, Exception):
+                    raise reply
+                return reply
+            return {"MYID": "id1", "INFO": "cluster_state:ok"}.get(args[1], "OK")
+        replica.execute_command.side_effect = replica_command
+        manager.create_cluster([{"host": "host1.com", "port": 49153, "bus_port": 49154},
+                                {"host": "host2.com", "port": 49153, "bus_port": 49154}])
+        self.assertEqual(2, len([c for c in replica.execute_command.call_args_list
+                                 if c[0][1] == "REPLICATE"]))
+
+    @mock.patch("time.time")
+    @mock.patch("time.sleep")
+    def test_wait_times_out(self, sleep, time_mock):
+        os.environ["CLUSTER_TIMEOUT"] = "1"
+        self.addCleanup(self.remove_env, "CLUSTER_TIMEOUT")
+        time_mock.side_effect = [0, 0.5, 1.5]
+        call = mock.Mock(side_effect=redis.ConnectionError("refused"))
+        with self.assertRaises(redis.ConnectionError):
+            self.manager.wait(call)
+        self.assertEqual(2, call.call_count)
+
+    def test_add_instance_failure_removes_the_nodes(self):
+        self.manager.create_cluster = mock.Mock(side_effect=redis.ConnectionError("refused"))
+        with self.assertRaises(redis.ConnectionError):
+            self.manager.add_instance("myinstance")
+        self.assertEqual(8, self.manager.release_port.call_count)
+        self.assertEqual(4, self.manager.health_checker.return_value.remove.call_count)
+        for client in self.clients.values():
+            self.assertEqual(2, client.remove_container.call_count)
+
+    def test_bind(self):
+        instance = Instance("myinstance", "cluster", [
+            {"host": "host1.com", "port": 49153, "bus_port": 49154, "container_id": "a"},
+            {"host": "host2.com", "port": 49153, "bus_port": 49154, "container_id": "b"},
+        ])
+        envs = self.manager.bind(instance)
+        self.assertEqual({"REDIS_HOST": "host1.com", "REDIS_PORT": "49153",
+                          "REDIS_CLUSTER_NODES": json.dumps(["host1.com:49153",
+                                                             "host2.com:49153"])}, envs)
+
+    def test_remove_instance(self):
+        instance = Instance("myinstance", "cluster", [
+            {"host": "host1.com", "port": 49153, "bus_port": 49154, "container_id": "a"},
+        ])
+        self.manager.remove_instance(instance)
+        client = self.clients["http://host1.com:4243"]
+        client.stop.assert_called_with("a")
+        client.remove_container.assert_called_with("a")
+        self.manager.release_port.assert_has_calls([mock.call("host1.com", 49153),
+                                                   mock.call("host1.com", 49154)])
+        self.manager.health_checker.return_value.remove.assert_called_with("host1.com", 49153)
+
+    @mock.patch("redisapi.managers.status_checker")
+    def test_is_ok(self, status_checker):
+        status_checker.check_instance.return_value = (True, "host1.com:49153 is master")
+        status_checker.cached.side_effect = lambda key, check: check()
+        status_checker.client.return_value.execute_command.return_value = "cluster_state:fail"
+        instance = Instance("myinstance", "cluster", [{"host": "host1.com", "port": 49153}])
+        self.assertEqual((False, "cluster is fail; host1.com:49153 is master"),
+                         self.manager.is_ok(instance))
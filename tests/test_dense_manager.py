@@ -0,0 +1,156 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+import os
+import mock
+
+from redisapi.storage import Instance
+
+
+class DenseManagerTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        os.environ["DENSE_REDIS_SERVERS"] = '["redis1:6379", "redis2:6379"]'
+        self.addCleanup(self.remove_env, "DENSE_REDIS_SERVERS")
+        os.environ["DENSE_REDIS_PASSWORD"] = "secret"
+        self.addCleanup(self.remove_env, "DENSE_REDIS_PASSWORD")
+        from redisapi.managers import DenseManager
+        self.manager = DenseManager()
+        self.slots = mock.Mock()
+        self.slots.reserve.return_value = ("redis2:6379", 3)
+        self.manager.slots = lambda: self.slots
+        patcher = mock.patch("redis.StrictRedis")
+        self.redis = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def acl(self):
+        os.environ["DENSE_ISOLATION"] = "acl"
+        self.addCleanup(self.remove_env, "DENSE_ISOLATION")
+        from redisapi.managers import DenseManager
+        manager = DenseManager()
+        manager.slots = lambda: self.slots
+        return manager
+
+    def test_slots(self):
+        from redisapi.managers import DenseManager
+        slots = DenseManager().slots()
+        self.assertEqual((["redis1:6379", "redis2:6379"], 1, 15),
+                         (slots.servers, slots.first, slots.last))
+        os.environ["DENSE_ISOLATION"] = "acl"
+        self.addCleanup(self.remove_env, "DENSE_ISOLATION")
+        slots = DenseManager().slots()
+        self.assertEqual((0, 999), (slots.first, slots.last))
+
+    def test_add_instance(self):
+        from redisapi.managers import DenseManager
+        self.remove_env("DENSE_REDIS_PASSWORD")
+        manager = DenseManager()
+        manager.slots = lambda: self.slots
+        instance = manager.add_instance("myinstance")
+        self.assertEqual("dense", instance.plan)
+        self.assertEqual([{"host": "redis2", "port": "6379", "slot": 3, "db": 3}],
+                         instance.endpoints)
+        self.assertFalse(self.redis.called)
+
+    def test_add_instance_refuses_to_share_the_password(self):
+        from redisapi.managers import SharedPassword
+        with self.assertRaises(SharedPassword):
+            self.manager.add_instance("myinstance")
+        self.assertFalse(self.slots.reserve.called)
+
+    def test_add_instance_with_acl(self):
+        self.redis.return_value.execute_command.return_value = None
+        instance = self.acl().add_instance("myinstance")
+        endpoint = instance.endpoints[0]
+        self.assertEqual(("tenant:myinstance", "myinstance:"),
+                         (endpoint["user"], endpoint["prefix"]))
+        self.assertEqual(32, len(endpoint["password"]))
+        self.redis.assert_called_with(host="redis2", port=6379, db=0, password="secret",
+                                      socket_timeout=2.0, socket_connect_timeout=2.0)
+        self.assertEqual([
+            mock.call("ACL", "GETUSER", "tenant:myinstance"),
+            mock.call("ACL", "SETUSER", "tenant:myinstance", "reset", "on",
+                      ">" + endpoint["password"], "~myinstance:*", "+@all", "-@admin",
+                      "-@dangerous", "-select"),
+        ], self.redis.return_value.execute_command.call_args_list)
+
+    def test_add_instance_with_acl_keeps_existing_users(self):
+        from redisapi.managers import TenantUserExists
+        self.redis.return_value.execute_command.return_value = ["flags", ["on"]]
+        with self.assertRaises(TenantUserExists):
+            self.acl().add_instance("myinstance")
+        self.redis.return_value.execute_command.assert_called_once_with(
+            "ACL", "GETUSER", "tenant:myinstance")
+        self.slots.release.assert_called_with("redis2:6379", 3)
+
+    def test_add_instance_failure_releases_the_slot(self):
+        self.redis.return_value.execute_command.side_effect = Exception("unknown command")
+        with self.assertRaises(Exception):
+            self.acl().add_instance("myinstance")
+        self.slots.release.assert_called_with("redis2:6379", 3)
+
+    def test_bind(self):
+        instance = Instance("myinstance", "dense",
+                            [{"host": "redis2", "port": "6379", "slot": 3, "db": 3}])
+        self.assertEqual({"REDIS_HOST": "redis2", "REDIS_PORT": "6379", "REDIS_DB": "3"},
+                         self.manager.bind(instance))
+
+    def test_bind_with_acl(self):
+        instance = Instance("myinstance", "dense", [{
+            "host": "redis2", "port": "6379", "slot": 3, "user": "tenant:myinstance",
+            "password": "s3cr3t", "prefix": "myinstance:"}])
+        self.assertEqual({"REDIS_HOST": "redis2", "REDIS_PORT": "6379",
+                          "REDIS_USER": "tenant:myinstance", "REDIS_PASSWORD": "s3cr3t",
+                          "REDIS_KEY_PREFIX": "myinstance:"}, self.manager.bind(instance))
+
+    def test_remove_instance(self):
+        instance = Instance("myinstance", "dense",
+                            [{"host": "redis2", "port": "6379", "slot": 3, "db": 3}])
+        self.manager.remove_instance(instance)
+        self.redis.assert_called_with(host="redis2", port=6379, db=3, password="secret",
+                                      socket_timeout=2.0, socket_connect_timeout=2.0)
+        self.redis.return_value.flushdb.assert_called_once_with()
+        self.slots.release.assert_called_with("redis2:6379", 3)
+
+    def test_remove_instance_with_acl(self):
+        client = self.redis.return_value
+        client.scan_iter.return_value = iter(["myinstance:{}".format(i) for i in range(1500)])
+        instance = Instance("myinstance", "dense", [{
+            "host": "redis2", "port": "6379", "slot": 3, "user": "tenant:myinstance",
+            "password": "s3cr3t", "prefix": "myinstance:"}])
+        self.acl().remove_instance(instance)
+        client.execute_command.assert_called_with("ACL", "DELUSER", "tenant:myinstance")
+        client.scan_iter.assert_called_with(match="myinstance:*", count=1000)
+        self.assertEqual([1000, 500], [len(c[0]) for c in client.delete.call_args_list])
+        self.slots.release.assert_called_with("redis2:6379", 3)
+
+    @mock.patch("redisapi.managers.status_checker")
+    def test_metrics(self, status_checker):
+        admin = status_checker.client.return_value
+        admin.info.return_value = {"db3": {"keys": 20}, "instantaneous_ops_per_sec": 7,
+                                   "used_memory": 4096}
+        admin.client_list.return_value = [{"db": "3"}, {"db": "0"}, {"db": "3"}]
+        client = self.redis.return_value
+        client.scan_iter.return_value = iter(["a", "b"])
+        client.execute_command.side_effect = [100, 60]
+        instance = Instance("myinstance", "dense",
+                            [{"host": "redis2", "port": "6379", "slot": 3, "db": 3}])
+        result = self.manager.metrics(instance)
+        status_checker.client.assert_called_with("redis2", "6379", "secret")
+        self.assertEqual({"host": "redis2", "port": "6379", "keys": 20, "used_memory": 1600,
+                          "connected_clients": 2, "server_ops_per_sec": 7,
+                          "server_used_memory": 4096}, result["endpoints"][0])
+
+    @mock.patch("redisapi.managers.status_checker")
+    def test_is_ok(self, status_checker):
+        status_checker.ping.return_value = (True, "")
+        instance = Instance("myinstance", "dense",
+                            [{"host": "redis2", "port": "6379", "slot": 3, "db": 3}])
+        self.assertEqual((True, ""), self.manager.is_ok(instance))
+        status_checker.ping.assert_called_with("redis2", "6379", "secret")
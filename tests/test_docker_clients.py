@@ -0,0 +1,80 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+import unittest
+
+import mock
+import requests
+
+from redisapi.docker_clients import DockerClientPool
+
+
+class DockerClientPoolTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        self.pool = DockerClientPool()
+        self.addCleanup(self.pool.clear)
+
+    def test_get_reuses_client(self):
+        client = self.pool.get("http://host1.com:4243")
+        self.assertEqual("http://host1.com:4243", client.base_url)
+        self.assertIs(client, self.pool.get("http://host1.com:4243"))
+        self.assertIsNot(client, self.pool.get("http://host2.com:4243"))
+
+    def test_get_after_fork(self):
+        client = self.pool.get("http://host1.com:4243")
+        with mock.patch("os.getpid") as getpid:
+            getpid.return_value = -1
+            self.assertIsNot(client, self.pool.get("http://host1.com:4243"))
+
+    def test_settings_environ(self):
+        os.environ["DOCKER_TIMEOUT"] = "5"
+        self.addCleanup(self.remove_env, "DOCKER_TIMEOUT")
+        os.environ["DOCKER_POOL_MAXSIZE"] = "3"
+        self.addCleanup(self.remove_env, "DOCKER_POOL_MAXSIZE")
+        client = self.pool.get("http://host1.com:4243")
+        self.assertEqual(5, client.timeout)
+        self.assertEqual(3, client.get_adapter("http://host1.com:4243")._pool_maxsize)
+
+    def test_mark_failed(self):
+        client = self.pool.get("http://host1.com:4243")
+        self.pool.mark_failed("http://host1.com:4243")
+        self.assertFalse(self.pool.is_alive("http://host1.com:4243"))
+        self.assertIsNot(client, self.pool.get("http://host1.com:4243"))
+        self.pool.mark_alive("http://host1.com:4243")
+        self.assertTrue(self.pool.is_alive("http://host1.com:4243"))
+
+    def test_host_cooldown_environ(self):
+        os.environ["DOCKER_HOST_COOLDOWN"] = "0"
+        self.addCleanup(self.remove_env, "DOCKER_HOST_COOLDOWN")
+        self.pool.mark_failed("http://host1.com:4243")
+        self.assertTrue(self.pool.is_alive("http://host1.com:4243"))
+
+    def test_alive(self):
+        hosts = ["http://host1.com:4243", "http://host2.com:4243"]
+        self.pool.mark_failed("http://host1.com:4243")
+        self.assertEqual(["http://host2.com:4243"], self.pool.alive(hosts))
+        self.pool.mark_failed("http://host2.com:4243")
+        self.assertEqual(hosts, self.pool.alive(hosts))
+
+    @mock.patch("requests.Session.request")
+    def test_client_reports_connection_errors(self, request):
+        request.side_effect = requests.ConnectionError()
+        client = self.pool.get("http://host1.com:4243")
+        with self.assertRaises(requests.ConnectionError):
+            client.stop("12")
+        self.assertFalse(self.pool.is_alive("http://host1.com:4243"))
+
+    @mock.patch("requests.Session.request")
+    def test_client_reports_success(self, request):
+        request.return_value.status_code = 204
+        self.pool.mark_failed("http://host1.com:4243")
+        client = self.pool.get("http://host1.com:4243")
+        client.stop("12")
+        self.assertTrue(self.pool.is_alive("http://host1.com:4243"))
@@ -7,6 +7,8 @@ import mock
 import os
 import json
 
+from docker.utils import create_host_config
+
 from redisapi.storage import Instance, MongoStorage
 
 
@@ -37,6 +39,7 @@ class DockerManagerTest(unittest.TestCase):
 
     def tearDown(self):
         self.storage.db().instances.remove()
+        self.storage.db().ports.remove()
 
     def test_client(self):
         os.environ["DOCKER_HOSTS"] = '["http://host1.com:4243", \
@@ -108,13 +111,13 @@ class DockerManagerTest(unittest.TestCase):
         self.manager.client().create_container.assert_called_with(
             self.manager.image_name,
             command="",
-            environment={'REDIS_PORT': 49153},
-            ports=[49153]
-        )
-        self.manager.client().start.assert_called_with(
-            "12",
-            port_bindings={49153: ('0.0.0.0', 49153)}
+            environment={'REDIS_PORT': 49153, 'REDIS_MAXMEMORY': 1073741824},
+            ports=[49153],
+            cpu_shares=None,
+            host_config=create_host_config(port_bindings={49153: ('0.0.0.0', 49153)},
+                                           mem_limit=1610612736),
         )
+        self.manager.client().start.assert_called_with("12")
         add_mock.add.assert_called_with("localhost", 49153)
         endpoint = instance.endpoints[0]
         self.assertEqual(instance.name, "name")
@@ -148,6 +151,17 @@ class DockerManagerTest(unittest.TestCase):
         self.manager.remove_from_sentinel.assert_called_with(
             instance.name)
 
+    def test_remove_instance_releases_port(self):
+        self.manager.remove_from_sentinel = mock.Mock()
+        self.manager.release_port = mock.Mock()
+        instance = Instance(
+            name="name",
+            plan="basic",
+            endpoints=[{"host": "host", "port": 123, "container_id": "12"}],
+        )
+        self.manager.remove_instance(instance)
+        self.manager.release_port.assert_called_with("host", 123)
+
     def test_bind(self):
         instance = Instance(
             name="name",
@@ -183,52 +197,49 @@ class DockerManagerTest(unittest.TestCase):
 
     @mock.patch("redis.StrictRedis")
     def test_config_sentinels(self, redis_mock):
+        pipeline = redis_mock.return_value.pipeline
+        sentinel, execute = pipeline.return_value.execute_command, pipeline.return_value.execute
         master = {"host": "localhost", "port": "3333"}
         self.manager.config_sentinels("master_name", master)
 
-        calls = []
         sentinels = [
             {"host": u"host1.com", "port": u"4243"},
             {"host": u"localhost", "port": u"4243"},
             {"host": u"host2.com", "port": u"4243"},
         ]
-        for sentinel in sentinels:
-            host, port = sentinel["host"], sentinel["port"]
-            sentinel_calls = [
-                mock.call(host=host, port=port),
-                mock.call().sentinel(
-                    'monitor', 'master_name', 'localhost', '3333', '1'),
-                mock.call().sentinel(
-                    'set', 'master_name', 'down-after-milliseconds', '5000'),
-                mock.call().sentinel(
-                    'set', 'master_name', 'failover-timeout', '60000'),
-                mock.call().sentinel(
-                    'set', 'master_name', 'parallel-syncs', '1'),
-            ]
-            calls.extend(sentinel_calls)
-
-        redis_mock.assert_has_calls(calls)
+        redis_mock.assert_has_calls([
+            mock.call(host=s["host"], port=s["port"],
+                      socket_timeout=5.0, socket_connect_timeout=5.0)
+            for s in sentinels], any_order=True)
+        pipeline.assert_called_with(transaction=False)
+        commands = [
+            mock.call('SENTINEL', 'monitor', 'master_name', 'localhost', '3333', '1'),
+            mock.call('SENTINEL', 'set', 'master_name', 'down-after-milliseconds', '5000'),
+            mock.call('SENTINEL', 'set', 'master_name', 'failover-timeout', '60000'),
+            mock.call('SENTINEL', 'set', 'master_name', 'parallel-syncs', '1'),
+        ]
+        calls = sentinel.call_args_list
+        self.assertEqual(12, len(calls))
+        for command in commands:
+            self.assertEqual(3, calls.count(command))
+        self.assertEqual(3, len(execute.call_args_list))
 
     @mock.patch("redis.StrictRedis")
     def test_remove_from_sentinel(self, redis_mock):
+        sentinel = redis_mock.return_value.pipeline.return_value.execute_command
         self.manager.remove_from_sentinel("master_name")
 
-        calls = []
         sentinels = [
             {"host": u"host1.com", "port": u"4243"},
             {"host": u"localhost", "port": u"4243"},
             {"host": u"host2.com", "port": u"4243"},
         ]
-        for sentinel in sentinels:
-            host, port = sentinel["host"], sentinel["port"]
-            sentinel_calls = [
-                mock.call(host=host, port=port),
-                mock.call().sentinel(
-                    'remove', 'master_name'),
-            ]
-            calls.extend(sentinel_calls)
-
-        redis_mock.assert_has_calls(calls)
+        redis_mock.assert_has_calls([
+            mock.call(host=s["host"], port=s["port"],
+                      socket_timeout=5.0, socket_connect_timeout=5.0)
+            for s in sentinels], any_order=True)
+        self.assertEqual([mock.call('SENTINEL', 'remove', 'master_name')] * 3,
+                         sentinel.call_args_list)
 
     def test_port_range_start(self):
         self.assertEqual(49153, self.manager.port_range_start)
@@ -245,3 +256,9 @@ class DockerManagerTest(unittest.TestCase):
         )
         self.storage.add_instance(instance)
         self.assertEqual(49154, self.manager.get_port_by_host("newhost"))
+
+    def test_get_port_reuses_released_port(self):
+        self.assertEqual(49153, self.manager.get_port_by_host("newhost"))
+        self.assertEqual(49154, self.manager.get_port_by_host("newhost"))
+        self.manager.release_port("newhost", 49153)
+        self.assertEqual(49153, self.manager.get_port_by_host("newhost"))
@@ -4,9 +4,12 @@
 
 import mock
 import os
+import threading
 import unittest
 import json
 
+from docker.utils import create_host_config
+
 from redisapi.hc import FakeHealthCheck
 from redisapi.managers import DockerHaManager
 from redisapi.storage import Instance, MongoStorage
@@ -30,6 +33,10 @@ class DockerHaManagerTest(unittest.TestCase):
         self.manager = DockerHaManager()
         self.storage = MongoStorage()
 
+    def tearDown(self):
+        self.storage.db().instances.remove()
+        self.storage.db().ports.remove()
+
     def test_hc(self):
         self.assertIsInstance(self.manager.health_checker(), FakeHealthCheck)
 
@@ -50,31 +57,32 @@ class DockerHaManagerTest(unittest.TestCase):
 
     @mock.patch("redis.StrictRedis")
     def test_config_sentinels(self, redis_mock):
+        pipeline = redis_mock.return_value.pipeline
+        sentinel, execute = pipeline.return_value.execute_command, pipeline.return_value.execute
         master = {"host": "localhost", "port": "3333"}
         self.manager.config_sentinels("master_name", master)
 
-        calls = []
         sentinels = [
             {"host": u"host1.com", "port": u"4243"},
             {"host": u"localhost", "port": u"4243"},
             {"host": u"host2.com", "port": u"4243"},
         ]
-        for sentinel in sentinels:
-            host, port = sentinel["host"], sentinel["port"]
-            sentinel_calls = [
-                mock.call(host=host, port=port),
-                mock.call().sentinel(
-                    'monitor', 'master_name', 'localhost', '3333', '1'),
-                mock.call().sentinel(
-                    'set', 'master_name', 'down-after-milliseconds', '5000'),
-                mock.call().sentinel(
-                    'set', 'master_name', 'failover-timeout', '60000'),
-                mock.call().sentinel(
-                    'set', 'master_name', 'parallel-syncs', '1'),
-            ]
-            calls.extend(sentinel_calls)
-
-        redis_mock.assert_has_calls(calls)
+        redis_mock.assert_has_calls([
+            mock.call(host=s["host"], port=s["port"],
+                      socket_timeout=5.0, socket_connect_timeout=5.0)
+            for s in sentinels], any_order=True)
+        pipeline.assert_called_with(transaction=False)
+        commands = [
+            mock.call('SENTINEL', 'monitor', 'master_name', 'localhost', '3333', '1'),
+            mock.call('SENTINEL', 'set', 'master_name', 'down-after-milliseconds', '5000'),
+            mock.call('SENTINEL', 'set', 'master_name', 'failover-timeout', '60000'),
+            mock.call('SENTINEL', 'set', 'master_name', 'parallel-syncs', '1'),
+        ]
+        calls = sentinel.call_args_list
+        self.assertEqual(12, len(calls))
+        for command in commands:
+            self.assertEqual(3, calls.count(command))
+        self.assertEqual(3, len(execute.call_args_list))
 
     @mock.patch("redis.StrictRedis")
     def test_slave_of(self, redis_mock):
@@ -112,17 +120,19 @@ class DockerHaManagerTest(unittest.TestCase):
         self.manager.client().create_container.assert_called_with(
             self.manager.image_name,
             command="",
-            environment={'REDIS_PORT': 49153},
-            ports=[49153]
-        )
-        self.manager.client().start.assert_called_with(
-            "12",
-            port_bindings={49153: ('0.0.0.0', 49153)}
+            environment={'REDIS_PORT': 49153, 'REDIS_MAXMEMORY': 1073741824},
+            ports=[49153],
+            cpu_shares=None,
+            host_config=create_host_config(port_bindings={49153: ('0.0.0.0', 49153)},
+                                           mem_limit=1610612736),
         )
+        self.manager.client().start.assert_called_with("12")
         add_mock.add.assert_called_with("localhost", 49153)
         expected_endpoints = [
-            {"container_id": "12", "host": "localhost", "port": 49153},
-            {"container_id": "12", "host": "localhost", "port": 49153},
+            {"container_id": "12", "host": "localhost", "port": 49153,
+             "memory": 1073741824},
+            {"container_id": "12", "host": "localhost", "port": 49153,
+             "memory": 1073741824},
         ]
         self.assertEqual(instance.name, "name")
         self.assertListEqual(instance.endpoints, expected_endpoints)
@@ -132,6 +142,28 @@ class DockerHaManagerTest(unittest.TestCase):
         self.manager.config_sentinels.assert_called_with(
             "name", expected_endpoints[0])
 
+    def test_add_instance_starts_master_and_slave_concurrently(self):
+        slave_started = threading.Event()
+        master = {"host": "host1.com", "port": 49153, "container_id": "1"}
+        slave = {"host": "host2.com", "port": 49153, "container_id": "2"}
+
+        def start_master(name, host):
+            self.assertTrue(slave_started.wait(5))
+            return master
+
+        def start_slave(host):
+            slave_started.set()
+            return slave
+
+        self.manager.start_master = start_master
+        self.manager.start_slave = start_slave
+        self.manager.slave_of = mock.Mock()
+
+        instance = self.manager.add_instance("name")
+
+        self.assertListEqual([master, slave], instance.endpoints)
+        self.manager.slave_of.assert_called_once_with(master, slave)
+
     def test_remove_instance(self):
         remove_mock = mock.Mock()
         self.manager.remove_from_sentinel = mock.Mock()
@@ -164,24 +196,20 @@ class DockerHaManagerTest(unittest.TestCase):
 
     @mock.patch("redis.StrictRedis")
     def test_remove_from_sentinel(self, redis_mock):
+        sentinel = redis_mock.return_value.pipeline.return_value.execute_command
         self.manager.remove_from_sentinel("master_name")
 
-        calls = []
         sentinels = [
             {"host": u"host1.com", "port": u"4243"},
             {"host": u"localhost", "port": u"4243"},
             {"host": u"host2.com", "port": u"4243"},
         ]
-        for sentinel in sentinels:
-            host, port = sentinel["host"], sentinel["port"]
-            sentinel_calls = [
-                mock.call(host=host, port=port),
-                mock.call().sentinel(
-                    'remove', 'master_name'),
-            ]
-            calls.extend(sentinel_calls)
-
-        redis_mock.assert_has_calls(calls)
+        redis_mock.assert_has_calls([
+            mock.call(host=s["host"], port=s["port"],
+                      socket_timeout=5.0, socket_connect_timeout=5.0)
+            for s in sentinels], any_order=True)
+        self.assertEqual([mock.call('SENTINEL', 'remove', 'master_name')] * 3,
+                         sentinel.call_args_list)
 
     def test_bind(self):
         instance = Instance(
@@ -232,6 +260,31 @@ class DockerHaManagerTest(unittest.TestCase):
         self.manager.revoke(instance, "10.0.0.1")
         self.assertEqual(["10.0.0.2"], access_mngr.permits[instance.name])
 
+    def test_grant_and_revoke_many(self):
+        instance = Instance(
+            name="name",
+            plan='basic',
+            endpoints=[
+                {"host": "localhost", "port": "4242", "container_id": "12"},
+                {"host": "host.com", "port": "422", "container_id": "12"},
+            ],
+        )
+        self.manager.grant_many(instance, ["10.0.0.1", "10.0.0.2", "10.0.0.3"])
+        self.manager.revoke_many(instance, ["10.0.0.1", "10.0.0.3"])
+        access_mngr = self.manager.access_manager
+        self.assertEqual(["10.0.0.2"], access_mngr.permits[instance.name])
+
+    @mock.patch("redisapi.managers.status_checker")
+    def test_is_ok(self, checker_mock):
+        checker_mock.check_instance.return_value = True, "10.0.0.1:49153 is master"
+        instance = Instance(
+            name="name",
+            plan='plus',
+            endpoints=[{"host": "10.0.0.1", "port": 49153, "container_id": "12"}],
+        )
+        self.assertEqual((True, "10.0.0.1:49153 is master"), self.manager.is_ok(instance))
+        checker_mock.check_instance.assert_called_with(instance)
+
     def test_port_range_start(self):
         self.assertEqual(49153, self.manager.port_range_start)
 
@@ -34,6 +34,11 @@ class ZabbixHCTest(unittest.TestCase):
 
     @mock.patch("pyzabbix.ZabbixAPI")
     def setUp(self, zabbix_mock):
+        hc.close_zabbix_sessions()
+        self.addCleanup(hc.close_zabbix_sessions)
+        patcher = mock.patch("redisapi.hc.registrations")
+        self.registrations = patcher.start()
+        self.addCleanup(patcher.stop)
         url = "http://zbx.com"
         user = "user"
         password = "pass"
@@ -59,27 +64,67 @@ class ZabbixHCTest(unittest.TestCase):
 
         self.hc.add(host="localhost", port=8080)
 
+        self.registrations.notify.assert_called_with(self.hc)
+        self.assertFalse(self.hc.zapi.item.create.called)
+        self.assertEqual(1, self.hc.flush())
+
         item_key = "net.tcp.service[tcp,localhost,8080]"
-        self.hc.zapi.item.create.assert_called_with(
-            name="redis healthcheck for localhost:8080",
-            key_=item_key,
-            delay=60,
-            hostid="1",
-            interfaceid="1",
-            type=3,
-            value_type=3,
-        )
-        self.hc.zapi.trigger.create.assert_called_with(
-            description="trigger hc for redis localhost:8080",
-            expression="{{Zabbix Server:{}.last()}}=0".format(item_key),
-            priority=5,
-        )
+        self.hc.zapi.item.create.assert_called_with({
+            "name": "redis healthcheck for localhost:8080",
+            "key_": item_key,
+            "delay": 60,
+            "hostid": "1",
+            "interfaceid": "1",
+            "type": 3,
+            "value_type": 3,
+        })
+        self.hc.zapi.trigger.create.assert_called_with({
+            "description": "trigger hc for redis localhost:8080",
+            "expression": "{{Zabbix Server:{}.last()}}=0".format(item_key),
+            "priority": 5,
+        })
 
         item = self.hc.items.find_one({"host": "localhost", "port": 8080})
         self.assertEqual(item["host"], "localhost")
         self.assertEqual(item["port"], 8080)
         self.assertEqual(item["item"], "xpto")
         self.assertEqual(item["trigger"], "apto")
+        self.assertEqual(item["status"], "registered")
+
+    def test_add_many(self):
+        self.hc.zapi.item.create.return_value = {"itemids": ["1", "2"]}
+        self.hc.zapi.trigger.create.return_value = {"triggerids": ["3", "4"]}
+
+        self.hc.add(host="localhost", port=8080)
+        self.hc.add(host="localhost", port=8081)
+        self.hc.flush()
+
+        self.assertEqual(1, self.hc.zapi.item.create.call_count)
+        self.assertEqual(2, len(self.hc.zapi.item.create.call_args[0]))
+        self.assertEqual(1, self.hc.zapi.trigger.create.call_count)
+        self.assertEqual("2", self.hc.items.find_one({"port": 8081})["item"])
+
+    def test_flush_batch_size(self):
+        os.environ["ZABBIX_BATCH_SIZE"] = "1"
+        self.addCleanup(self.remove_env, "ZABBIX_BATCH_SIZE")
+        self.hc.zapi.item.create.return_value = {"itemids": ["1"]}
+        self.hc.zapi.trigger.create.return_value = {"triggerids": ["3"]}
+
+        self.hc.add(host="localhost", port=8080)
+        self.hc.add(host="localhost", port=8081)
+
+        self.assertEqual(1, self.hc.flush())
+        self.assertEqual(1, self.hc.flush())
+        self.assertEqual(0, self.hc.flush())
+        self.assertEqual(2, self.hc.zapi.item.create.call_count)
+
+    def test_flush_failure(self):
+        self.hc.zapi.item.create.side_effect = Exception("zabbix is down")
+        self.hc.add(host="localhost", port=8080)
+        with self.assertRaises(Exception):
+            self.hc.flush()
+        item = self.hc.items.find_one({"host": "localhost", "port": 8080})
+        self.assertEqual("pending", item["status"])
 
     def test_remove(self):
         item = {
@@ -87,10 +132,13 @@ class ZabbixHCTest(unittest.TestCase):
             "port": 8080,
             "trigger": 43,
             "item": 42,
+            "status": "registered",
         }
         self.hc.items.insert(item)
 
         self.hc.remove(host="localhost", port=8080)
+        self.registrations.notify.assert_called_with(self.hc)
+        self.hc.flush()
 
         self.hc.zapi.trigger.delete.assert_called_with(43)
         self.hc.zapi.item.delete.assert_called_with(42)
@@ -99,9 +147,43 @@ class ZabbixHCTest(unittest.TestCase):
             "port": 8080}).count()
         self.assertEqual(lenght, 0)
 
+    def test_remove_before_registration(self):
+        self.hc.add(host="localhost", port=8080)
+        self.hc.remove(host="localhost", port=8080)
+        self.hc.flush()
+        self.assertFalse(self.hc.zapi.item.create.called)
+        self.assertFalse(self.hc.zapi.item.delete.called)
+        self.assertEqual(0, self.hc.items.find({"host": "localhost"}).count())
+
+    def test_relogin_when_session_expired(self):
+        from pyzabbix import ZabbixAPIException
+        method = mock.Mock(side_effect=[
+            ZabbixAPIException("Error -32602: Invalid params., Session terminated, "
+                               "re-login, please."),
+            "result",
+        ])
+        self.assertEqual("result", self.hc.call(method, "arg"))
+        self.hc.zapi.login.assert_called_with("user", "pass")
+        self.assertEqual(2, method.call_count)
+
+    def test_other_errors_are_raised(self):
+        from pyzabbix import ZabbixAPIException
+        method = mock.Mock(side_effect=ZabbixAPIException("Error -32500: No permissions"))
+        with self.assertRaises(ZabbixAPIException):
+            self.hc.call(method)
+
+    @mock.patch("pyzabbix.ZabbixAPI")
+    def test_session_is_shared(self, zabbix_mock):
+        from redisapi.hc import ZabbixHealthCheck
+        self.assertEqual(self.hc.zapi, ZabbixHealthCheck().zapi)
+        self.assertFalse(zabbix_mock.called)
+
     @mock.patch("pymongo.MongoClient")
     @mock.patch("pyzabbix.ZabbixAPI")
     def test_mongodb_uri_environ(self, zapi, mongo_mock):
+        from redisapi import close_mongodb_clients
+        close_mongodb_clients()
+        self.addCleanup(close_mongodb_clients)
         from redisapi.hc import ZabbixHealthCheck
         ZabbixHealthCheck()
         mongo_mock.assert_called_with("mongodb://localhost:27017/")
@@ -172,3 +254,16 @@ class HCTest(unittest.TestCase):
     def test_zabbix(self):
         self.assertEqual(hc.health_checkers['zabbix'], hc.ZabbixHealthCheck)
         self.assertEqual(hc.health_checkers['fake'], hc.FakeHealthCheck)
+
+
+class RegistrationsTest(unittest.TestCase):
+
+    @mock.patch("threading.Thread")
+    def test_notify_starts_one_thread(self, thread_mock):
+        registrations = hc.Registrations()
+        checker = mock.Mock()
+        registrations.notify(checker)
+        registrations.notify(checker)
+        thread_mock.assert_called_once_with(target=registrations.work)
+        self.assertTrue(registrations.wakeup.is_set())
+        self.assertEqual(checker, registrations.checker)
@@ -0,0 +1,103 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+
+import flask
+
+from redisapi import instrumentation
+from redisapi.docker_clients import operation
+from redisapi.instrumentation import Counter, Histogram, Registry
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_counter(self):
+        registry = Registry()
+        counter = registry.register(Counter("errors_total", "Errors.", ("backend",)))
+        counter.inc(("docker",))
+        counter.inc(("docker",), 2)
+        self.assertEqual("# HELP errors_total Errors.\n"
+                         "# TYPE errors_total counter\n"
+                         'errors_total{backend="docker"} 3\n', registry.render())
+
+    def test_histogram(self):
+        histogram = Histogram("duration_seconds", "Duration.", ("route",), buckets=(0.1, 1))
+        histogram.observe(("/plans",), 0.05)
+        histogram.observe(("/plans",), 0.5)
+        self.assertEqual([
+            "# HELP duration_seconds Duration.",
+            "# TYPE duration_seconds histogram",
+            'duration_seconds_bucket{route="/plans",le="0.1"} 1',
+            'duration_seconds_bucket{route="/plans",le="1"} 2',
+            'duration_seconds_bucket{route="/plans",le="+Inf"} 2',
+            'duration_seconds_count{route="/plans"} 2',
+            'duration_seconds_sum{route="/plans"} 0.55',
+        ], histogram.render())
+
+    def test_label_values_are_escaped(self):
+        self.assertEqual('{name="a\\"b"}', instrumentation.format_labels(("name",), ('a"b',)))
+
+
+class ObserveTest(unittest.TestCase):
+
+    def setUp(self):
+        instrumentation.registry.clear()
+        self.addCleanup(instrumentation.registry.clear)
+
+    def test_observe(self):
+        with instrumentation.observe("docker", "POST /containers/create"):
+            pass
+        value = instrumentation.backend_duration.values[("docker", "POST /containers/create")]
+        self.assertEqual(1, value["count"])
+        self.assertEqual(0, instrumentation.backend_in_flight.values[("docker",)])
+        self.assertEqual({}, instrumentation.backend_errors.values)
+
+    def test_observe_error(self):
+        @instrumentation.instrumented("zabbix")
+        def register():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            register()
+        self.assertEqual(1, instrumentation.backend_errors.values[("zabbix", "register")])
+        self.assertEqual(0, instrumentation.backend_in_flight.values[("zabbix",)])
+
+    def test_docker_operation(self):
+        self.assertEqual("POST /containers/<id>/start",
+                         operation("POST", "http://host:4243/v1.19/containers/123abc/start"))
+        self.assertEqual("POST /containers/create",
+                         operation("POST", "http://host:4243/v1.19/containers/create?name=x"))
+
+
+class InstrumentAppTest(unittest.TestCase):
+
+    def setUp(self):
+        instrumentation.registry.clear()
+        self.addCleanup(instrumentation.registry.clear)
+        app = flask.Flask(__name__)
+        instrumentation.instrument_app(app)
+
+        @app.route("/resources/<name>")
+        def resource(name):
+            return name, 200
+
+        @app.route("/fail")
+        def fail():
+            raise ValueError("boom")
+
+        self.app = app.test_client()
+
+    def test_request(self):
+        self.app.get("/resources/myredis")
+        value = instrumentation.http_duration.values[("GET", "/resources/<name>", 200)]
+        self.assertEqual(1, value["count"])
+        self.assertEqual(0, instrumentation.http_in_flight.values[()])
+
+    def test_request_error(self):
+        response = self.app.get("/fail")
+        self.assertEqual(500, response.status_code)
+        self.assertEqual(1, instrumentation.http_errors.values[("GET", "/fail")])
+        value = instrumentation.http_duration.values[("GET", "/fail", 500)]
+        self.assertEqual(1, value["count"])
@@ -0,0 +1,139 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+import mock
+import os
+import time
+
+from redisapi.jobs import JobQueue, JobFailed, JobInProgress, InstanceExists, Workers
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        self.queue = JobQueue()
+
+    def tearDown(self):
+        self.queue.db().jobs.remove()
+
+    def test_enqueue(self):
+        self.queue.enqueue("myinstance", "basic")
+        job = self.queue.find("myinstance")
+        self.assertEqual("basic", job["plan"])
+        self.assertEqual("pending", job["status"])
+        self.assertEqual("queued", job["step"])
+
+    def test_enqueue_job_in_progress(self):
+        self.queue.enqueue("myinstance", "basic")
+        with self.assertRaises(JobInProgress):
+            self.queue.enqueue("myinstance", "basic")
+
+    def test_enqueue_failed_job(self):
+        self.queue.enqueue("myinstance", "basic")
+        self.queue.fail("myinstance", "error")
+        self.queue.enqueue("myinstance", "plus")
+        job = self.queue.find("myinstance")
+        self.assertEqual("plus", job["plan"])
+        self.assertEqual("pending", job["status"])
+        self.assertIsNone(job["error"])
+
+    def test_enqueue_done_job(self):
+        self.queue.enqueue("myinstance", "basic")
+        self.queue.finish("myinstance")
+        with self.assertRaises(InstanceExists):
+            self.queue.enqueue("myinstance", "basic")
+        self.assertEqual("done", self.queue.find("myinstance")["status"])
+
+    def test_claim(self):
+        self.queue.enqueue("first", "basic")
+        self.queue.enqueue("second", "basic")
+        job = self.queue.claim()
+        self.assertEqual("first", job["name"])
+        self.assertEqual("running", job["status"])
+        self.assertEqual("second", self.queue.claim()["name"])
+        self.assertIsNone(self.queue.claim())
+
+    def test_claim_stale_job(self):
+        os.environ["PROVISIONING_JOB_TIMEOUT"] = "60"
+        self.addCleanup(self.remove_env, "PROVISIONING_JOB_TIMEOUT")
+        self.queue.enqueue("myinstance", "basic")
+        self.queue.claim()
+        self.assertIsNone(self.queue.claim())
+        self.queue.db().jobs.update({"_id": "myinstance"},
+                                    {"$set": {"updated": time.time() - 120}})
+        self.assertEqual("myinstance", self.queue.claim()["name"])
+
+    def test_progress_and_finish(self):
+        self.queue.enqueue("myinstance", "basic")
+        self.queue.progress("myinstance", "creating")
+        self.assertEqual("creating", self.queue.find("myinstance")["step"])
+        self.queue.finish("myinstance")
+        self.assertEqual("done", self.queue.find("myinstance")["status"])
+
+    def test_remove(self):
+        self.queue.enqueue("myinstance", "basic")
+        self.queue.remove("myinstance")
+        self.assertIsNone(self.queue.find("myinstance"))
+
+
+class WorkersTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        self.queue = mock.Mock()
+        self.handler = mock.Mock()
+        self.workers = Workers(self.queue, self.handler)
+
+    def test_run(self):
+        def handler(job, progress):
+            progress("creating")
+        self.workers.handler = handler
+        self.workers.run({"name": "myinstance", "plan": "basic"})
+        self.queue.progress.assert_called_with("myinstance", "creating")
+        self.queue.finish.assert_called_with("myinstance")
+
+    def test_run_failure(self):
+        self.handler.side_effect = Exception("boom")
+        error = self.workers.run({"name": "myinstance", "plan": "basic"})
+        self.assertEqual("boom", error)
+        self.queue.fail.assert_called_with("myinstance", "boom")
+        self.assertFalse(self.queue.finish.called)
+
+    def test_submit_without_workers(self):
+        os.environ["PROVISIONING_WORKERS"] = "0"
+        self.addCleanup(self.remove_env, "PROVISIONING_WORKERS")
+        job = {"name": "myinstance", "plan": "basic"}
+        self.queue.enqueue.return_value = job
+        self.workers.submit("myinstance", "basic")
+        self.queue.enqueue.assert_called_with("myinstance", "basic")
+        self.handler.assert_called_with(job, mock.ANY)
+        self.assertEqual([], self.workers.threads)
+
+    def test_submit_without_workers_failure(self):
+        os.environ["PROVISIONING_WORKERS"] = "0"
+        self.addCleanup(self.remove_env, "PROVISIONING_WORKERS")
+        self.queue.enqueue.return_value = {"name": "myinstance", "plan": "basic"}
+        self.handler.side_effect = Exception("no Docker host")
+        with self.assertRaises(JobFailed):
+            self.workers.submit("myinstance", "basic")
+        self.queue.fail.assert_called_with("myinstance", "no Docker host")
+
+    @mock.patch("threading.Thread")
+    def test_submit_with_workers(self, thread_mock):
+        os.environ["PROVISIONING_WORKERS"] = "2"
+        self.addCleanup(self.remove_env, "PROVISIONING_WORKERS")
+        self.workers.submit("myinstance", "basic")
+        self.workers.submit("otherinstance", "basic")
+        self.assertEqual(2, thread_mock.call_count)
+        self.assertEqual(2, len(self.workers.threads))
+        self.assertTrue(self.workers.wakeup.is_set())
+        self.assertFalse(self.handler.called)
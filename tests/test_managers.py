@@ -2,9 +2,14 @@
 # Use of this source code is governed by a BSD-style
 # license that can be found in the LICENSE file.
 
+import json
+import os
 import unittest
 
+import mock
+
 from redisapi import managers
+from redisapi.storage import Instance
 
 
 class ManagersTest(unittest.TestCase):
@@ -17,3 +22,139 @@ class ManagersTest(unittest.TestCase):
 
     def test_shared(self):
         self.assertEqual(managers.managers['shared'], managers.SharedManager)
+
+
+class BindPayloadsTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        self.payloads = managers.BindPayloads()
+        self.instance = Instance("name", "basic", [{"host": "host", "port": 49153}])
+        self.bind = mock.Mock(return_value={"REDIS_HOST": "host"})
+
+    def test_get(self):
+        payload = self.payloads.get(self.instance, self.bind)
+        self.assertEqual({"REDIS_HOST": "host"}, json.loads(payload))
+        self.assertEqual(payload, self.payloads.get(self.instance, self.bind))
+        self.bind.assert_called_once_with(self.instance)
+
+    def test_get_endpoints_changed(self):
+        self.payloads.get(self.instance, self.bind)
+        failed_over = Instance("name", "basic", [{"host": "other", "port": 49153}])
+        self.payloads.get(failed_over, self.bind)
+        self.assertEqual(2, self.bind.call_count)
+
+    def test_get_dense_database_changed(self):
+        self.payloads.get(Instance("name", "dense", [
+            {"host": "redis2", "port": "6379", "slot": 3, "db": 3}]), self.bind)
+        recreated = Instance("name", "dense", [
+            {"host": "redis2", "port": "6379", "slot": 5, "db": 5}])
+        self.bind.return_value = {"REDIS_DB": "5"}
+        self.assertEqual({"REDIS_DB": "5"}, json.loads(self.payloads.get(recreated, self.bind)))
+        self.assertEqual(2, self.bind.call_count)
+
+    def test_invalidate(self):
+        self.payloads.get(self.instance, self.bind)
+        self.payloads.invalidate("name")
+        self.payloads.get(self.instance, self.bind)
+        self.assertEqual(2, self.bind.call_count)
+
+    def test_size(self):
+        os.environ["INSTANCE_CACHE_SIZE"] = "1"
+        self.addCleanup(self.remove_env, "INSTANCE_CACHE_SIZE")
+        other = Instance("other", "basic", [{"host": "host", "port": 49154}])
+        self.payloads.get(self.instance, self.bind)
+        self.payloads.get(other, self.bind)
+        self.payloads.get(self.instance, self.bind)
+        self.assertEqual(3, self.bind.call_count)
+
+
+class PlanSettingsTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        os.environ["REDIS_IMAGE"] = "redisapi"
+        self.addCleanup(self.remove_env, "REDIS_IMAGE")
+        os.environ["DOCKER_HOSTS"] = '["http://host1.com:4243", "http://host2.com:4243", \
+            "http://host3.com:4243"]'
+        self.addCleanup(self.remove_env, "DOCKER_HOSTS")
+        os.environ["SENTINEL_HOSTS"] = "[]"
+        self.addCleanup(self.remove_env, "SENTINEL_HOSTS")
+        os.environ["REDIS_API_CUSTOM_PLANS"] = json.dumps([
+            {"name": "basic-4g", "description": "4GB", "manager": "basic",
+             "memory": 4294967296, "cpu_shares": 2048, "maxmemory_policy": "allkeys-lru",
+             "persistence": "none"},
+            {"name": "plus-3", "description": "3 instances", "manager": "plus",
+             "replicas": 2},
+        ])
+        self.addCleanup(self.remove_env, "REDIS_API_CUSTOM_PLANS")
+
+    def test_settings(self):
+        settings = {"name": "basic-8g", "description": "8GB", "manager": "basic",
+                    "memory": 8589934592}
+        self.assertEqual(settings, managers.DockerManager("basic-8g", settings).plan)
+
+    def test_default_plan(self):
+        self.assertEqual("basic", managers.DockerManager().plan["name"])
+        self.assertEqual("plus", managers.DockerHaManager().plan["name"])
+
+    def test_run_redis_container(self):
+        manager = managers.DockerManager("basic-4g")
+        client = mock.Mock()
+        client.create_container.return_value = {"Id": "12"}
+        manager.run_redis_container(client, 49153)
+        kwargs = client.create_container.call_args[1]
+        self.assertEqual({"REDIS_PORT": 49153, "REDIS_MAXMEMORY": 4294967296,
+                          "REDIS_MAXMEMORY_POLICY": "allkeys-lru",
+                          "REDIS_PERSISTENCE": "none"}, kwargs["environment"])
+        self.assertEqual(2048, kwargs["cpu_shares"])
+        self.assertEqual(6442450944, kwargs["host_config"]["Memory"])
+        client.start.assert_called_with("12")
+
+    def test_memory_overhead(self):
+        os.environ["CONTAINER_MEMORY_OVERHEAD"] = "0"
+        self.addCleanup(self.remove_env, "CONTAINER_MEMORY_OVERHEAD")
+        self.assertEqual(4294967296, managers.DockerManager("basic-4g").memory_limit())
+
+    @mock.patch("redisapi.managers.warm_pool")
+    @mock.patch("redisapi.managers.host_load")
+    def test_add_instance(self, host_load, warm_pool):
+        warm_pool.take.return_value = None
+        manager = managers.DockerManager("basic-4g")
+        manager.scheduler = mock.Mock()
+        manager.scheduler.return_value.rank.return_value = ["http://host1.com:4243",
+                                                            "http://host2.com:4243"]
+        manager.client = mock.Mock()
+        manager.client.return_value.base_url = "http://host1.com:4243"
+        manager.client.return_value.create_container.return_value = {"Id": "12"}
+        manager.get_port_by_host = mock.Mock(return_value=49153)
+        manager.config_sentinels = mock.Mock()
+        instance = manager.add_instance("name")
+        self.assertEqual("basic-4g", instance.plan)
+        self.assertEqual(("basic", 4294967296),
+                         (instance.settings["manager"], instance.settings["memory"]))
+        self.assertEqual(4294967296, instance.endpoints[0]["memory"])
+        manager.scheduler.return_value.rank.assert_called_with(4294967296)
+        warm_pool.take.assert_called_with(["http://host1.com:4243", "http://host2.com:4243"],
+                                          "basic-4g")
+        host_load.add.assert_called_with("host1.com", 4294967296)
+
+    def test_add_instance_with_replicas(self):
+        manager = managers.DockerHaManager("plus-3")
+        manager.scheduler = mock.Mock()
+        manager.scheduler.return_value.choose.return_value = ["h1", "h2", "h3"]
+        manager.start_master = mock.Mock(return_value={"host": "h1"})
+        manager.start_slave = mock.Mock(side_effect=lambda host: {"host": host})
+        manager.slave_of = mock.Mock()
+        instance = manager.add_instance("name")
+        manager.scheduler.return_value.choose.assert_called_with(3, 1073741824)
+        self.assertEqual(["h1", "h2", "h3"], [e["host"] for e in instance.endpoints])
+        self.assertEqual("plus-3", instance.plan)
+        manager.slave_of.assert_has_calls([mock.call({"host": "h1"}, {"host": "h2"}),
+                                           mock.call({"host": "h1"}, {"host": "h3"})])
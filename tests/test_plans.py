@@ -10,14 +10,31 @@ from redisapi import plans
 
 class PlansTest(unittest.TestCase):
 
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        self.addCleanup(self.remove_env, "REDIS_API_PLANS")
+        self.addCleanup(self.remove_env, "REDIS_API_CUSTOM_PLANS")
+
     def test_plans(self):
         expected = [
             {"name": "development", "description": "Is a shared instance."},
             {"name": "basic",
-             "description": "1 dedicated instance. With 1GB of memory."},
+             "description": "1 dedicated instance. With 1GB of memory.",
+             "memory": 1073741824},
             {"name": "plus",
              "description": ("2 dedicated instances. With 1GB of memory, "
-                             "HA and failover support via redis-sentinel.")},
+                             "HA and failover support via redis-sentinel."),
+             "memory": 1073741824, "replicas": 1},
+            {"name": "dense",
+             "description": ("A database or user of its own on a shared instance, "
+                             "for small workloads.")},
+            {"name": "cluster",
+             "description": ("Redis cluster, sharded across dedicated masters with "
+                             "replicas on other hosts. With 1GB of memory per node."),
+             "memory": 1073741824},
         ]
         self.assertListEqual(expected, plans.plans)
 
@@ -26,3 +43,37 @@ class PlansTest(unittest.TestCase):
         result = [p["name"] for p in plans.active()]
         expected = ["development", "plus"]
         self.assertListEqual(expected, result)
+
+    def test_active_plans_only_have_name_and_description(self):
+        os.environ["REDIS_API_PLANS"] = '["basic"]'
+        self.assertEqual([{"name": "basic",
+                           "description": "1 dedicated instance. With 1GB of memory."}],
+                         plans.active())
+
+    def test_get(self):
+        plan = plans.get("plus")
+        self.assertEqual(("plus", 1073741824, 1), (plan["manager"], plan["memory"],
+                                                   plan["replicas"]))
+        with self.assertRaises(plans.InvalidPlan):
+            plans.get("huge")
+
+    def test_custom_plans(self):
+        os.environ["REDIS_API_CUSTOM_PLANS"] = '''[
+            {"name": "basic-4g", "description": "4GB", "manager": "basic",
+             "memory": 4294967296, "cpu_shares": 2048, "persistence": "aof"},
+            {"name": "plus", "description": "3 instances", "replicas": 2}
+        ]'''
+        os.environ["REDIS_API_PLANS"] = '["plus", "basic-4g"]'
+        self.assertEqual([{"name": "plus", "description": "3 instances"},
+                          {"name": "basic-4g", "description": "4GB"}], plans.active())
+        self.assertEqual(("basic", 2048), (plans.get("basic-4g")["manager"],
+                                           plans.get("basic-4g")["cpu_shares"]))
+        self.assertEqual(2, plans.get("plus")["replicas"])
+
+    def test_invalid_custom_plans(self):
+        for plan in ['{"name": "x"}',
+                     '{"name": "x", "description": "x", "manager": "huge"}',
+                     '{"name": "x", "description": "x", "persistence": "always"}']:
+            os.environ["REDIS_API_CUSTOM_PLANS"] = "[{}]".format(plan)
+            with self.assertRaises(plans.InvalidPlan):
+                plans.available()
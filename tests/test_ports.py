@@ -0,0 +1,64 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+import os
+
+from redisapi.ports import PortAllocator, NoPortAvailable
+from redisapi.storage import Instance, MongoStorage
+
+
+class PortAllocatorTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        self.allocator = PortAllocator()
+        self.storage = MongoStorage()
+
+    def tearDown(self):
+        self.storage.db().ports.remove()
+        self.storage.db().instances.remove()
+
+    def test_reserve_new_host(self):
+        self.assertEqual(49153, self.allocator.reserve("newhost"))
+        self.assertEqual(49154, self.allocator.reserve("newhost"))
+        self.assertEqual(49153, self.allocator.reserve("otherhost"))
+
+    def test_reserve_host_with_legacy_instances(self):
+        instance = Instance(
+            name="name",
+            plan="basic",
+            endpoints=[{"host": "newhost", "port": 49160,
+                        "container_id": "12"}],
+        )
+        self.storage.add_instance(instance)
+        self.assertEqual(49161, self.allocator.reserve("newhost"))
+
+    def test_release_reuses_port(self):
+        self.allocator.reserve("newhost")
+        self.allocator.reserve("newhost")
+        self.allocator.release("newhost", 49153)
+        self.assertEqual(49153, self.allocator.reserve("newhost"))
+        self.assertEqual(49155, self.allocator.reserve("newhost"))
+
+    def test_release_unknown_host(self):
+        self.allocator.release("unknown", 49153)
+        self.assertIsNone(self.storage.db().ports.find_one({"_id": "unknown"}))
+
+    def test_port_ranges_environ(self):
+        os.environ["DOCKER_PORT_RANGES"] = '{"newhost": [50000, 50001]}'
+        self.addCleanup(self.remove_env, "DOCKER_PORT_RANGES")
+        allocator = PortAllocator()
+        self.assertEqual(50000, allocator.reserve("newhost"))
+        self.assertEqual(50001, allocator.reserve("newhost"))
+        with self.assertRaises(NoPortAvailable):
+            allocator.reserve("newhost")
+        self.assertEqual(49153, allocator.reserve("otherhost"))
+
+    def test_default_range(self):
+        allocator = PortAllocator(default_range=(6000, 6000))
+        self.assertEqual((6000, 6000), allocator.port_range("newhost"))
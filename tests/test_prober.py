@@ -0,0 +1,106 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+import unittest
+
+import mock
+import redis
+
+from redisapi.hc import NativeHealthCheck
+from redisapi.prober import Prober
+
+
+class ProberTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        os.environ["PROBER_INTERVAL"] = "10"
+        self.addCleanup(self.remove_env, "PROBER_INTERVAL")
+        os.environ["PROBER_FAILING_INTERVAL"] = "2"
+        self.addCleanup(self.remove_env, "PROBER_FAILING_INTERVAL")
+        self.prober = Prober()
+
+    @mock.patch("redis.StrictRedis")
+    def test_check(self, redis_mock):
+        self.assertIsNone(self.prober.check({"host": "host", "port": 49153}))
+        pool = redis_mock.call_args[1]["connection_pool"]
+        self.assertEqual(pool, self.prober.connection_pool("host", "49153"))
+        redis_mock.return_value.ping.assert_called_with()
+
+    @mock.patch("redis.StrictRedis")
+    def test_check_failure(self, redis_mock):
+        redis_mock.return_value.ping.side_effect = redis.ConnectionError("refused")
+        self.assertEqual("refused", self.prober.check({"host": "host", "port": 49153}))
+
+    def test_next_interval(self):
+        self.assertEqual(10, self.prober.next_interval({"status": "unknown"}, None))
+        self.assertEqual(2, self.prober.next_interval({"status": "ok", "interval": 10}, "error"))
+        self.assertEqual(4, self.prober.next_interval({"status": "failing", "interval": 2}, None))
+        self.assertEqual(8, self.prober.next_interval({"status": "ok", "interval": 4}, None))
+        self.assertEqual(10, self.prober.next_interval({"status": "ok", "interval": 8}, None))
+
+
+class ProberStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.prober = Prober()
+        self.hc = NativeHealthCheck()
+
+    def tearDown(self):
+        self.hc.checks.remove()
+
+    def test_new_endpoints_are_due(self):
+        self.hc.add("host", 49153)
+        due = self.prober.due(1)
+        self.assertEqual(1, len(due))
+        self.assertEqual("host:49153", due[0]["_id"])
+
+    def test_run_once(self):
+        self.prober.check = lambda endpoint: "refused" if endpoint["port"] == 49154 else None
+        self.hc.add("host", 49153)
+        self.hc.add("host", 49154)
+        self.assertEqual(2, self.prober.run_once())
+        statuses = sorted((check["port"], check["status"], check["failures"])
+                          for check in self.hc.checks.find())
+        self.assertEqual([(49153, "ok", 0), (49154, "failing", 1)], statuses)
+        self.assertEqual(0, self.prober.run_once())
+
+    def test_prune(self):
+        self.hc.add("host", 49153)
+        kept = self.prober.connection_pool("host", 49153)
+        removed = mock.Mock()
+        self.prober.pools[("host", 49154)] = removed
+        self.prober.prune()
+        self.assertEqual({("host", 49153): kept}, self.prober.pools)
+        removed.disconnect.assert_called_once_with()
+
+    def test_run_once_prunes_every_interval(self):
+        self.prober.prune = mock.Mock()
+        self.prober.run_once()
+        self.prober.run_once()
+        self.assertEqual(1, self.prober.prune.call_count)
+        self.prober.pruned -= self.prober.interval
+        self.prober.run_once()
+        self.assertEqual(2, self.prober.prune.call_count)
+
+    def test_record(self):
+        self.hc.add("host", 49153)
+        endpoint = self.hc.status("host", 49153)
+        self.prober.record(endpoint, "refused", 100)
+        self.prober.record(self.hc.status("host", 49153), "refused", 102)
+        check = self.hc.status("host", 49153)
+        self.assertEqual("failing", check["status"])
+        self.assertEqual(2, check["failures"])
+        self.assertEqual(100, check["since"])
+        self.assertEqual("refused", check["error"])
+        self.assertTrue(103.8 <= check["next"] <= 104.2)
+
+    def test_remove(self):
+        self.hc.add("host", 49153)
+        self.hc.remove("host", 49153)
+        self.assertIsNone(self.hc.status("host", 49153))
@@ -0,0 +1,154 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+import unittest
+
+import mock
+
+from redisapi import scheduler
+from redisapi.docker_clients import clients as docker_clients
+from redisapi.scheduler import CONTAINER_MEMORY, HostLoad, NoHostAvailable, Scheduler
+from redisapi.storage import Instance, MongoStorage
+
+
+class HostLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.storage = MongoStorage()
+        self.load = HostLoad()
+
+    def tearDown(self):
+        self.storage.db().instances.remove()
+        self.storage.db().warm_pool.remove()
+
+    def test_get_reads_instances(self):
+        self.storage.add_instance(Instance("a", "plus", [
+            {"host": "host1.com", "port": 49153, "container_id": "1"},
+            {"host": "host2.com", "port": 49153, "container_id": "2"},
+        ]))
+        self.storage.add_instance(Instance("b", "basic-4g", [
+            {"host": "host1.com", "port": 49154, "container_id": "3",
+             "memory": 4 * CONTAINER_MEMORY},
+        ]))
+        self.storage.add_instance(Instance("c", "development", [
+            {"host": "host1.com", "port": "6379"},
+        ]))
+        loads = self.load.get()
+        self.assertEqual({"containers": 2, "memory": 5 * CONTAINER_MEMORY}, loads["host1.com"])
+        self.assertEqual({"containers": 1, "memory": CONTAINER_MEMORY}, loads["host2.com"])
+
+    def test_get_reads_the_warm_pool(self):
+        self.storage.add_instance(Instance("a", "basic", [
+            {"host": "host1.com", "port": 49153, "container_id": "1"},
+        ]))
+        self.storage.db().warm_pool.insert({"_id": "2", "host": "host1.com", "port": 49154,
+                                            "memory": 2 * CONTAINER_MEMORY})
+        self.storage.db().warm_pool.insert({"_id": "3", "host": "host2.com", "port": 49153})
+        loads = self.load.get()
+        self.assertEqual({"containers": 2, "memory": 3 * CONTAINER_MEMORY}, loads["host1.com"])
+        self.assertEqual({"containers": 1, "memory": CONTAINER_MEMORY}, loads["host2.com"])
+
+    @mock.patch("redisapi.storage.MongoStorage.load_by_host")
+    def test_get_is_cached(self, count):
+        count.return_value = {"host1.com": {"containers": 1, "memory": CONTAINER_MEMORY}}
+        self.load.get()
+        self.load.add("host1.com")
+        self.load.add("host2.com")
+        self.load.remove("host2.com")
+        loads = self.load.get()
+        self.assertEqual(1, count.call_count)
+        self.assertEqual(2, loads["host1.com"]["containers"])
+        self.assertEqual(0, loads["host2.com"]["containers"])
+
+    @mock.patch("redisapi.storage.MongoStorage.load_by_host")
+    def test_get_refreshes_after_ttl(self, count):
+        os.environ["SCHEDULER_CACHE_TTL"] = "0"
+        self.addCleanup(os.environ.pop, "SCHEDULER_CACHE_TTL")
+        count.return_value = {}
+        self.load.get()
+        self.load.get()
+        self.assertEqual(2, count.call_count)
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        self.hosts = ["http://host1.com:4243", "http://host2.com:4243",
+                      "http://host3.com:4243"]
+        loads = {"host1.com": 3, "host2.com": 1, "host3.com": 2}
+        patcher = mock.patch.object(scheduler, "host_load")
+        self.host_load = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.host_load.get.return_value = dict(
+            (host, {"containers": n, "memory": n * CONTAINER_MEMORY})
+            for host, n in loads.items())
+        self.addCleanup(docker_clients.clear)
+
+    def use(self, strategy):
+        os.environ["DOCKER_SCHEDULER"] = strategy
+        self.addCleanup(self.remove_env, "DOCKER_SCHEDULER")
+
+    def test_random(self):
+        hosts = Scheduler(self.hosts).choose(2)
+        self.assertEqual(2, len(set(hosts)))
+        self.assertFalse(self.host_load.get.called)
+
+    def test_least_loaded(self):
+        self.use("least-loaded")
+        hosts = Scheduler(self.hosts).choose(2)
+        self.assertEqual(["http://host2.com:4243", "http://host3.com:4243"], hosts)
+
+    def test_bin_packing(self):
+        self.use("bin-packing")
+        os.environ["DOCKER_HOST_MEMORY"] = str(3 * CONTAINER_MEMORY)
+        self.addCleanup(self.remove_env, "DOCKER_HOST_MEMORY")
+        self.assertEqual(["http://host3.com:4243"], Scheduler(self.hosts).choose())
+
+    def test_host_memory(self):
+        os.environ["DOCKER_HOST_MEMORY"] = str(2 * CONTAINER_MEMORY)
+        self.addCleanup(self.remove_env, "DOCKER_HOST_MEMORY")
+        self.assertEqual(["http://host2.com:4243"], Scheduler(self.hosts).choose())
+        with self.assertRaises(NoHostAvailable):
+            Scheduler(self.hosts).choose(2)
+
+    def test_skips_hosts_down(self):
+        self.use("least-loaded")
+        docker_clients.mark_failed("http://host2.com:4243")
+        self.assertEqual(["http://host3.com:4243"], Scheduler(self.hosts).choose())
+
+    def test_rank(self):
+        self.use("least-loaded")
+        os.environ["DOCKER_HOST_MEMORY"] = str(3 * CONTAINER_MEMORY)
+        self.addCleanup(self.remove_env, "DOCKER_HOST_MEMORY")
+        self.assertEqual(["http://host2.com:4243", "http://host3.com:4243"],
+                         Scheduler(self.hosts).rank())
+        with self.assertRaises(NoHostAvailable):
+            Scheduler(self.hosts).rank(3 * CONTAINER_MEMORY)
+
+    def test_not_enough_hosts(self):
+        with self.assertRaises(NoHostAvailable):
+            Scheduler(self.hosts[:1]).choose(2)
+
+    def test_spread(self):
+        self.use("least-loaded")
+        placement = Scheduler(self.hosts).spread(3, 2)
+        self.assertEqual([["http://host2.com:4243", "http://host3.com:4243"],
+                          ["http://host1.com:4243", "http://host2.com:4243"],
+                          ["http://host3.com:4243", "http://host1.com:4243"]], placement)
+
+    def test_spread_host_memory(self):
+        os.environ["DOCKER_HOST_MEMORY"] = str(4 * CONTAINER_MEMORY)
+        self.addCleanup(self.remove_env, "DOCKER_HOST_MEMORY")
+        self.assertEqual(2, len(Scheduler(self.hosts).spread(1, 2)[0]))
+        with self.assertRaises(NoHostAvailable):
+            Scheduler(self.hosts).spread(3, 2)
+
+    def test_spread_not_enough_hosts(self):
+        with self.assertRaises(NoHostAvailable):
+            Scheduler(self.hosts[:1]).spread(3, 2)
@@ -0,0 +1,75 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+import unittest
+
+import mock
+import redis
+
+from redisapi.sentinels import Sentinels, SentinelQuorumError
+
+
+class SentinelsTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        self.hosts = ["http://host1.com:26379", "http://host2.com:26379",
+                      "http://host3.com:26379"]
+
+    def test_default_quorum_is_the_majority(self):
+        self.assertEqual(2, Sentinels(self.hosts).quorum)
+        self.assertEqual(0, Sentinels([]).quorum)
+
+    def test_quorum_environ(self):
+        os.environ["SENTINEL_QUORUM"] = "3"
+        self.addCleanup(self.remove_env, "SENTINEL_QUORUM")
+        self.assertEqual(3, Sentinels(self.hosts).quorum)
+
+    def test_timeout_environ(self):
+        os.environ["SENTINEL_TIMEOUT"] = "0.5"
+        self.addCleanup(self.remove_env, "SENTINEL_TIMEOUT")
+        self.assertEqual(0.5, Sentinels(self.hosts).timeout)
+
+    @mock.patch("redis.StrictRedis")
+    def test_execute(self, redis_mock):
+        execute = redis_mock.return_value.pipeline.return_value.execute
+        failures = Sentinels(self.hosts).execute([["remove", "name"]])
+        self.assertEqual({}, failures)
+        self.assertEqual(3, len(execute.call_args_list))
+
+    @mock.patch("redis.StrictRedis")
+    def test_execute_with_failures_within_quorum(self, redis_mock):
+        error = redis.ConnectionError("timeout")
+
+        def client(host, **kwargs):
+            if host == "host2.com":
+                raise error
+            return mock.Mock()
+        redis_mock.side_effect = client
+        failures = Sentinels(self.hosts).execute([["remove", "name"]])
+        self.assertEqual({"http://host2.com:26379": error}, failures)
+
+    @mock.patch("redis.StrictRedis")
+    def test_execute_without_quorum(self, redis_mock):
+        redis_mock.return_value.pipeline.return_value.execute.side_effect = \
+            redis.ConnectionError("timeout")
+        with self.assertRaises(SentinelQuorumError):
+            Sentinels(self.hosts).execute([["remove", "name"]])
+
+    @mock.patch("redis.connection.Connection.read_response")
+    @mock.patch("redis.connection.Connection.send_packed_command")
+    def test_send_writes_sentinel_commands(self, send, read_response):
+        read_response.return_value = "OK"
+        Sentinels(self.hosts[:1]).execute([
+            ["monitor", "name", "10.0.0.1", 49153, "1"],
+            ["set", "name", "down-after-milliseconds", "5000"],
+        ])
+        sent = "".join(send.call_args[0][0])
+        self.assertIn("$8\r\nSENTINEL\r\n$7\r\nmonitor\r\n$4\r\nname\r\n$8\r\n10.0.0.1\r\n", sent)
+        self.assertIn("$8\r\nSENTINEL\r\n$3\r\nset\r\n$4\r\nname\r\n", sent)
+        self.assertEqual(2, read_response.call_count)
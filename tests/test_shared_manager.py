@@ -7,24 +7,10 @@ import os
 import mock
 
 from redis import exceptions
+from redisapi.status import StatusChecker
 from redisapi.storage import Instance
 
 
-class FakeConnection(object):
-    connected = False
-
-    def connect(self):
-        self.connected = True
-
-
-class FailingFakeConnection(object):
-
-    def connect(self):
-        raise exceptions.ConnectionError(
-            "Error 61 connecting localhost:6379. Connection refused.",
-        )
-
-
 class SharedManagerTest(unittest.TestCase):
 
     def remove_env(self, env):
@@ -36,6 +22,9 @@ class SharedManagerTest(unittest.TestCase):
         self.addCleanup(self.remove_env, "REDIS_SERVER_HOST")
         from redisapi.managers import SharedManager
         self.manager = SharedManager()
+        patcher = mock.patch("redisapi.managers.status_checker", StatusChecker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_bind_returns_the_server_host_and_port(self):
         instance = Instance(
@@ -76,34 +65,41 @@ class SharedManagerTest(unittest.TestCase):
         }
         self.assertEqual(want, envs)
 
-    @mock.patch("redis.Connection")
-    def test_is_ok(self, Connection):
-        f = FakeConnection()
-        Connection.return_value = f
+    @mock.patch("redis.StrictRedis")
+    @mock.patch("redis.ConnectionPool")
+    def test_is_ok(self, ConnectionPool, StrictRedis):
         ok, msg = self.manager.is_ok()
         self.assertTrue(ok)
         self.assertEqual("", msg)
-        Connection.assert_called_with(host="localhost")
-        self.assertTrue(f.connected)
-
-    @mock.patch("redis.Connection")
-    def test_is_ok_unavailable_server(self, Connection):
-        f = FailingFakeConnection()
-        Connection.return_value = f
+        ConnectionPool.assert_called_with(host="localhost", port=6379, socket_timeout=2.0,
+                                          socket_connect_timeout=2.0, max_connections=4)
+        StrictRedis.assert_called_with(connection_pool=ConnectionPool.return_value)
+        StrictRedis.return_value.ping.assert_called_with()
+
+    @mock.patch("redis.StrictRedis")
+    @mock.patch("redis.ConnectionPool")
+    def test_is_ok_unavailable_server(self, ConnectionPool, StrictRedis):
+        want_msg = "Error 61 connecting localhost:6379. Connection refused."
+        StrictRedis.return_value.ping.side_effect = exceptions.ConnectionError(want_msg)
         ok, msg = self.manager.is_ok()
         self.assertFalse(ok)
-        want_msg = "Error 61 connecting localhost:6379. Connection refused."
         self.assertEqual(want_msg, msg)
 
-    @mock.patch("redis.Connection")
-    def test_is_ok_with_password(self, Connection):
+    @mock.patch("redis.StrictRedis")
+    @mock.patch("redis.ConnectionPool")
+    def test_is_ok_with_password(self, ConnectionPool, StrictRedis):
         os.environ["REDIS_SERVER_PASSWORD"] = "s3cr3t"
         self.addCleanup(self.remove_env, "REDIS_SERVER_PASSWORD")
-        f = FakeConnection()
-        Connection.return_value = f
         ok, msg = self.manager.is_ok()
         self.assertTrue(ok)
-        Connection.assert_called_with(host="localhost", password="s3cr3t")
+        self.assertEqual("s3cr3t", ConnectionPool.call_args[1]["password"])
+
+    @mock.patch("redis.StrictRedis")
+    @mock.patch("redis.ConnectionPool")
+    def test_is_ok_is_cached(self, ConnectionPool, StrictRedis):
+        self.manager.is_ok()
+        self.manager.is_ok()
+        self.assertEqual(1, StrictRedis.return_value.ping.call_count)
 
     def test_running_without_the_REDIS_SERVER_HOST_variable(self):
         del os.environ["REDIS_SERVER_HOST"]
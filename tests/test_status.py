@@ -0,0 +1,150 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+import unittest
+
+import mock
+import redis
+
+from redisapi.status import MetricsCollector, StatusChecker
+from redisapi.storage import Instance
+
+
+class StatusCheckerTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        self.checker = StatusChecker()
+        self.instance = Instance("myredis", "plus", [
+            {"host": "10.0.0.1", "port": 49153, "container_id": "1"},
+            {"host": "10.0.0.2", "port": 49153, "container_id": "2"},
+        ])
+        self.infos = {
+            "10.0.0.1": {"role": "master", "master_repl_offset": 1500},
+            "10.0.0.2": {"role": "slave", "master_link_status": "up",
+                         "slave_repl_offset": 1000},
+        }
+        self.checker.replication = mock.Mock(
+            side_effect=lambda endpoint: self.infos[endpoint["host"]])
+
+    def test_check_instance(self):
+        ok, msg = self.checker.check_instance(self.instance)
+        self.assertTrue(ok)
+        self.assertEqual("10.0.0.1:49153 is master; "
+                         "10.0.0.2:49153 is slave, link up, 500 bytes behind", msg)
+
+    def test_check_instance_slave_link_down(self):
+        self.infos["10.0.0.2"]["master_link_status"] = "down"
+        ok, msg = self.checker.check_instance(self.instance)
+        self.assertFalse(ok)
+        self.assertIn("10.0.0.2:49153 is slave, link down", msg)
+
+    def test_check_instance_endpoint_down(self):
+        self.infos["10.0.0.1"] = {"error": "Connection refused."}
+        ok, msg = self.checker.check_instance(self.instance)
+        self.assertFalse(ok)
+        self.assertIn("10.0.0.1:49153 is down: Connection refused.", msg)
+
+    def test_check_instance_without_master(self):
+        self.infos["10.0.0.1"] = {"role": "slave", "master_link_status": "up"}
+        self.infos["10.0.0.2"]["slave_repl_offset"] = 0
+        ok, msg = self.checker.check_instance(self.instance)
+        self.assertFalse(ok)
+        self.assertEqual("no master found", msg)
+
+    def test_check_instance_is_cached(self):
+        self.checker.check_instance(self.instance)
+        self.checker.check_instance(self.instance)
+        self.assertEqual(2, self.checker.replication.call_count)
+
+    @mock.patch("time.time")
+    def test_check_instance_cache_expires(self, time_mock):
+        os.environ["STATUS_CACHE_TTL"] = "5"
+        self.addCleanup(self.remove_env, "STATUS_CACHE_TTL")
+        time_mock.return_value = 100
+        self.checker.check_instance(self.instance)
+        time_mock.return_value = 106
+        self.checker.check_instance(self.instance)
+        self.assertEqual(4, self.checker.replication.call_count)
+
+    @mock.patch("redis.StrictRedis")
+    @mock.patch("redis.ConnectionPool")
+    def test_replication(self, ConnectionPool, StrictRedis):
+        StrictRedis.return_value.info.return_value = {"role": "master"}
+        checker = StatusChecker()
+        endpoint = {"host": "10.0.0.1", "port": 49153}
+        self.assertEqual({"role": "master"}, checker.replication(endpoint))
+        StrictRedis.return_value.info.assert_called_with("replication")
+        checker.replication(endpoint)
+        self.assertEqual(1, ConnectionPool.call_count)
+
+    @mock.patch("redis.StrictRedis")
+    @mock.patch("redis.ConnectionPool")
+    def test_replication_error(self, ConnectionPool, StrictRedis):
+        StrictRedis.return_value.info.side_effect = redis.ConnectionError("refused")
+        endpoint = {"host": "10.0.0.1", "port": 49153}
+        self.assertEqual({"error": "refused"}, StatusChecker().replication(endpoint))
+
+
+class MetricsCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.checker = mock.Mock()
+        self.client = self.checker.client.return_value
+        self.client.info.return_value = {
+            "role": "master",
+            "connected_clients": 3,
+            "used_memory": 536870912,
+            "maxmemory": 0,
+            "keyspace_hits": 90,
+            "keyspace_misses": 10,
+            "evicted_keys": 5,
+            "instantaneous_ops_per_sec": 12,
+            "total_commands_processed": 1000,
+            "db0": {"keys": 10, "expires": 0},
+            "db1": {"keys": 5, "expires": 1},
+        }
+        self.collector = MetricsCollector(self.checker)
+        self.instance = Instance("myredis", "basic", [
+            {"host": "10.0.0.1", "port": 49153, "container_id": "1"},
+        ])
+
+    def test_collect(self):
+        result = self.collector.collect(self.instance)
+        self.assertEqual("myredis", result["name"])
+        metrics = result["endpoints"][0]
+        self.assertEqual("master", metrics["role"])
+        self.assertEqual(3, metrics["connected_clients"])
+        self.assertEqual(0.5, metrics["memory_usage"])
+        self.assertEqual(1073741824, metrics["maxmemory"])
+        self.assertEqual(15, metrics["keys"])
+        self.assertEqual(0.9, metrics["hit_ratio"])
+        self.assertEqual(12, metrics["ops_per_sec"])
+        self.assertIsNone(metrics["commands_per_sec"])
+        self.checker.client.assert_called_with("10.0.0.1", 49153, None)
+
+    @mock.patch("time.time")
+    def test_collect_rates(self, time_mock):
+        time_mock.return_value = 100
+        self.collector.collect(self.instance)
+        info = dict(self.client.info.return_value,
+                    total_commands_processed=1500, evicted_keys=25)
+        self.client.info.return_value = info
+        time_mock.return_value = 105
+        self.collector.collect(self.instance)
+        self.assertEqual(1, self.client.info.call_count)
+        time_mock.return_value = 111
+        metrics = self.collector.collect(self.instance)["endpoints"][0]
+        self.assertEqual(2, self.client.info.call_count)
+        self.assertAlmostEqual(500 / 11.0, metrics["commands_per_sec"])
+        self.assertAlmostEqual(20 / 11.0, metrics["evictions_per_sec"])
+
+    def test_collect_endpoint_down(self):
+        self.client.info.side_effect = redis.ConnectionError("refused")
+        metrics = self.collector.collect(self.instance)["endpoints"][0]
+        self.assertEqual("refused", metrics["error"])
@@ -0,0 +1,40 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+
+from redisapi.tenants import NoSlotAvailable, TenantSlots
+
+
+class TenantSlotsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.slots = TenantSlots(["redis1:6379", "redis2:6379"], 1, 2)
+
+    def tearDown(self):
+        self.slots.db().tenant_slots.remove()
+
+    def test_reserve_spreads_the_tenants(self):
+        reserved = [self.slots.reserve() for _ in range(4)]
+        self.assertEqual([("redis1:6379", 1), ("redis2:6379", 1),
+                          ("redis1:6379", 2), ("redis2:6379", 2)], reserved)
+
+    def test_reserve_when_full(self):
+        for _ in range(4):
+            self.slots.reserve()
+        with self.assertRaises(NoSlotAvailable):
+            self.slots.reserve()
+
+    def test_release(self):
+        self.slots.reserve()
+        self.slots.release("redis1:6379", 1)
+        self.slots.release("redis1:6379", 1)
+        item = self.slots.db().tenant_slots.find_one({"_id": "redis1:6379"})
+        self.assertEqual(([1], 0), (item["free"], item["used"]))
+
+    def test_reserve_released_slot(self):
+        for _ in range(4):
+            self.slots.reserve()
+        self.slots.release("redis2:6379", 1)
+        self.assertEqual(("redis2:6379", 1), self.slots.reserve())
@@ -0,0 +1,110 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import json
+import os
+import tempfile
+import unittest
+
+import mock
+
+from redisapi import tracing
+from redisapi.instrumentation import observe
+from redisapi.utils import parallel
+
+
+class SpanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spans = []
+        patcher = mock.patch("redisapi.tracing.exporter")
+        exporter = patcher.start()
+        exporter.return_value.export.side_effect = self.spans.append
+        self.addCleanup(patcher.stop)
+
+    def test_children_share_the_trace(self):
+        with tracing.span("provision", instance="myinstance") as root:
+            with tracing.span("manager.start_master"):
+                pass
+        child, parent = self.spans
+        self.assertIs(root, parent)
+        self.assertEqual(parent.trace_id, child.trace_id)
+        self.assertEqual(parent.span_id, child.parent_id)
+        self.assertIsNone(parent.parent_id)
+        self.assertEqual({"instance": "myinstance"}, parent.attributes)
+        self.assertIsNone(tracing.current())
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            with tracing.span("manager.slave_of"):
+                raise ValueError("connection refused")
+        self.assertEqual("connection refused", self.spans[0].error)
+        self.assertGreaterEqual(self.spans[0].end, self.spans[0].start)
+        self.assertIsNone(tracing.current())
+
+    def test_traced(self):
+        @tracing.traced()
+        def start_slave():
+            return tracing.current().name
+        self.assertEqual("start_slave", start_slave())
+        self.assertEqual(["start_slave"], [span.name for span in self.spans])
+
+    def test_parallel_propagates_the_span(self):
+        with tracing.span("manager.add_instance") as root:
+            parents = parallel(lambda: tracing.current(), lambda: tracing.current())
+        self.assertEqual([root, root], parents)
+
+    def test_observe_is_traced(self):
+        with tracing.span("provision"):
+            with observe("sentinel", "monitor"):
+                pass
+        child, parent = self.spans
+        self.assertEqual("sentinel.monitor", child.name)
+        self.assertEqual({"backend": "sentinel"}, child.attributes)
+        self.assertEqual(parent.span_id, child.parent_id)
+
+
+class ExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(tracing._exporter.clear)
+
+    def test_disabled_by_default(self):
+        with mock.patch.dict(os.environ, {"TRACING_EXPORTER": ""}):
+            self.assertIsNone(tracing.exporter())
+
+    def test_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        env = {"TRACING_EXPORTER": "file", "TRACING_FILE": path}
+        with mock.patch.dict(os.environ, env):
+            with tracing.span("manager.config_sentinels", master="myinstance"):
+                pass
+        with open(path) as f:
+            span = json.loads(f.read())
+        self.assertEqual("manager.config_sentinels", span["name"])
+        self.assertEqual({"master": "myinstance"}, span["attributes"])
+        self.assertIsNone(span["parent_id"])
+
+    @mock.patch("urllib2.urlopen")
+    def test_otlp(self, urlopen):
+        env = {"TRACING_EXPORTER": "otlp", "TRACING_FLUSH_INTERVAL": "3600",
+               "TRACING_OTLP_ENDPOINT": "http://collector:4318/v1/traces"}
+        with mock.patch.dict(os.environ, env):
+            with tracing.span("provision", instance="myinstance"):
+                with self.assertRaises(ValueError):
+                    with tracing.span("manager.slave_of"):
+                        raise ValueError("timeout")
+            tracing.exporter().flush()
+        request = urlopen.call_args[0][0]
+        self.assertEqual("http://collector:4318/v1/traces", request.get_full_url())
+        spans = json.loads(request.get_data())["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        child, parent = spans
+        self.assertEqual("manager.slave_of", child["name"])
+        self.assertEqual(parent["spanId"], child["parentSpanId"])
+        self.assertEqual({"code": 2, "message": "timeout"}, child["status"])
+        self.assertEqual([{"key": "instance", "value": {"stringValue": "myinstance"}}],
+                         parent["attributes"])
+        self.assertNotIn("parentSpanId", parent)
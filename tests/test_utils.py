@@ -0,0 +1,55 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import os
+import threading
+import unittest
+
+from redisapi.utils import get_json_value, parallel
+
+
+class GetJsonValueTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def test_parsed_once(self):
+        os.environ["REDISAPI_TEST_JSON"] = '["a", "b"]'
+        self.addCleanup(self.remove_env, "REDISAPI_TEST_JSON")
+        value = get_json_value("REDISAPI_TEST_JSON")
+        self.assertEqual(["a", "b"], value)
+        self.assertIs(value, get_json_value("REDISAPI_TEST_JSON"))
+
+    def test_environ_changed(self):
+        os.environ["REDISAPI_TEST_JSON"] = '["a"]'
+        self.addCleanup(self.remove_env, "REDISAPI_TEST_JSON")
+        get_json_value("REDISAPI_TEST_JSON")
+        os.environ["REDISAPI_TEST_JSON"] = '["b"]'
+        self.assertEqual(["b"], get_json_value("REDISAPI_TEST_JSON"))
+
+    def test_undefined(self):
+        with self.assertRaises(Exception):
+            get_json_value("REDISAPI_TEST_UNDEFINED")
+
+
+class ParallelTest(unittest.TestCase):
+
+    def test_results_in_order(self):
+        self.assertEqual([1, 2, 3], parallel(lambda: 1, lambda: 2, lambda: 3))
+
+    def test_calls_run_concurrently(self):
+        event = threading.Event()
+        results = parallel(lambda: event.wait(5), event.set)
+        self.assertTrue(results[0])
+
+    def test_raises_error_after_all_calls(self):
+        done = []
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            parallel(fail, lambda: done.append(True))
+        self.assertEqual([True], done)
@@ -0,0 +1,152 @@
+# Copyright 2015 redisapi authors. All rights reserved.
+# Use of this source code is governed by a BSD-style
+# license that can be found in the LICENSE file.
+
+import unittest
+import mock
+import os
+import time
+
+from redisapi.warmpool import WarmPool
+
+
+class WarmPoolTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        os.environ["DOCKER_HOSTS"] = '["http://host1.com:4243", "http://host2.com:4243"]'
+        self.addCleanup(self.remove_env, "DOCKER_HOSTS")
+        os.environ["WARM_POOL_SIZE"] = "2"
+        self.addCleanup(self.remove_env, "WARM_POOL_SIZE")
+        self.pool = WarmPool()
+        self.pool.notify = mock.Mock()
+        self.manager = mock.Mock()
+        self.manager.client.side_effect = lambda url: mock.Mock(base_url=url)
+        self.manager.extract_hostname.side_effect = lambda url: url[7:-5]
+        self.ports = iter(range(49153, 49200))
+        self.manager.get_port_by_host.side_effect = lambda host: next(self.ports)
+        self.ids = iter("abcdefgh")
+        self.manager.run_redis_container.side_effect = lambda client, port: next(self.ids)
+        self.manager.memory.return_value = 1073741824
+        self.manager.scheduler.return_value.candidates.return_value = (
+            ["http://host1.com:4243", "http://host2.com:4243"], {})
+        self.pool.manager = lambda: self.manager
+        patcher = mock.patch("redisapi.warmpool.host_load")
+        self.host_load = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.pool.db().warm_pool.remove()
+        self.pool.db().warm_pool_leases.remove()
+
+    def test_disabled(self):
+        os.environ["WARM_POOL_SIZE"] = "0"
+        self.assertIsNone(self.pool.take(["http://host1.com:4243"], "basic"))
+        self.assertFalse(self.pool.notify.called)
+
+    def test_fill(self):
+        self.assertEqual(2, self.pool.fill("http://host1.com:4243"))
+        self.assertEqual(0, self.pool.fill("http://host1.com:4243"))
+        items = list(self.pool.db().warm_pool.find().sort("created", 1))
+        self.assertEqual([("a", "host1.com", 49153), ("b", "host1.com", 49154)],
+                         [(item["_id"], item["host"], item["port"]) for item in items])
+        self.assertEqual(0, self.pool.db().warm_pool_leases.count())
+        self.assertEqual([1073741824, 1073741824], [item["memory"] for item in items])
+        self.host_load.add.assert_called_with("host1.com", 1073741824)
+        self.assertEqual(2, self.host_load.add.call_count)
+
+    def test_fill_stops_when_the_host_is_full(self):
+        candidates = self.manager.scheduler.return_value.candidates
+        candidates.side_effect = [(["http://host1.com:4243"], {}), ([], {})]
+        self.assertEqual(1, self.pool.fill("http://host1.com:4243"))
+        self.assertEqual(["a"], [item["_id"] for item in self.pool.db().warm_pool.find()])
+        candidates.assert_called_with(1073741824)
+
+    def test_fill_shrinks_the_pool(self):
+        self.pool.fill("http://host1.com:4243")
+        os.environ["WARM_POOL_SIZE"] = "1"
+        self.assertEqual(-1, self.pool.fill("http://host1.com:4243"))
+        self.assertEqual(["a"], [item["_id"] for item in self.pool.db().warm_pool.find()])
+        self.manager.release_port.assert_called_once_with("host1.com", 49154)
+        self.host_load.remove.assert_called_once_with("host1.com", 1073741824)
+
+    def test_fill_releases_the_port_of_a_failed_container(self):
+        self.manager.run_redis_container.side_effect = Exception("no such image")
+        with self.assertRaises(Exception):
+            self.pool.fill("http://host1.com:4243")
+        self.manager.release_port.assert_called_once_with("host1.com", 49153)
+        self.assertEqual(0, self.pool.db().warm_pool_leases.count())
+
+    def test_fill_leased_host(self):
+        self.pool.db().warm_pool_leases.insert(
+            {"_id": "http://host1.com:4243", "expires": time.time() + 60, "owner": "other"})
+        self.assertEqual(0, self.pool.fill("http://host1.com:4243"))
+        self.assertFalse(self.manager.run_redis_container.called)
+
+    def test_fill_expired_lease(self):
+        self.pool.db().warm_pool_leases.insert(
+            {"_id": "http://host1.com:4243", "expires": time.time() - 1, "owner": "other"})
+        self.assertEqual(2, self.pool.fill("http://host1.com:4243"))
+
+    def test_take(self):
+        self.pool.fill("http://host1.com:4243")
+        self.pool.fill("http://host2.com:4243")
+        endpoint = self.pool.take(["http://host2.com:4243", "http://host1.com:4243"], "basic")
+        self.assertEqual({"host": "host2.com", "port": 49155, "container_id": "c"}, endpoint)
+        self.assertTrue(self.pool.notify.called)
+        self.assertEqual(3, self.pool.db().warm_pool.count())
+
+    def test_take_from_another_host(self):
+        self.pool.fill("http://host1.com:4243")
+        endpoint = self.pool.take(["http://host2.com:4243", "http://host1.com:4243"], "basic")
+        self.assertEqual("host1.com", endpoint["host"])
+
+    def test_take_only_from_the_given_hosts(self):
+        self.pool.fill("http://host1.com:4243")
+        self.assertIsNone(self.pool.take(["http://host2.com:4243"], "basic"))
+        self.assertEqual(2, self.pool.db().warm_pool.count())
+
+    def test_take_for_another_plan(self):
+        self.pool.fill("http://host1.com:4243")
+        self.assertIsNone(self.pool.take(["http://host1.com:4243"], "basic-4g"))
+        self.assertEqual(2, self.pool.db().warm_pool.count())
+
+    def test_take_from_empty_pool(self):
+        self.assertIsNone(self.pool.take(["http://host1.com:4243"], "basic"))
+        self.assertTrue(self.pool.notify.called)
+
+
+class DockerManagerWarmPoolTest(unittest.TestCase):
+
+    def remove_env(self, env):
+        if env in os.environ:
+            del os.environ[env]
+
+    def setUp(self):
+        os.environ["SENTINEL_HOSTS"] = '["http://host1.com:4243"]'
+        self.addCleanup(self.remove_env, "SENTINEL_HOSTS")
+        os.environ["REDIS_IMAGE"] = "redisapi"
+        self.addCleanup(self.remove_env, "REDIS_IMAGE")
+        os.environ["DOCKER_HOSTS"] = '["http://host1.com:4243"]'
+        self.addCleanup(self.remove_env, "DOCKER_HOSTS")
+        from redisapi.managers import DockerManager
+        self.manager = DockerManager()
+        self.manager.client = mock.Mock()
+        self.manager.health_checker = mock.Mock()
+        self.manager.config_sentinels = mock.Mock()
+
+    @mock.patch("redisapi.managers.host_load")
+    @mock.patch("redisapi.managers.warm_pool")
+    def test_add_instance_from_the_pool(self, warm_pool, host_load):
+        endpoint = {"host": "host1.com", "port": 49160, "container_id": "12"}
+        warm_pool.take.return_value = endpoint
+        instance = self.manager.add_instance("name")
+        warm_pool.take.assert_called_once_with(["http://host1.com:4243"], "basic")
+        self.assertFalse(host_load.add.called)
+        self.assertEqual([endpoint], instance.endpoints)
+        self.assertFalse(self.manager.client.called)
+        self.manager.health_checker.return_value.add.assert_called_with("host1.com", 49160)
+        self.manager.config_sentinels.assert_called_with("name", endpoint)